@@ -0,0 +1,206 @@
+"""
+Multi-get by primary key: BatchGetItem (batch_get_items) vs. the filtered
+scan it replaces (get_items_by_scan).
+
+A scan reads every item in the table whatever the filter, so its read
+capacity and latency grow with the table; BatchGetItem reads only the keys
+asked for, 100 per request, with the requests in flight concurrently.
+
+By default DynamoDB is simulated in-process, so the benchmark runs anywhere.
+The simulation charges what DynamoDB documents for eventually consistent
+reads:
+  - Scan: 1 MB pages, 0.5 RCU per 4 KB read, one round trip per page.
+  - BatchGetItem: 0.5 RCU per 4 KB per item (rounded up per item), one
+    round trip per request; --unprocessed-rate of the keys in a request
+    come back as UnprocessedKeys to exercise the retry path.
+  - Each round trip takes --latency-ms plus --ms-per-mb of response.
+
+With --table and --key it runs against a real table instead: --items items
+are written, measured and deleted again, and capacity comes from
+ReturnConsumedCapacity. That costs real capacity.
+
+Usage:
+    python benchmarks/batch_get.py [--items 5000] [--item-bytes 1000] [--keys 10,100,500]
+                                   [--repeats 5] [--latency-ms 5] [--ms-per-mb 8]
+                                   [--unprocessed-rate 0.05] [--table NAME --key NAME]
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from AWS import DynamoDB
+from lib import Metrics
+
+PAGE_BYTES = 1024 * 1024
+READ_UNIT_BYTES = 4096
+
+
+class SimulatedTable:
+    def __init__(self, service: "SimulatedDynamoDB", name: str):
+        self.service = service
+        self.name = name
+
+    def scan(self, FilterExpression, ReturnConsumedCapacity=None, ExclusiveStartKey=None):
+        # Attr(primary_key).is_in(keys)
+        attribute, keys = FilterExpression.get_expression()["values"]
+        wanted = set(keys)
+        items = self.service.items[self.name]
+        start = ExclusiveStartKey["position"] if ExclusiveStartKey else 0
+        page_bytes, position, matched = 0, start, []
+        while position < len(items) and page_bytes < PAGE_BYTES:
+            item = items[position]
+            page_bytes += self.service.sizes[self.name][position]
+            if item[attribute.name] in wanted:
+                matched.append(item)
+            position += 1
+        self.service.round_trip(page_bytes)
+        response = {
+            "Items": matched,
+            "ConsumedCapacity": {"TableName": self.name, "CapacityUnits": 0.5 * math.ceil(page_bytes / READ_UNIT_BYTES)},
+        }
+        if position < len(items):
+            response["LastEvaluatedKey"] = {"position": position}
+        return response
+
+
+class SimulatedDynamoDB:
+    """Stands in for the boto3 resource that AWS/DynamoDB.py uses."""
+
+    def __init__(self, latency_seconds: float, seconds_per_mb: float, unprocessed_rate: float):
+        self.latency_seconds = latency_seconds
+        self.seconds_per_mb = seconds_per_mb
+        self.unprocessed_rate = unprocessed_rate
+        self.items = {}
+        self.sizes = {}
+        self.indexes = {}
+        self.lock = threading.Lock()
+        self.random = random.Random(7)
+
+    def seed(self, table_name: str, primary_key: str, items: list):
+        self.items[table_name] = items
+        self.sizes[table_name] = [len(json.dumps(item)) for item in items]
+        self.indexes[table_name] = {item[primary_key]: position for position, item in enumerate(items)}
+
+    def round_trip(self, response_bytes: int):
+        time.sleep(self.latency_seconds + self.seconds_per_mb * response_bytes / PAGE_BYTES)
+
+    def Table(self, name: str) -> SimulatedTable:
+        return SimulatedTable(self, name)
+
+    def batch_get_item(self, RequestItems, ReturnConsumedCapacity=None):
+        responses, unprocessed, consumed = {}, {}, []
+        total_bytes = 0
+        for table_name, request in RequestItems.items():
+            found, left, units = [], [], 0.0
+            for key in request["Keys"]:
+                with self.lock:
+                    throttled = self.random.random() < self.unprocessed_rate
+                if throttled:
+                    left.append(key)
+                    continue
+                value = next(iter(key.values()))
+                position = self.indexes[table_name].get(value)
+                if position is None:
+                    continue
+                size = self.sizes[table_name][position]
+                total_bytes += size
+                units += 0.5 * math.ceil(size / READ_UNIT_BYTES)
+                found.append(self.items[table_name][position])
+            responses[table_name] = found
+            consumed.append({"TableName": table_name, "CapacityUnits": units})
+            if left:
+                unprocessed[table_name] = {"Keys": left}
+        self.round_trip(total_bytes)
+        return {"Responses": responses, "UnprocessedKeys": unprocessed, "ConsumedCapacity": consumed}
+
+
+def percentiles(values) -> dict:
+    values = sorted(values)
+
+    def at(fraction):
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+
+    return {"mean": statistics.fmean(values), "p50": at(0.50), "p90": at(0.90), "max": values[-1]}
+
+
+def consumed_units(table_name: str, operation: str) -> float:
+    return Metrics.DYNAMODB_CONSUMED_CAPACITY.series.get((table_name, operation), 0.0)
+
+
+def measure(function, table_name: str, primary_key: str, keys: list, operation: str, repeats: int) -> dict:
+    seconds, units, found = [], [], 0
+    for _ in range(repeats):
+        units_before = consumed_units(table_name, operation)
+        started = time.perf_counter()
+        found = len(function(table_name, primary_key, keys))
+        seconds.append(time.perf_counter() - started)
+        units.append(consumed_units(table_name, operation) - units_before)
+    return {"found": found, "seconds": percentiles(seconds), "read_units": statistics.fmean(units)}
+
+
+def make_items(count: int, primary_key: str, item_bytes: int) -> list:
+    return [{primary_key: f"batch-get-{uuid.uuid4()}", "payload": "x" * item_bytes} for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000, help="Items in the table")
+    parser.add_argument("--item-bytes", type=int, default=1000)
+    parser.add_argument("--keys", default="10,100,500", help="Comma-separated numbers of keys to get")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated round trip")
+    parser.add_argument("--ms-per-mb", type=float, default=8.0, help="Simulated transfer time per MB of response")
+    parser.add_argument("--unprocessed-rate", type=float, default=0.05, help="Simulated fraction of keys returned unprocessed")
+    parser.add_argument("--table", help="Run against this real DynamoDB table instead of the simulation")
+    parser.add_argument("--key", help="Primary key name of --table")
+    args = parser.parse_args()
+
+    table_name = args.table or "batch-get-benchmark"
+    primary_key = args.key or "id"
+    items = make_items(args.items, primary_key, args.item_bytes)
+
+    if args.table:
+        if not args.key:
+            parser.error("--table needs --key")
+        DynamoDB.put_items(table_name, items)
+    else:
+        service = SimulatedDynamoDB(args.latency_ms / 1000, args.ms_per_mb / 1000, args.unprocessed_rate)
+        service.seed(table_name, primary_key, items)
+        DynamoDB._get_resource = lambda: service
+
+    results = []
+    try:
+        for count in (int(value) for value in args.keys.split(",")):
+            keys = [item[primary_key] for item in random.sample(items, min(count, len(items)))]
+            results.append({
+                "keys": len(keys),
+                "scan": measure(DynamoDB.get_items_by_scan, table_name, primary_key, keys, "scan", args.repeats),
+                "batch_get": measure(DynamoDB.batch_get_items, table_name, primary_key, keys, "batch_get_item", args.repeats),
+            })
+    finally:
+        if args.table:
+            DynamoDB.delete_items(table_name, [{primary_key: item[primary_key]} for item in items])
+
+    print(json.dumps({
+        "benchmark": "batch_get",
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "simulated": not args.table,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Round-trip latency / CPU of awaited JSONRPCPeer calls.
+
+Compares the Future-based correlation in lib/JSONRPCPeer.py against the old
+till_true polling loop, with N calls pending at once against a loopback
+"client" that answers every request after a fixed delay.
+
+Usage:
+    python benchmarks/jsonrpc_roundtrip.py [--concurrency 1000] [--reply-delay-ms 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from lib.JSONRPCPeer import JSONRPCPeer, JSONRPCResponse  # noqa: E402
+from lib.till_true import till_true  # noqa: E402
+
+
+class PollingPeer(JSONRPCPeer):
+    """The pre-Future implementation: a None slot plus a 100 ms polling loop."""
+
+    async def call(self, method, params, await_response=False, timeout=5):
+        msg_id = str(uuid.uuid4())
+        self.response_queue[msg_id] = None
+        await self.sender(json.dumps({"method": method, "params": params, "id": msg_id}))
+        if not await till_true(lambda: self.response_queue[msg_id] is not None, timeout=timeout):
+            raise TimeoutError(f"Timeout waiting for response to {method}")
+        return self.response_queue.pop(msg_id).result
+
+    async def handle_message(self, message: str):
+        parsed = json.loads(message)
+        self.response_queue[parsed["id"]] = JSONRPCResponse(id=parsed["id"], result=parsed.get("result", {}))
+
+
+async def run(peer_cls, concurrency: int, reply_delay: float) -> dict:
+    loop = asyncio.get_running_loop()
+    peer = None
+
+    async def sender(message: str):
+        msg_id = json.loads(message)["id"]
+        reply = json.dumps({"id": msg_id, "result": {"ok": True}})
+        loop.call_later(reply_delay, lambda: loop.create_task(peer.handle_message(reply)))
+
+    peer = peer_cls(sender=sender)
+
+    async def one_call():
+        start = time.perf_counter()
+        await peer.call("ping", {}, await_response=True, timeout=30)
+        return time.perf_counter() - start
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    latencies = await asyncio.gather(*[one_call() for _ in range(concurrency)])
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    latencies = sorted(latencies)
+    return {
+        "impl": peer_cls.__name__,
+        "concurrency": concurrency,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+        "wall_ms": round(wall * 1000, 3),
+        "cpu_ms": round(cpu * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=1000)
+    parser.add_argument("--reply-delay-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    for peer_cls in (PollingPeer, JSONRPCPeer):
+        result = asyncio.run(run(peer_cls, args.concurrency, args.reply_delay_ms / 1000))
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
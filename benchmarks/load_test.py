@@ -0,0 +1,443 @@
+"""
+End-to-end WebSocket load test: N clients against a real app.py server.
+
+The server runs in a child process with two stand-ins installed before the
+app is imported:
+  - FakeStreamingChatModel replaces create_llm. It streams deterministic tokens
+    at --tokens-per-second after --first-token-delay. Every --tool-every-th turn
+    it first calls a server-side tool that returns --tool-output-bytes.
+  - STORAGE_BACKEND=memory puts the tables in process (lib/MemoryStorage.py),
+    seeded with one public agent, an API key and a context per client.
+    --storage-latency-ms adds a DynamoDB-like round trip to every call.
+
+Each client runs connect_to_context and then --turns add_message calls.
+Client-side timing gives TTFT (add_message sent -> first token), the gaps
+between tokens and the turn duration. The server process is sampled from
+/proc for CPU time and RSS, so this needs Linux.
+
+Results are printed (or written to --output) as JSON, so runs can be compared
+across releases.
+
+Usage:
+    python benchmarks/load_test.py [--clients 50] [--turns 3] [--tokens 200] [--tokens-per-second 50]
+                                   [--tool-every 0] [--tool-output-bytes 2000] [--token-batching]
+                                   [--ramp-seconds 5] [--storage-latency-ms 0] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+# Everything the Models read at import; real values are never needed since no AWS call is made
+TABLES = {
+    "AGENTS": "agent_id",
+    "API_KEYS": "api_key_id",
+    "CHAT_PAGES": "chat_page_id",
+    "CONTEXTS": "context_id",
+    "DATA_WINDOWS": "data_window_id",
+    "INTEGRATIONS": "integration_id",
+    "JOBS": "job_id",
+    "JSON_DOCUMENTS": "document_id",
+    "ORGANIZATIONS": "organization_id",
+    "PARAMETER_DEFINITIONS": "pd_id",
+    "SRE": "sre_id",
+    "TOOLS": "tool_id",
+    "USERS": "user_id",
+}
+ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "load-test",
+    "AWS_SECRET_ACCESS_KEY": "load-test",
+    "LOG_LEVEL": "WARNING",
+    "STORAGE_BACKEND": "memory",
+    "MODELS_TABLE_NAME": "load-test-models",
+    "CONTEXT_MESSAGES_TABLE_NAME": "load-test-context-messages",
+    "TOKEN_TRACKING_TABLE_NAME": "load-test-token-tracking",
+    "EXECUTION_LAMBDA_NAME": "load-test",
+    "JWT_SECRET": "load-test",
+    "RESET_KEY": "load-test",
+    "OPENAI_API_KEY": "load-test",
+    "USER_POOL_ID": "load-test",
+    "GOOGLE_CLIENT_ID": "load-test",
+    "GOOGLE_CLIENT_SECRET": "load-test",
+    "JIRA_CLIENT_ID": "load-test",
+    "JIRA_CLIENT_SECRET": "load-test",
+    "OUTLOOK_CLIENT_ID": "load-test",
+    "OUTLOOK_CLIENT_SECRET": "load-test",
+}
+for _table, _primary_key in TABLES.items():
+    ENVIRONMENT[f"{_table}_TABLE_NAME"] = f"load-test-{_table.lower().replace('_', '-')}"
+    ENVIRONMENT[f"{_table}_PRIMARY_KEY"] = _primary_key
+
+AGENT_ID = "load-test-agent"
+API_KEY_ID = "load-test-key"
+TOOL_NAME = "load_test_lookup"
+WORDS = ("the", "stream", "of", "tokens", "arrives", "at", "a", "steady", "rate", "while", "server", "load", "grows")
+
+
+# -- Server process: stand-ins installed before app.py is imported --
+
+def create_fake_chat_model(tokens: int, tokens_per_second: float, first_token_delay: float, tool_every: int):
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    class FakeStreamingChatModel(BaseChatModel):
+        """Streams a fixed script at a fixed rate; calls TOOL_NAME on every tool_every-th human turn."""
+        tokens: int
+        tokens_per_second: float
+        first_token_delay: float
+        tool_every: int
+
+        @property
+        def _llm_type(self) -> str:
+            return "load-test-fake"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _should_call_tool(self, messages) -> bool:
+            if not self.tool_every or not messages or not isinstance(messages[-1], HumanMessage):
+                return False
+            human_turns = sum(1 for message in messages if isinstance(message, HumanMessage))
+            return human_turns % self.tool_every == 0
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            text = "".join(WORDS[i % len(WORDS)] + " " for i in range(self.tokens))
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(self.first_token_delay)
+            if self._should_call_tool(messages):
+                yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[{
+                    "name": TOOL_NAME, "args": json.dumps({"query": "load test"}), "id": f"call_{uuid.uuid4().hex[:12]}", "index": 0,
+                }]))
+                return
+            # Absolute schedule, so the measured jitter is the server's and not the generator's
+            started = time.perf_counter()
+            interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+            for i in range(self.tokens):
+                delay = started + i * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield ChatGenerationChunk(message=AIMessageChunk(content=WORDS[i % len(WORDS)] + " "))
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content="", usage_metadata={"input_tokens": len(messages) * 50, "output_tokens": self.tokens, "total_tokens": len(messages) * 50 + self.tokens},
+            ))
+
+    return FakeStreamingChatModel(tokens=tokens, tokens_per_second=tokens_per_second, first_token_delay=first_token_delay, tool_every=tool_every)
+
+
+def access_token() -> str:
+    """API key JWT for the seeded key; the client process signs the same claims with the same secret."""
+    from datetime import timedelta
+    from lib.JWT import generate_jwt
+    return generate_jwt(
+        os.environ["JWT_SECRET"],
+        {"api_key_id": API_KEY_ID, "org_id": "load-test", "type": "org", "user_id": "public"},
+        expires_in=timedelta(days=1),
+    )
+
+
+def seed(tables, clients: int, tool_every: int):
+    """Public agent, API key and one context per client."""
+    now = int(time.time())
+    tables.put_item(os.environ["AGENTS_TABLE_NAME"], {
+        "agent_id": AGENT_ID, "agent_name": "Load test", "agent_description": "Load test agent",
+        "prompt": "You are a load test.", "org_id": "load-test", "is_public": True, "is_default_agent": False,
+        "tools": [TOOL_NAME] if tool_every else [], "created_at": now, "updated_at": now,
+    })
+    tables.put_item(os.environ["API_KEYS_TABLE_NAME"], {
+        "api_key_id": API_KEY_ID, "org_id": "load-test", "token": access_token(), "valid": True, "type": "org",
+        "user_id": "public", "created_at": now, "updated_at": now,
+    })
+    for i in range(clients):
+        tables.put_item(os.environ["CONTEXTS_TABLE_NAME"], {
+            "context_id": f"load-test-{i}", "agent_id": AGENT_ID, "user_id": "public", "messages": [],
+            "created_at": now, "updated_at": now,
+        })
+
+
+def register_tool(tool_output_bytes: int):
+    from pydantic import BaseModel
+    from LLM.AgentTool import AgentTool
+    from Tools.ToolRegistry import tool_registry
+
+    class load_test_lookup(BaseModel):
+        """Returns a fixed-size document."""
+        query: str
+
+    output = ("lorem ipsum " * (tool_output_bytes // 12 + 1))[:tool_output_bytes]
+
+    async def lookup(query: str) -> str:
+        await asyncio.sleep(0.05)
+        return output
+
+    tool_registry[TOOL_NAME] = AgentTool(params=load_test_lookup, function=lookup)
+
+
+def serve(args):
+    os.chdir(SRC)
+    from AWS import DynamoDB
+    tables = DynamoDB.BACKEND
+    import LLM.CreateLLM
+    LLM.CreateLLM.create_llm = lambda model_id=None, for_streaming=False: create_fake_chat_model(
+        args.tokens, args.tokens_per_second, args.first_token_delay, args.tool_every)
+    register_tool(args.tool_output_bytes)
+    seed(tables, args.clients, args.tool_every)
+
+    import uvicorn
+    from app import app
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning", ws_ping_interval=None)
+
+
+# -- Load generator --
+
+def read_process(pid: int) -> dict:
+    """CPU seconds (user + system) and RSS bytes of a process, from /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / ticks
+    with open(f"/proc/{pid}/statm") as f:
+        rss_bytes = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return {"cpu_seconds": cpu_seconds, "rss_bytes": rss_bytes}
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def at(fraction):
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values),
+        "p50": at(0.50),
+        "p90": at(0.90),
+        "p99": at(0.99),
+        "max": values[-1],
+    }
+
+
+class Client:
+    def __init__(self, index: int, url: str, token: str, args):
+        self.index = index
+        self.url = url
+        self.token = token
+        self.args = args
+        self.ttft = []
+        self.gaps = []
+        self.turn_seconds = []
+        self.connect_timings = {}
+        self.tokens = 0
+        self.errors = []
+
+    async def run(self):
+        import websockets
+        try:
+            async with websockets.connect(self.url, max_size=None, ping_interval=None) as websocket:
+                self.websocket = websocket
+                result = await self.request("connect_to_context", {
+                    "context_id": f"load-test-{self.index}",
+                    "access_token": self.token,
+                    "token_batching": True if self.args.token_batching else None,
+                })
+                if "error" in result:
+                    raise Exception(result["error"])
+                self.connect_timings = result.get("timings_ms", {})
+                for turn in range(self.args.turns):
+                    await self.turn(f"Message {turn} from client {self.index}")
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+
+    async def request(self, method: str, params: dict, on_notification=None) -> dict:
+        request_id = str(uuid.uuid4())
+        await self.websocket.send(json.dumps({"id": request_id, "method": method, "params": params}))
+        while True:
+            message = json.loads(await self.websocket.recv())
+            if message.get("id") == request_id and "result" in message:
+                return message["result"]
+            if on_notification and "method" in message:
+                on_notification(message)
+
+    async def turn(self, text: str):
+        sent = time.perf_counter()
+        last_token = None
+        tokens = 0
+
+        def on_notification(message):
+            nonlocal last_token, tokens
+            if message["method"] not in ("on_token", "on_tokens"):
+                return
+            now = time.perf_counter()
+            if last_token is None:
+                self.ttft.append(now - sent)
+            else:
+                self.gaps.append(now - last_token)
+            last_token = now
+            tokens += len(message["params"]["tokens"]) if message["method"] == "on_tokens" else 1
+
+        result = await self.request("add_message", {"message": text}, on_notification)
+        if isinstance(result, dict) and "error" in result:
+            self.errors.append(result["error"])
+        self.turn_seconds.append(time.perf_counter() - sent)
+        self.tokens += tokens
+
+
+async def sample_process(pid: int, samples: list, stop: asyncio.Event, interval: float = 0.25):
+    while not stop.is_set():
+        samples.append(read_process(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def wait_for_server(port: int, process: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("Server did not become healthy in time")
+
+
+async def drive(args, pid: int, token: str) -> dict:
+    baseline = read_process(pid)
+    samples = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_process(pid, samples, stop))
+
+    clients = [Client(i, f"ws://127.0.0.1:{args.port}/ws", token, args) for i in range(args.clients)]
+    started = time.perf_counter()
+
+    async def start(client: Client):
+        if args.ramp_seconds and args.clients > 1:
+            await asyncio.sleep(args.ramp_seconds * client.index / (args.clients - 1))
+        await client.run()
+
+    await asyncio.gather(*[start(client) for client in clients])
+    duration = time.perf_counter() - started
+    stop.set()
+    await sampler
+    final = read_process(pid)
+
+    ttft = [value for client in clients for value in client.ttft]
+    gaps = [value for client in clients for value in client.gaps]
+    turns = [value for client in clients for value in client.turn_seconds]
+    total_tokens = sum(client.tokens for client in clients)
+    peak_rss = max([sample["rss_bytes"] for sample in samples] + [final["rss_bytes"]])
+    cpu_seconds = final["cpu_seconds"] - baseline["cpu_seconds"]
+    errors = [error for client in clients for error in client.errors]
+    connect_stages = sorted({stage for client in clients for stage in client.connect_timings})
+
+    return {
+        "duration_seconds": duration,
+        "ttft_seconds": percentiles(ttft),
+        "inter_token_seconds": percentiles(gaps),
+        "inter_token_jitter_seconds": statistics.pstdev(gaps) if len(gaps) > 1 else 0.0,
+        "turn_seconds": percentiles(turns),
+        # connect_to_context's own per-stage timings, as it reports them in its acknowledgement
+        "connect_ms": {
+            stage: percentiles([client.connect_timings[stage] for client in clients if stage in client.connect_timings])
+            for stage in connect_stages
+        },
+        "tokens": total_tokens,
+        "tokens_per_second": total_tokens / duration if duration else 0.0,
+        "turns_completed": len(turns),
+        "server": {
+            "cpu_seconds": cpu_seconds,
+            "cpu_utilization": cpu_seconds / duration if duration else 0.0,
+            "cpu_seconds_per_connection": cpu_seconds / args.clients,
+            "cpu_ms_per_token": cpu_seconds * 1000 / total_tokens if total_tokens else None,
+            "rss_baseline_bytes": baseline["rss_bytes"],
+            "rss_peak_bytes": peak_rss,
+            "rss_bytes_per_connection": (peak_rss - baseline["rss_bytes"]) / args.clients,
+        },
+        "errors": {"count": len(errors), "sample": errors[:10]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens per LLM response")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--tool-every", type=int, default=0, help="Call the server-side tool on every Nth turn (0 = never)")
+    parser.add_argument("--tool-output-bytes", type=int, default=2000)
+    parser.add_argument("--token-batching", action="store_true")
+    parser.add_argument("--ramp-seconds", type=float, default=5.0)
+    parser.add_argument("--storage-latency-ms", type=float, default=0.0, help="Added to every storage call in the server")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ["STORAGE_MEMORY_LATENCY_MS"] = str(args.storage_latency_ms)
+
+    if args.serve:
+        serve(args)
+        return
+
+    server_args = [
+        "--serve", "--port", str(args.port), "--clients", str(args.clients), "--tokens", str(args.tokens),
+        "--tokens-per-second", str(args.tokens_per_second), "--first-token-delay", str(args.first_token_delay),
+        "--tool-every", str(args.tool_every), "--tool-output-bytes", str(args.tool_output_bytes),
+        "--storage-latency-ms", str(args.storage_latency_ms),
+    ]
+    # Server logs go to stderr so stdout stays valid JSON
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), *server_args], env=os.environ.copy(), stdout=sys.stderr)
+    try:
+        wait_for_server(args.port, process)
+        results = asyncio.run(drive(args, process.pid, access_token()))
+        # Synchronous code that stalled the server's event loop during the run, see LoopWatchdog
+        with urllib.request.urlopen(f"http://127.0.0.1:{args.port}/admin/loop?key={os.environ['RESET_KEY']}&limit=10") as response:
+            results["loop_blocking"] = json.loads(response.read())["workers"][0]
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    report = {
+        "benchmark": "load_test",
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("serve", "output")},
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
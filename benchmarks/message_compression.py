@@ -0,0 +1,164 @@
+"""
+Stored size and CPU cost of compressed Context messages (lib/MessageCompression.py).
+
+Builds deterministic transcripts that look like the ones that grow large in
+production - chat turns with tool calls whose outputs are email threads, web
+pages from view_url and memory windows - and encodes them with each codec
+and threshold. Reports the stored size against plain JSON, the write units
+an inline save of the whole context would cost, and encode/decode time per
+transcript (encode is what a save pays for its new messages, decode what a
+load pays for all of them).
+
+Usage:
+    python benchmarks/message_compression.py [--transcripts 20] [--turns 30] [--repeat 5]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from lib import MessageCompression  # noqa: E402
+
+VOCABULARY = (
+    "the meeting invoice schedule project customer report update please review attached thanks regards "
+    "deadline quarter budget team client proposal contract delivery status issue ticket release notes "
+    "we will can should need follow up next week today tomorrow monday friday morning afternoon call "
+    "price shipping order account password login error page search results article section table data"
+).split()
+NAMES = ("Alice Martin", "Bob Chen", "Carla Ruiz", "Dmitri Ivanov", "Erin O'Neil", "Farah Khan")
+ITEM_SIZE_UNIT = 1024  # DynamoDB write units are per started KB
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize() + "."
+
+
+def paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(sentence(rng, rng.randint(6, 18)) for _ in range(sentences))
+
+
+def email_thread(rng: random.Random) -> str:
+    emails = []
+    for i in range(rng.randint(3, 8)):
+        sender, recipient = rng.sample(NAMES, 2)
+        emails.append({
+            "id": f"AAMkAGI2{rng.getrandbits(64):016x}",
+            "from": {"name": sender, "address": sender.lower().replace(" ", ".").replace("'", "") + "@example.com"},
+            "to": [{"name": recipient, "address": recipient.lower().replace(" ", ".").replace("'", "") + "@example.com"}],
+            "subject": ("RE: " * i) + sentence(rng, 5),
+            "received": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z",
+            "body": paragraph(rng, rng.randint(3, 10)),
+        })
+    return json.dumps(emails)
+
+
+def web_page(rng: random.Random) -> str:
+    lines = [f"# {sentence(rng, 6)}"]
+    for _ in range(rng.randint(10, 40)):
+        lines.append(f"## {sentence(rng, 4)}")
+        lines.append(paragraph(rng, rng.randint(2, 6)))
+        lines.append(" | ".join(f"[{rng.choice(VOCABULARY)}](https://example.com/{rng.choice(VOCABULARY)}/{rng.getrandbits(24)})" for _ in range(5)))
+    return "\n".join(lines)
+
+
+def memory_window(rng: random.Random) -> str:
+    return json.dumps([
+        {"key": f"memory_{i}", "updated_at": 1790000000 + rng.randint(0, 10 ** 6), "value": paragraph(rng, rng.randint(1, 4))}
+        for i in range(rng.randint(10, 40))
+    ])
+
+
+TOOL_OUTPUTS = {"search_email": email_thread, "view_url": web_page, "read_memory_window": memory_window}
+
+
+def transcript(rng: random.Random, turns: int) -> list[dict]:
+    """Messages in the shape base_messages_to_dict_messages stores them."""
+    messages = [{"type": "system", "content": paragraph(rng, 6)}]
+    for turn in range(turns):
+        messages.append({"type": "human", "content": sentence(rng, rng.randint(5, 25)), "additional_kwargs": {}, "response_metadata": {}, "id": None})
+        if rng.random() < 0.4:
+            tool_name = rng.choice(list(TOOL_OUTPUTS))
+            tool_call_id = f"call_{rng.getrandbits(96):024x}"
+            messages.append({
+                "type": "ai", "content": "", "tool_calls": [{"id": tool_call_id, "name": tool_name, "args": {"query": sentence(rng, 4)}}],
+                "response_metadata": {"finish_reason": "tool_calls"}, "id": f"run-{rng.getrandbits(64):016x}",
+                "usage_metadata": {"input_tokens": 1000 + turn * 400, "output_tokens": 25, "total_tokens": 1025 + turn * 400},
+            })
+            messages.append({"type": "tool", "content": TOOL_OUTPUTS[tool_name](rng), "tool_call_id": tool_call_id})
+        messages.append({
+            "type": "ai", "content": paragraph(rng, rng.randint(1, 8)), "tool_calls": [],
+            "response_metadata": {"finish_reason": "stop"}, "id": f"run-{rng.getrandbits(64):016x}",
+            "usage_metadata": {"input_tokens": 1000 + turn * 400, "output_tokens": 200, "total_tokens": 1200 + turn * 400},
+        })
+    return messages
+
+
+def stored_size(value) -> int:
+    if isinstance(value, bytes):
+        return len(value)
+    return len(json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+
+
+def measure(transcripts: list[list[dict]], codec: str, threshold: int, repeat: int) -> dict:
+    plain_bytes = sum(stored_size(message) for messages in transcripts for message in messages)
+    encoded = [[MessageCompression.encode_message(message, codec, threshold) for message in messages] for messages in transcripts]
+    stored_bytes = sum(stored_size(value) for values in encoded for value in values)
+    compressed = sum(isinstance(value, bytes) for values in encoded for value in values)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for messages in transcripts:
+            for message in messages:
+                MessageCompression.encode_message(message, codec, threshold)
+    encode_seconds = (time.perf_counter() - start) / repeat / len(transcripts)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for values in encoded:
+            MessageCompression.decode_messages(values)
+    decode_seconds = (time.perf_counter() - start) / repeat / len(transcripts)
+
+    for messages, values in zip(transcripts, encoded):
+        assert MessageCompression.decode_messages(values) == messages
+
+    return {
+        "codec": codec,
+        "threshold_bytes": threshold,
+        "plain_kb_per_transcript": round(plain_bytes / len(transcripts) / 1024, 1),
+        "stored_kb_per_transcript": round(stored_bytes / len(transcripts) / 1024, 1),
+        "ratio": round(plain_bytes / stored_bytes, 2),
+        "compressed_messages_pct": round(100 * compressed / sum(len(values) for values in encoded), 1),
+        "write_units_per_inline_save": round(sum(math.ceil(sum(stored_size(value) for value in values) / ITEM_SIZE_UNIT) for values in encoded) / len(encoded), 1),
+        "over_400kb": sum(sum(stored_size(value) for value in values) > 400 * 1024 for values in encoded),
+        "encode_ms_per_transcript": round(encode_seconds * 1000, 3),
+        "decode_ms_per_transcript": round(decode_seconds * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcripts", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=30, help="Human turns per transcript")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    transcripts = [transcript(rng, args.turns) for _ in range(args.transcripts)]
+
+    configurations = [("none", 0)]
+    for threshold in (1024, 4096, 16384):
+        configurations.append(("zlib", threshold))
+        if MessageCompression.zstandard is not None:
+            configurations.append(("zstd", threshold))
+
+    for codec, threshold in configurations:
+        print(json.dumps(measure(transcripts, codec, threshold, args.repeat)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Bytes per token and encode ns per token for on_token frames.
+
+Compares the generic JSONRPCPeer path used before (dict + json.dumps, with
+the full response_id UUID) against the FrameEncoder templates, with and
+without short stream ids, and with orjson on/off. All of them carry "id": null.
+
+Usage:
+    python benchmarks/token_encoding.py [--tokens 200000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from lib import FrameEncoder  # noqa: E402
+
+WORDS = ["Hello", ",", " how", " are", " you", "?", " The", " weather", " in", " Zürich",
+         " is", " 12", "°C", " today", ".", "\n", " \"quoted\"", " über", "-", " ok"]
+
+
+def legacy(token: str, response_id: str) -> str:
+    return json.dumps({"method": "on_token", "params": {"token": token, "response_id": response_id}, "id": None})
+
+
+def measure(name: str, encode, tokens: list) -> dict:
+    start = time.perf_counter_ns()
+    total_bytes = 0
+    for token in tokens:
+        total_bytes += len(encode(token).encode("utf-8"))
+    elapsed = time.perf_counter_ns() - start
+    return {
+        "impl": name,
+        "ns_per_token": round(elapsed / len(tokens), 1),
+        "bytes_per_token": round(total_bytes / len(tokens), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=200000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    tokens = [random.choice(WORDS) for _ in range(args.tokens)]
+    response_id = str(uuid.uuid4())
+
+    results = [measure("legacy_json_dumps", lambda t: legacy(t, response_id), tokens)]
+
+    fast_json = FrameEncoder.orjson
+    for label, lib in (("stdlib", None), ("orjson", fast_json)):
+        if label == "orjson" and lib is None:
+            continue
+        FrameEncoder.orjson = lib
+        uuid_key = FrameEncoder.render_stream_key(response_id)
+        short_key = FrameEncoder.render_stream_key(response_id, stream_id=7)
+        results.append(measure(f"template_{label}_response_id", lambda t: FrameEncoder.encode_on_token(t, uuid_key, 1234), tokens))
+        results.append(measure(f"template_{label}_stream_id", lambda t: FrameEncoder.encode_on_token(t, short_key, 1234), tokens))
+    FrameEncoder.orjson = fast_json
+
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
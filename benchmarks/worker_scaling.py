@@ -0,0 +1,174 @@
+"""
+Aggregate streaming throughput vs. number of worker processes.
+
+Each worker is a separate process (as with `uvicorn --workers N`) running
+--streams concurrent responses through the real Connection send path
+(ResponseStream record, OutboundQueue, frame encoding) into a fake socket.
+Workers share nothing but the Unix socket bus, which is also timed: the
+round trip of a stop_invocation routed to a connection on another worker.
+
+Scaling is only meaningful up to the number of physical cores.
+
+Usage:
+    python benchmarks/worker_scaling.py [--workers 1,2,4] [--streams 200] [--tokens 500]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from load_test import ENVIRONMENT  # noqa: E402
+
+# A worker that hasn't reported by then is taken to be stuck
+WORKER_TIMEOUT_SECONDS = 600
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.bytes_sent = 0
+
+    async def send_text(self, message):
+        self.bytes_sent += len(message)
+
+    async def send_bytes(self, message):
+        self.bytes_sent += len(message)
+
+
+async def _stream_worker(streams: int, tokens: int) -> dict:
+    from lib.Connection import Connection
+
+    async def stream_one():
+        connection = Connection(FakeWebSocket())
+        connection.outbound.start()
+        response_id = str(uuid.uuid4())
+        for i in range(tokens):
+            await connection.send_token(response_id, " tok%d" % i)
+            if i % 8 == 0:
+                await asyncio.sleep(0)  # Interleave streams like real model output does
+        await connection.send_stop_token(response_id)
+        await connection.outbound.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[stream_one() for _ in range(streams)])
+    return {"seconds": time.perf_counter() - start, "tokens": streams * tokens}
+
+
+def _run_worker(streams: int, tokens: int, barrier, results):
+    barrier.wait()
+    results.put(asyncio.run(_stream_worker(streams, tokens)))
+
+
+def measure_streams(workers: int, streams: int, tokens: int) -> dict:
+    barrier = multiprocessing.Barrier(workers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_run_worker, args=(streams, tokens, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = []
+    deadline = time.monotonic() + WORKER_TIMEOUT_SECONDS
+    while len(outcomes) < workers:
+        try:
+            outcomes.append(results.get(timeout=1))
+        except queue.Empty:
+            # A worker that died never reports, and the others wait for it at the barrier
+            exit_codes = [process.exitcode for process in processes if process.exitcode not in (None, 0)]
+            if exit_codes or time.monotonic() > deadline:
+                for process in processes:
+                    process.terminate()
+                reason = f"exit codes {exit_codes}" if exit_codes else f"no result after {WORKER_TIMEOUT_SECONDS}s"
+                raise SystemExit(f"Stream workers failed: {reason}")
+    for process in processes:
+        process.join()
+    # Workers start together, so the slowest one bounds the wall time
+    wall = max(outcome["seconds"] for outcome in outcomes)
+    total_tokens = sum(outcome["tokens"] for outcome in outcomes)
+    return {
+        "workers": workers,
+        "concurrent_streams": workers * streams,
+        "tokens_per_second": round(total_tokens / wall),
+    }
+
+
+def _run_bus_owner(bus_dir: str, ready):
+    from lib.MessageBus import UnixSocketBus
+
+    async def main():
+        bus = UnixSocketBus(worker_id="owner", bus_dir=bus_dir)
+
+        async def stop_invocation(connection_id):
+            return True if connection_id == "remote-connection" else None
+
+        bus.on("stop_invocation", stop_invocation)
+        await bus.start()
+        ready.set()
+        await asyncio.sleep(3600)
+
+    asyncio.run(main())
+
+
+def measure_bus(calls: int) -> dict:
+    from lib.MessageBus import UnixSocketBus
+
+    bus_dir = tempfile.mkdtemp()
+    ready = multiprocessing.Event()
+    owner = multiprocessing.Process(target=_run_bus_owner, args=(bus_dir, ready), daemon=True)
+    owner.start()
+    ready.wait()
+
+    async def main():
+        bus = UnixSocketBus(worker_id="caller", bus_dir=bus_dir)
+        await bus.start()
+        latencies = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            assert await bus.request_any("stop_invocation", {"connection_id": "remote-connection"})
+            latencies.append((time.perf_counter() - start) * 1000)
+        await bus.close()
+        return latencies
+
+    latencies = asyncio.run(main())
+    owner.terminate()
+    shutil.rmtree(bus_dir, ignore_errors=True)
+    return {
+        "bus_stop_invocation_p50_ms": round(statistics.median(latencies), 3),
+        "bus_stop_invocation_p99_ms": round(sorted(latencies)[int(len(latencies) * 0.99) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default=",".join(str(n) for n in (1, 2, 4, 8) if n <= (os.cpu_count() or 1)) or "1")
+    parser.add_argument("--streams", type=int, default=200, help="Concurrent streams per worker")
+    parser.add_argument("--tokens", type=int, default=500, help="Tokens per stream")
+    parser.add_argument("--bus-calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Workers import the Models, which read their tables from the environment
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+
+    baseline = None
+    for workers in [int(n) for n in args.workers.split(",")]:
+        result = measure_streams(workers, args.streams, args.tokens)
+        baseline = baseline or result["tokens_per_second"] / workers
+        result["scaling_efficiency"] = round(result["tokens_per_second"] / (baseline * workers), 3)
+        print(json.dumps(result))
+
+    print(json.dumps(measure_bus(args.bus_calls)))
+
+
+if __name__ == "__main__":
+    main()
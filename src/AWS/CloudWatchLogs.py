@@ -1,12 +1,83 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import sys
 
-def get_logger(name: str = __name__, log_level: str = "INFO") -> logging.Logger:
+# Shared by every structured logger: records are queued by the caller and
+# formatted/written by a background thread, so logging never blocks the
+# event loop on stdout.
+_LOG_QUEUE_MAX = int(os.environ.get("LOG_QUEUE_MAX", "10000"))
+_queue_handler = None
+_queue_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the record's structured fields merged in."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full instead of blocking."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _get_queue_handler() -> DroppingQueueHandler:
+    global _queue_handler, _queue_listener
+    if _queue_handler is None:
+        log_queue = queue.Queue(maxsize=_LOG_QUEUE_MAX)
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JSONFormatter())
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _queue_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        _queue_listener.start()
+        # Flush what's queued on interpreter exit
+        atexit.register(_queue_listener.stop)
+    return _queue_handler
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def get_logger(name: str = __name__, log_level: str = "INFO", structured: bool = False) -> logging.Logger:
     """
     Returns a logger with a specified name and log level.
 
     :param name: Logger name, typically set to __name__ (a special Python variable that
                  holds the module's name). This helps organize logs by module.
     :param log_level: Logging level as a string (e.g., "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL").
+    :param structured: Write JSON lines through the shared non-blocking queue instead of
+                       formatting on the calling thread. Structured fields are passed as
+                       extra={"fields": {...}}.
 
     Log levels (in order of verbosity): DEBUG < INFO < WARNING < ERROR < CRITICAL.
     """
@@ -18,8 +89,12 @@ def get_logger(name: str = __name__, log_level: str = "INFO") -> logging.Logger:
 
     # Add a console handler if no handlers exist (prevents duplicates)
     if not logger.handlers:
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-        logger.addHandler(console_handler)
+        if structured:
+            logger.addHandler(_get_queue_handler())
+            logger.propagate = False
+        else:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            logger.addHandler(console_handler)
 
     return logger
@@ -1,6 +1,7 @@
 import os
 import boto3
 from pydantic import BaseModel
+from AWS.DynamoDB import run_in_pool
 
 
 class CognitoUser(BaseModel):
@@ -20,6 +21,11 @@ def get_user_from_cognito(access_token: str) -> CognitoUser:
     return CognitoUser(**user_attributes)
 
 
+async def aget_user_from_cognito(access_token: str) -> CognitoUser:
+    # The bounded pool the table reads use, so auth counts towards the same in-flight limit
+    return await run_in_pool(get_user_from_cognito, access_token)
+
+
 def delete_user_from_cognito(user_id: str) -> None:
     cognito = boto3.client("cognito-idp")
     cognito.admin_delete_user(
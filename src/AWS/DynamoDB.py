@@ -1,14 +1,128 @@
+import asyncio
+import functools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional, TypeVar
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.types import TypeSerializer
 from decimal import Decimal
+from lib import Metrics
+from lib.StorageBackend import StorageBackend, ConditionFailed, VERSION_ATTRIBUTE
+from lib.MemoryStorage import MemoryStorage
 
-# Initialize once at module level - reused across all function calls
-_dynamodb = boto3.resource("dynamodb")
+# Async callers (the a* functions below) run the blocking boto3 calls on this
+# many threads; more concurrent calls queue instead of opening more sockets
+DYNAMODB_THREADS = int(os.environ.get("DYNAMODB_THREADS", "16"))
+_config = Config(max_pool_connections=DYNAMODB_THREADS, retries={"mode": "standard"})
+
+# Created on first use - reused across all function calls on the event loop thread
+_dynamodb = None
+# boto3 resources aren't thread-safe, so each pool thread builds its own once and keeps it
+_local = threading.local()
+_main_thread = threading.main_thread()
+_executor = ThreadPoolExecutor(max_workers=DYNAMODB_THREADS, thread_name_prefix="dynamodb")
+_in_flight = 0
+
+# BatchGetItem takes at most this many keys per request
+BATCH_GET_MAX_KEYS = 100
+# Chunks of one synchronous batch_get_items call in flight at once (async callers use the pool above)
+BATCH_GET_CONCURRENCY = int(os.environ.get("DYNAMODB_BATCH_GET_CONCURRENCY", "4"))
+# Unprocessed keys (throttling, 16 MB response limit) are requested again with jittered exponential backoff
+BATCH_GET_MAX_ATTEMPTS = 8
+BATCH_GET_BACKOFF_SECONDS = 0.025
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_GET_CONCURRENCY, thread_name_prefix="dynamodb-batch")
+
+# TransactWriteItems takes at most this many actions
+TRANSACT_MAX_ITEMS = 100
+# Attempts of a write that keeps losing to concurrent writers before the conflict is raised
+CONFLICT_RETRY_ATTEMPTS = 5
+CONFLICT_BACKOFF_SECONDS = 0.02
+_serializer = TypeSerializer()
+
+T = TypeVar("T")
+
+
+def in_flight() -> int:
+    """Async calls submitted to the pool and not yet finished (running or queued)."""
+    return _in_flight
+
+
+async def run_in_pool(function, *args, **kwargs):
+    """Run a blocking DynamoDB call on the bounded pool without blocking the event loop."""
+    global _in_flight
+    loop = asyncio.get_running_loop()
+
+    def call():
+        Metrics.bind_loop(loop)
+        return function(*args, **kwargs)
+
+    _in_flight += 1
+    try:
+        return await loop.run_in_executor(_executor, call)
+    finally:
+        _in_flight -= 1
+
+def _record(table_name: str, operation: str, seconds: float, failed: bool):
+    if failed:
+        Metrics.DYNAMODB_ERRORS.inc((table_name, operation))
+    Metrics.DYNAMODB_DURATION.observe(seconds, (table_name, operation))
+
+def _record_capacity(table_name: str, operation: str, consumed_capacity):
+    """Count the capacity units DynamoDB reports (a dict, or a list of them for batch calls)."""
+    if not consumed_capacity:
+        return
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    units = float(sum(capacity.get("CapacityUnits", 0) for capacity in consumed_capacity))
+    Metrics.inc_threadsafe(Metrics.DYNAMODB_CONSUMED_CAPACITY, (table_name, operation), units)
+
+def _current_loop():
+    loop = Metrics.bound_loop()
+    if loop is not None:
+        return loop
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+def _timed(operation: str):
+    """Record latency and errors per table for a function whose first argument is the table name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(table_name: str, *args, **kwargs):
+            started = time.perf_counter()
+            failed = False
+            try:
+                return function(table_name, *args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                Metrics.on_loop(_record, table_name, operation, time.perf_counter() - started, failed)
+        return wrapper
+    return decorator
+
+def _get_resource():
+    global _dynamodb
+    if threading.current_thread() is _main_thread:
+        if _dynamodb is None:
+            _dynamodb = boto3.resource("dynamodb", config=_config)
+        return _dynamodb
+    resource = getattr(_local, "dynamodb", None)
+    if resource is None:
+        resource = _local.dynamodb = boto3.session.Session().resource("dynamodb", config=_config)
+    return resource
 
 def _get_table(table_name: str):
     """Get a DynamoDB table reference."""
-    return _dynamodb.Table(table_name)
+    return _get_resource().Table(table_name)
 
 def float_to_decimal(obj):
     """Recursively convert float objects to Decimal for DynamoDB serialization."""
@@ -21,6 +135,7 @@ def float_to_decimal(obj):
     else:
         return obj
 
+@_timed("get_item")
 def get_item(table_name: str, primary_key_name: str, key: str) -> dict:
     table = _get_table(table_name)
     response = table.get_item(Key={primary_key_name: key})
@@ -28,18 +143,94 @@ def get_item(table_name: str, primary_key_name: str, key: str) -> dict:
         return None
     return response["Item"]
 
-def get_items_by_scan(table_name: str, primary_key_name: str, keys: list[str]) -> list[dict]:
+@_timed("get_item")
+def get_item_attributes(table_name: str, primary_key_name: str, key: str, attributes: list[str]) -> Optional[dict]:
+    """get_item reading only the given attributes (ProjectionExpression). Missing attributes are absent from the result."""
     table = _get_table(table_name)
-    response = table.scan(
-        FilterExpression=Attr(primary_key_name).is_in(keys)
+    names = {f"#a{index}": attribute for index, attribute in enumerate(attributes)}
+    response = table.get_item(
+        Key={primary_key_name: key},
+        ProjectionExpression=", ".join(names),
+        ExpressionAttributeNames=names,
     )
-    return response.get('Items', [])
+    return response.get("Item")
+
+@_timed("scan")
+def get_items_by_scan(table_name: str, primary_key_name: str, keys: list[str]) -> list[dict]:
+    """Reads the whole table to find a few keys - use batch_get_items."""
+    table = _get_table(table_name)
+    items = []
+    scan_params = {"FilterExpression": Attr(primary_key_name).is_in(keys), "ReturnConsumedCapacity": "TOTAL"}
+
+    while True:
+        response = table.scan(**scan_params)
+        items.extend(response.get("Items", []))
+        _record_capacity(table_name, "scan", response.get("ConsumedCapacity"))
+
+        if "LastEvaluatedKey" in response:
+            scan_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        else:
+            break
+
+    return items
+
+def _batch_get_chunks(keys: list[str]) -> list[list[str]]:
+    unique_keys = list(dict.fromkeys(keys))
+    return [unique_keys[start:start + BATCH_GET_MAX_KEYS] for start in range(0, len(unique_keys), BATCH_GET_MAX_KEYS)]
+
+def _in_key_order(items: list[dict], primary_key_name: str, keys: list[str]) -> list[dict]:
+    items_by_key = {item[primary_key_name]: item for item in items}
+    return [items_by_key[key] for key in dict.fromkeys(keys) if key in items_by_key]
+
+@_timed("batch_get_item")
+def _batch_get_chunk(table_name: str, primary_key_name: str, keys: list[str]) -> list[dict]:
+    """One BatchGetItem of up to 100 keys, repeated for unprocessed keys until all are read."""
+    resource = _get_resource()
+    request = {table_name: {"Keys": [{primary_key_name: key} for key in keys]}}
+    items = []
+
+    for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+        response = resource.batch_get_item(RequestItems=request, ReturnConsumedCapacity="TOTAL")
+        items.extend(response.get("Responses", {}).get(table_name, []))
+        _record_capacity(table_name, "batch_get_item", response.get("ConsumedCapacity"))
+
+        request = response.get("UnprocessedKeys") or {}
+        if not request:
+            return items
+        time.sleep(random.uniform(0, BATCH_GET_BACKOFF_SECONDS * 2 ** attempt))
 
+    raise Exception(f"BatchGetItem on {table_name} left {len(request[table_name]['Keys'])} keys unprocessed after {BATCH_GET_MAX_ATTEMPTS} attempts", 503)
+
+def batch_get_items(table_name: str, primary_key_name: str, keys: list[str]) -> list[dict]:
+    """
+    Get many items by primary key with BatchGetItem.
+
+    :param table_name: Name of the DynamoDB table
+    :param primary_key_name: Name of the primary key
+    :param keys: Primary key values; duplicates are read once
+    :return: Items in the order of keys; keys with no item are skipped
+    """
+    chunks = _batch_get_chunks(keys)
+    if len(chunks) <= 1:
+        items = _batch_get_chunk(table_name, primary_key_name, chunks[0]) if chunks else []
+        return _in_key_order(items, primary_key_name, keys)
+
+    loop = _current_loop()
+
+    def get_chunk(chunk: list[str]) -> list[dict]:
+        Metrics.bind_loop(loop)
+        return _batch_get_chunk(table_name, primary_key_name, chunk)
+
+    items = [item for chunk_items in _batch_executor.map(get_chunk, chunks) for item in chunk_items]
+    return _in_key_order(items, primary_key_name, keys)
+
+@_timed("scan")
 def get_all_items(table_name: str) -> list[dict]:
     table = _get_table(table_name)
     response = table.scan()
     return response['Items']
 
+@_timed("put_item")
 def put_item(table_name: str, item: dict) -> None:
     table = _get_table(table_name)
     # Convert floats to Decimals for DynamoDB compatibility
@@ -47,16 +238,318 @@ def put_item(table_name: str, item: dict) -> None:
     table.put_item(Item=converted_item)
 
 def update_item(table_name: str, primary_key_name: str, key: str, update_attributes: dict) -> dict:
-    item = get_item(table_name, primary_key_name, key)
-    item.update(update_attributes)
-    put_item(table_name, item)
-    return item
-    
+    """SET update_attributes on an existing item in one round trip. Returns the whole item after the update."""
+    return update_item_expression(table_name, primary_key_name, key, set_attributes=update_attributes, return_values="ALL_NEW")
+
+def build_update(
+        primary_key_name: str,
+        set_attributes: Optional[dict] = None,
+        append_attributes: Optional[dict] = None,
+        remove_attributes: Optional[list[str]] = None,
+        expected_version: Optional[int] = None,
+        must_exist: bool = True,
+    ) -> dict:
+    """
+    UpdateItem parameters for a partial update.
+
+    :param set_attributes: Attributes to SET to a value
+    :param append_attributes: List attributes to extend (list_append; created if missing)
+    :param remove_attributes: Attributes to REMOVE
+    :param expected_version: Version the caller read (0 for an item without one). The write
+        only succeeds if it is still current, and stores expected_version + 1
+    :param must_exist: Fail instead of creating the item when it does not exist
+    :return: UpdateExpression, ConditionExpression and placeholder maps
+    """
+    names, values = {}, {}
+
+    def name(attribute: str) -> str:
+        placeholder = f"#a{len(names)}"
+        names[placeholder] = attribute
+        return placeholder
+
+    def value(attribute_value) -> str:
+        placeholder = f":v{len(values)}"
+        values[placeholder] = float_to_decimal(attribute_value)
+        return placeholder
+
+    sets = [f"{name(attribute)} = {value(attribute_value)}" for attribute, attribute_value in (set_attributes or {}).items()]
+    for attribute, items in (append_attributes or {}).items():
+        placeholder = name(attribute)
+        sets.append(f"{placeholder} = list_append(if_not_exists({placeholder}, {value([])}), {value(items)})")
+    removes = [name(attribute) for attribute in remove_attributes or []]
+
+    conditions = []
+    if must_exist:
+        conditions.append(f"attribute_exists({name(primary_key_name)})")
+    if expected_version is not None:
+        version = name(VERSION_ATTRIBUTE)
+        sets.append(f"{version} = {value(expected_version + 1)}")
+        conditions.append(f"attribute_not_exists({version})" if expected_version == 0 else f"{version} = {value(expected_version)}")
+
+    expression = []
+    if sets:
+        expression.append("SET " + ", ".join(sets))
+    if removes:
+        expression.append("REMOVE " + ", ".join(removes))
+    params = {"UpdateExpression": " ".join(expression), "ExpressionAttributeNames": names}
+    if values:
+        params["ExpressionAttributeValues"] = values
+    if conditions:
+        params["ConditionExpression"] = " AND ".join(conditions)
+    return params
 
+def _condition_failed(table_name: str, key: str, item: Optional[dict]) -> ConditionFailed:
+    if item is None:
+        return ConditionFailed(f"Item {key} in {table_name} does not exist", 404)
+    return ConditionFailed(f"Item {key} in {table_name} was changed by another writer", 409)
+
+@_timed("update_item")
+def update_item_expression(
+        table_name: str,
+        primary_key_name: str,
+        key: str,
+        set_attributes: Optional[dict] = None,
+        append_attributes: Optional[dict] = None,
+        remove_attributes: Optional[list[str]] = None,
+        expected_version: Optional[int] = None,
+        must_exist: bool = True,
+        return_values: str = "NONE",
+    ) -> Optional[dict]:
+    """
+    Partial update in one round trip, see build_update. Raises ConditionFailed
+    (409) if expected_version is no longer current, or (404) if the item is gone.
+
+    :return: The attributes asked for by return_values (e.g. "ALL_NEW"), or None
+    """
+    table = _get_table(table_name)
+    params = build_update(primary_key_name, set_attributes, append_attributes, remove_attributes, expected_version, must_exist)
+    try:
+        response = table.update_item(
+            Key={primary_key_name: key},
+            ReturnValues=return_values,
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            **params,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            raise _condition_failed(table_name, key, e.response.get("Item"))
+        raise
+    return response.get("Attributes")
+
+def _serialize(value: dict) -> dict:
+    return {attribute: _serializer.serialize(attribute_value) for attribute, attribute_value in float_to_decimal(value).items()}
+
+@_timed("transact_write_items")
+def transact_write_items(table_name: str, primary_key_name: str, key: str, update: dict, actions: list[dict]) -> None:
+    """
+    A conditional update (build_update parameters) of one item, plus Put/Delete actions
+    ({"Put": {"TableName", "Item"}} / {"Delete": {"TableName", "Key"}}) that only happen
+    if it succeeds. At most TRANSACT_MAX_ITEMS actions in all.
+    """
+    client = _get_resource().meta.client
+    update_action = {
+        "TableName": table_name,
+        "Key": _serialize({primary_key_name: key}),
+        "UpdateExpression": update["UpdateExpression"],
+        "ExpressionAttributeNames": update["ExpressionAttributeNames"],
+        "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+    }
+    if "ExpressionAttributeValues" in update:
+        update_action["ExpressionAttributeValues"] = _serialize(update["ExpressionAttributeValues"])
+    if "ConditionExpression" in update:
+        update_action["ConditionExpression"] = update["ConditionExpression"]
+
+    transact_items = [{"Update": update_action}]
+    for action in actions:
+        if "Put" in action:
+            transact_items.append({"Put": {"TableName": action["Put"]["TableName"], "Item": _serialize(action["Put"]["Item"])}})
+        else:
+            transact_items.append({"Delete": {"TableName": action["Delete"]["TableName"], "Key": _serialize(action["Delete"]["Key"])}})
+
+    try:
+        client.transact_write_items(TransactItems=transact_items)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "TransactionCanceledException":
+            raise
+        reasons = e.response.get("CancellationReasons", [])
+        if reasons and reasons[0].get("Code") == "ConditionalCheckFailed":
+            raise _condition_failed(table_name, key, reasons[0].get("Item"))
+        if any(reason.get("Code") == "TransactionConflict" for reason in reasons):
+            # Another transaction on the same item was in progress
+            raise ConditionFailed(f"Item {key} in {table_name} was changed by another writer", 409)
+        raise
+
+def merge_item_changes(base, ours, theirs):
+    """
+    Three-way merge for rebasing a write that lost a version race: the changes
+    ours made relative to base (what it read), applied on top of theirs (what
+    is stored now). Dicts merge per key and lists that both sides only appended
+    to keep both appends; anything else both sides changed takes ours.
+    """
+    if isinstance(base, dict) and isinstance(ours, dict) and isinstance(theirs, dict):
+        merged = dict(theirs)
+        for key in base.keys() | ours.keys():
+            if key not in ours:
+                merged.pop(key, None)
+            elif key not in base or ours[key] != base[key]:
+                merged[key] = merge_item_changes(base.get(key), ours[key], theirs[key]) if key in theirs else ours[key]
+        return merged
+    if isinstance(base, list) and isinstance(ours, list) and isinstance(theirs, list):
+        if ours[:len(base)] == base and theirs[:len(base)] == base:
+            return theirs + ours[len(base):]
+    return ours
+
+def retry_on_conflict(write: Callable[[], T], rebase: Callable[[], None], attempts: int = CONFLICT_RETRY_ATTEMPTS) -> T:
+    """
+    Run a versioned write; when another writer got there first (ConditionFailed 409),
+    call rebase to re-read and re-apply the change, then write again.
+    """
+    for attempt in range(attempts):
+        try:
+            return write()
+        except ConditionFailed as e:
+            if e.code != 409 or attempt == attempts - 1:
+                raise
+        time.sleep(random.uniform(0, CONFLICT_BACKOFF_SECONDS * 2 ** attempt))
+        rebase()
+
+async def aretry_on_conflict(write: Callable[[], Awaitable[T]], rebase: Callable[[], Awaitable[None]], attempts: int = CONFLICT_RETRY_ATTEMPTS) -> T:
+    for attempt in range(attempts):
+        try:
+            return await write()
+        except ConditionFailed as e:
+            if e.code != 409 or attempt == attempts - 1:
+                raise
+        await asyncio.sleep(random.uniform(0, CONFLICT_BACKOFF_SECONDS * 2 ** attempt))
+        await rebase()
+
+def diff_item(stored: dict, item: dict, primary_key_name: str) -> tuple[dict, list[str]]:
+    """Attributes to SET and to REMOVE to turn the stored item into item. The version attribute is left alone."""
+    skip = (primary_key_name, VERSION_ATTRIBUTE)
+    set_attributes = {attribute: value for attribute, value in item.items() if attribute not in skip and stored.get(attribute) != value}
+    remove_attributes = [attribute for attribute in stored if attribute not in item and attribute not in skip]
+    return set_attributes, remove_attributes
+
+def save_changes(table_name: str, primary_key_name: str, item: dict, stored: Optional[dict], append_attributes: Optional[dict] = None, actions: Optional[list[dict]] = None) -> dict:
+    """
+    Write item as a partial update of stored (the item as it was read), conditional on
+    the version that was read. Attributes in append_attributes (the new tail of a list
+    in item) are list_append-ed instead of SET; actions are Put/Delete actions written
+    in the same transaction. Without stored (never read) the item is written whole.
+
+    :return: The item as now stored, including its new version
+    Raises ConditionFailed if another writer saved since stored was read.
+    """
+    key = item[primary_key_name]
+    if stored is None:
+        written = dict(item, **{VERSION_ATTRIBUTE: 1})
+        if actions:
+            set_attributes = {attribute: value for attribute, value in written.items() if attribute != primary_key_name}
+            transact_write_items(table_name, primary_key_name, key, build_update(primary_key_name, set_attributes, must_exist=False), actions)
+        else:
+            put_item(table_name, written)
+        return written
+
+    expected_version = int(stored.get(VERSION_ATTRIBUTE, 0))
+    set_attributes, remove_attributes = diff_item(stored, item, primary_key_name)
+    for attribute in append_attributes or {}:
+        set_attributes.pop(attribute, None)
+    if actions:
+        update = build_update(primary_key_name, set_attributes, append_attributes, remove_attributes, expected_version)
+        transact_write_items(table_name, primary_key_name, key, update, actions)
+    else:
+        update_item_expression(table_name, primary_key_name, key, set_attributes, append_attributes, remove_attributes, expected_version)
+
+    return dict(item, **{VERSION_ATTRIBUTE: expected_version + 1})
+
+@_timed("batch_write")
+def put_items(table_name: str, items: list[dict]) -> None:
+    """Write many items; batch_writer chunks them into BatchWriteItem calls and resends unprocessed ones."""
+    table = _get_table(table_name)
+    with table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=float_to_decimal(item))
+
+def _not_newer(version_attribute: str, version: int) -> dict:
+    """Condition parameters: no item, or one whose version_attribute is at most version."""
+    return {
+        "ConditionExpression": "attribute_not_exists(#v) OR #v <= :v",
+        "ExpressionAttributeNames": {"#v": version_attribute},
+        "ExpressionAttributeValues": {":v": version},
+    }
+
+@_timed("transact_write_items")
+def put_items_unless_newer(table_name: str, items: list[dict], version_attribute: str, version: int) -> None:
+    """
+    Write many items, none over an item whose version_attribute is above version, in
+    TransactWriteItems chunks (BatchWriteItem takes no conditions). Raises ConditionFailed
+    at the first chunk that meets one; the chunks before it stay written.
+    """
+    client = _get_resource().meta.client
+    condition = _not_newer(version_attribute, version)
+    condition["ExpressionAttributeValues"] = _serialize(condition["ExpressionAttributeValues"])
+    for start in range(0, len(items), TRANSACT_MAX_ITEMS):
+        chunk = items[start:start + TRANSACT_MAX_ITEMS]
+        try:
+            client.transact_write_items(TransactItems=[{"Put": {"TableName": table_name, "Item": _serialize(item), **condition}} for item in chunk])
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            reasons = e.response.get("CancellationReasons", [])
+            if any(reason.get("Code") in ("ConditionalCheckFailed", "TransactionConflict") for reason in reasons):
+                raise ConditionFailed(f"Items in {table_name} were written by a newer save", 409)
+            raise
+
+@_timed("batch_write")
+def delete_items(table_name: str, keys: list[dict]) -> None:
+    """Delete many items by full key (partition and sort key)."""
+    table = _get_table(table_name)
+    with table.batch_writer() as batch:
+        for key in keys:
+            batch.delete_item(Key=key)
+
+@_timed("delete_item")
+def delete_items_unless_newer(table_name: str, keys: list[dict], version_attribute: str, version: int) -> None:
+    """Delete many items by full key, keeping those whose version_attribute is above version."""
+    table = _get_table(table_name)
+    for key in keys:
+        try:
+            table.delete_item(Key=key, **_not_newer(version_attribute, version))
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+@_timed("query")
+def get_all_items_by_key(table_name: str, key_name: str, key_value: str) -> list[dict]:
+    """
+    Query every item in one partition of the table itself (not an index), in sort key order.
+
+    :param table_name: Name of the DynamoDB table
+    :param key_name: Partition key name of the table
+    :param key_value: Partition key value to query
+    :return: List of items, following LastEvaluatedKey until the partition is exhausted
+    """
+    table = _get_table(table_name)
+    items = []
+    query_params = {"KeyConditionExpression": Key(key_name).eq(key_value)}
+
+    while True:
+        response = table.query(**query_params)
+        items.extend(response.get("Items", []))
+
+        if "LastEvaluatedKey" in response:
+            query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        else:
+            break
+
+    return items
+
+@_timed("delete_item")
 def delete_item(table_name: str, primary_key_name: str, key: str) -> None:
     table = _get_table(table_name)
     table.delete_item(Key={primary_key_name: key})
 
+@_timed("query")
 def get_all_items_by_index(table_name: str, index_key: str, key_value: str) -> list[dict]:
     """
     Query items by an index, assuming the index name matches the index key.
@@ -92,6 +585,7 @@ def get_all_items_by_index(table_name: str, index_key: str, key_value: str) -> l
 
     return items
 
+@_timed("query")
 def get_items_by_index_range(
     table_name: str,
     index_name: str,
@@ -135,6 +629,7 @@ def get_items_by_index_range(
 
     return items
 
+@_timed("query")
 def get_latest_items_by_index(
     table_name: str,
     index_name: str,
@@ -162,3 +657,110 @@ def get_latest_items_by_index(
     )
 
     return response.get("Items", [])
+
+
+# -- Async variants: same arguments, run on the bounded pool. Module functions
+# are looked up at call time, so the backend picked by use_backend (or anything
+# else that swaps them, like tests) applies to both.
+
+async def aget_item(table_name: str, primary_key_name: str, key: str) -> dict:
+    return await run_in_pool(lambda: get_item(table_name, primary_key_name, key))
+
+async def aget_item_attributes(table_name: str, primary_key_name: str, key: str, attributes: list[str]) -> Optional[dict]:
+    return await run_in_pool(lambda: get_item_attributes(table_name, primary_key_name, key, attributes))
+
+async def aget_items_by_scan(table_name: str, primary_key_name: str, keys: list[str]) -> list[dict]:
+    return await run_in_pool(lambda: get_items_by_scan(table_name, primary_key_name, keys))
+
+async def abatch_get_items(table_name: str, primary_key_name: str, keys: list[str]) -> list[dict]:
+    """batch_get_items with every 100-key chunk dispatched to the pool concurrently."""
+    chunks = _batch_get_chunks(keys)
+    results = await asyncio.gather(*(run_in_pool(_batch_get_chunk, table_name, primary_key_name, chunk) for chunk in chunks))
+    return _in_key_order([item for chunk_items in results for item in chunk_items], primary_key_name, keys)
+
+async def aput_item(table_name: str, item: dict) -> None:
+    return await run_in_pool(lambda: put_item(table_name, item))
+
+async def aupdate_item(table_name: str, primary_key_name: str, key: str, update_attributes: dict) -> dict:
+    return await run_in_pool(lambda: update_item(table_name, primary_key_name, key, update_attributes))
+
+async def aupdate_item_expression(table_name: str, primary_key_name: str, key: str, **kwargs) -> Optional[dict]:
+    return await run_in_pool(lambda: update_item_expression(table_name, primary_key_name, key, **kwargs))
+
+async def asave_changes(table_name: str, primary_key_name: str, item: dict, stored: Optional[dict], append_attributes: Optional[dict] = None, actions: Optional[list[dict]] = None) -> dict:
+    return await run_in_pool(lambda: save_changes(table_name, primary_key_name, item, stored, append_attributes, actions))
+
+async def aput_items(table_name: str, items: list[dict]) -> None:
+    return await run_in_pool(lambda: put_items(table_name, items))
+
+async def adelete_items(table_name: str, keys: list[dict]) -> None:
+    return await run_in_pool(lambda: delete_items(table_name, keys))
+
+async def aget_all_items_by_key(table_name: str, key_name: str, key_value: str) -> list[dict]:
+    return await run_in_pool(lambda: get_all_items_by_key(table_name, key_name, key_value))
+
+async def adelete_item(table_name: str, primary_key_name: str, key: str) -> None:
+    return await run_in_pool(lambda: delete_item(table_name, primary_key_name, key))
+
+async def aget_all_items_by_index(table_name: str, index_key: str, key_value: str) -> list[dict]:
+    return await run_in_pool(lambda: get_all_items_by_index(table_name, index_key, key_value))
+
+async def aget_items_by_index_range(table_name: str, index_name: str, partition_key: str, partition_value: str, sort_key: str, sort_min, sort_max) -> list[dict]:
+    return await run_in_pool(lambda: get_items_by_index_range(table_name, index_name, partition_key, partition_value, sort_key, sort_min, sort_max))
+
+async def aget_latest_items_by_index(table_name: str, index_name: str, index_key: str, index_value: str, limit: int) -> list[dict]:
+    return await run_in_pool(lambda: get_latest_items_by_index(table_name, index_name, index_key, index_value, limit))
+
+
+# -- Storage backends --
+
+class DynamoDBStorage(StorageBackend):
+    """The boto3 functions above."""
+
+    name = "dynamodb"
+
+    get_item = staticmethod(get_item)
+    get_item_attributes = staticmethod(get_item_attributes)
+    get_items_by_scan = staticmethod(get_items_by_scan)
+    batch_get_items = staticmethod(batch_get_items)
+    get_all_items = staticmethod(get_all_items)
+    put_item = staticmethod(put_item)
+    put_items = staticmethod(put_items)
+    put_items_unless_newer = staticmethod(put_items_unless_newer)
+    update_item = staticmethod(update_item)
+    update_item_expression = staticmethod(update_item_expression)
+    save_changes = staticmethod(save_changes)
+    delete_item = staticmethod(delete_item)
+    delete_items = staticmethod(delete_items)
+    delete_items_unless_newer = staticmethod(delete_items_unless_newer)
+    get_all_items_by_key = staticmethod(get_all_items_by_key)
+    get_all_items_by_index = staticmethod(get_all_items_by_index)
+    get_items_by_index_range = staticmethod(get_items_by_index_range)
+    get_latest_items_by_index = staticmethod(get_latest_items_by_index)
+
+    def describe_table(self, table_name, partition_key, sort_key=None, indexes=None):
+        # DynamoDB has the schema already
+        pass
+
+
+BACKENDS = {"dynamodb": DynamoDBStorage, "memory": MemoryStorage}
+# "memory" runs everything in-process (lib/MemoryStorage.py), without AWS credentials or tables
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "dynamodb")
+BACKEND: StorageBackend = None
+
+
+def use_backend(backend: StorageBackend) -> None:
+    """
+    Send the module's storage functions (and so their async variants) to backend.
+    Models import the functions by name, so this only reaches them if it runs
+    before they are imported - as it does below, from STORAGE_BACKEND.
+    """
+    global BACKEND
+    BACKEND = backend
+    for operation in StorageBackend.OPERATIONS:
+        globals()[operation] = getattr(backend, operation)
+
+
+if STORAGE_BACKEND not in BACKENDS:
+    raise Exception(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND}, expected one of {', '.join(BACKENDS)}", 500)
+use_backend(BACKENDS[STORAGE_BACKEND]())
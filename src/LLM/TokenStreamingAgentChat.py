@@ -1,13 +1,15 @@
 from typing import List, Callable, Awaitable, Optional
 import json
+import time
 from LLM.AgentTool import AgentTool
 from LLM.ContentNormalizer import normalize_content
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, BaseMessage, ToolMessage, AIMessage
 from Models import DataWindow, JSONDocument
-from Tools.MemoryTools.helper_retrive_and_cache_doc import retrieve_and_cache_doc
+from Tools.MemoryTools.helper_retrive_and_cache_doc import aretrieve_and_cache_doc
 from AWS.APIGateway import default_type_error_handler
+from lib import Metrics
 
 
 class TokenStreamingAgentChat:
@@ -27,6 +29,7 @@ class TokenStreamingAgentChat:
         on_tool_response: Optional[Callable[[str, str, str], Awaitable[None]]] = None,
         on_response: Optional[Callable] = None,
         prompt_arg_names: List[str] = [],
+        model_id: Optional[str] = None,
     ):
         # Instance variables
         self.messages = messages
@@ -37,6 +40,8 @@ class TokenStreamingAgentChat:
         self.is_generating = False
         self.should_abort_invocation = False
         self.pending_client_side_tool_calls = None
+        # Built once so recording metrics doesn't allocate label tuples per call
+        self.metric_labels = (model_id or "unknown",)
 
         # Replace prompt arguments using explicit prompt_arg_names
         # Simple string find-and-replace - arg names can be any format (e.g., ARG_USER_NAME or {user_name})
@@ -92,14 +97,17 @@ class TokenStreamingAgentChat:
 
         # Refresh data windows if enabled
         if load_data_windows:
-            self._refresh_data_windows()
+            await self._refresh_data_windows()
 
         accumulated_response = None
+        model = self.metric_labels[0]
+        call_started = time.perf_counter()
 
         try:
             response_generator = self.prompt_chain.astream({"messages": self.messages})
         except Exception as e:
             self.is_generating = False
+            Metrics.LLM_CALLS.inc((model, "error"))
             raise
 
         chunk_count = 0
@@ -115,6 +123,9 @@ class TokenStreamingAgentChat:
             #     contain no user-facing text.
             if normalize_content(chunk.content):
 
+                first_token_at = time.perf_counter()
+                Metrics.LLM_TIME_TO_FIRST_TOKEN.observe(first_token_at - call_started, self.metric_labels)
+
                 on_response_cb = self.on_response
 
                 async def async_response_generator():
@@ -123,6 +134,7 @@ class TokenStreamingAgentChat:
 
                     first_text = normalize_content(chunk.content)
                     ai_message += first_text
+                    token_count = 1
                     yield first_text
 
                     async for res_chunk in response_generator:
@@ -132,14 +144,24 @@ class TokenStreamingAgentChat:
                         chunk_text = normalize_content(res_chunk.content)
                         if chunk_text:
                             ai_message += chunk_text
+                            token_count += 1
                             yield chunk_text
 
                     self.is_generating = False
 
+                    # Recorded once per call - a plain int while streaming
+                    stream_seconds = time.perf_counter() - first_token_at
+                    Metrics.LLM_TOKENS.inc(self.metric_labels, token_count)
+                    if stream_seconds > 0 and token_count > 1:
+                        Metrics.LLM_TOKENS_PER_SECOND.observe((token_count - 1) / stream_seconds, self.metric_labels)
+
                     if self.should_abort_invocation:
                         self.should_abort_invocation = False
+                        Metrics.LLM_CALLS.inc((model, "aborted"))
                         return
 
+                    Metrics.LLM_CALLS.inc((model, "tool_calls" if accumulated_response.tool_calls else "text"))
+
                     if on_response_cb:
                         on_response_cb(accumulated_response)
 
@@ -171,6 +193,7 @@ class TokenStreamingAgentChat:
 
         except Exception as e:
             self.is_generating = False
+            Metrics.LLM_CALLS.inc((model, "error"))
             raise
 
         # 2.) Tool Section - No text content was streamed.
@@ -180,8 +203,10 @@ class TokenStreamingAgentChat:
 
         if not accumulated_response or not accumulated_response.tool_calls:
             self.is_generating = False
+            Metrics.LLM_CALLS.inc((model, "empty"))
             return None
 
+        Metrics.LLM_CALLS.inc((model, "tool_calls"))
         if self.on_response:
             self.on_response(accumulated_response)
 
@@ -229,7 +254,14 @@ class TokenStreamingAgentChat:
                 if tool.pass_context:
                     params['context'] = self.context
 
-                tool_response = await tool.function(**params)
+                tool_started = time.perf_counter()
+                try:
+                    tool_response = await tool.function(**params)
+                except Exception:
+                    Metrics.TOOL_ERRORS.inc((tool_call_name,))
+                    raise
+                finally:
+                    Metrics.TOOL_DURATION.observe(time.perf_counter() - tool_started, (tool_call_name,))
 
                 if self.on_tool_response:
                     await self.on_tool_response(
@@ -291,7 +323,7 @@ class TokenStreamingAgentChat:
     # -- Refresh Data Windows -- #
     #                            #
     ##############################
-    def _refresh_data_windows(self):
+    async def _refresh_data_windows(self):
         """
         Refresh all DataWindow and MemoryWindow tool messages with the latest data.
         Scans through messages to find open_data_window and open_memory_window tool calls 
@@ -331,7 +363,7 @@ class TokenStreamingAgentChat:
         # Fetch and update DataWindows
         for tool_call_id, (msg_index, data_window_id) in datawindow_mapping.items():
             try:
-                data_window = DataWindow.get_data_window(data_window_id)
+                data_window = await DataWindow.aget_data_window(data_window_id)
                 self.messages[msg_index].content = data_window.data
             except Exception as e:
                 self.messages[msg_index].content = f"Error refreshing DataWindow: {e}"
@@ -340,7 +372,7 @@ class TokenStreamingAgentChat:
         for tool_call_id, (msg_index, document_id, path) in memorywindow_mapping.items():
             try:
                 # Get document (checks cache first, then fetches from DB)
-                memory_document = retrieve_and_cache_doc(document_id, self.context)
+                memory_document = await aretrieve_and_cache_doc(document_id, self.context)
                 
                 # Resolve path if specified
                 if path:
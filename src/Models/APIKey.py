@@ -2,7 +2,7 @@ import os
 from datetime import datetime, timedelta
 from typing import Optional
 import uuid
-from AWS.DynamoDB import get_item, put_item, delete_item
+from AWS.DynamoDB import get_item, put_item, delete_item, aget_item
 from pydantic import BaseModel
 from lib.JWT import generate_jwt, validate_jwt, extract_jwt_contents
 
@@ -134,6 +134,40 @@ def validate_api_key(token: str) -> bool:
     except Exception:
         return False
 
+def get_signed_api_key_contents(token: str) -> Optional[dict]:
+    """
+    The contents of a token we signed that hasn't expired, without the database
+    check that the key is still valid - see ais_api_key_active.
+    """
+    if not validate_jwt(JWT_SECRET, token):
+        return None
+    try:
+        contents = extract_jwt_contents(JWT_SECRET, token)
+    except Exception:
+        return None
+    return contents if contents.get("api_key_id") else None
+
+async def ais_api_key_active(api_key_id: str) -> bool:
+    """Whether the key exists in DB with valid=True."""
+    try:
+        item = await aget_item(API_KEYS_TABLE_NAME, API_KEYS_PRIMARY_KEY, api_key_id)
+        return bool(item) and APIKey(**item).valid
+    except Exception:
+        return False
+
+async def aget_valid_api_key_contents(token: str) -> Optional[dict]:
+    """
+    Async validate_api_key + get_api_key_contents in one read.
+    Returns the token contents, or None if it isn't a valid API key.
+    """
+    contents = get_signed_api_key_contents(token)
+    if contents is None or not await ais_api_key_active(contents["api_key_id"]):
+        return None
+    return contents
+
+async def avalidate_api_key(token: str) -> bool:
+    return await aget_valid_api_key_contents(token) is not None
+
 def get_api_key_contents(token: str) -> dict:
     """
     Extract and return the contents of a valid API key token.
@@ -153,6 +187,12 @@ def get_api_key(api_key_id: str) -> APIKey:
         raise Exception(f"APIKey with id: {api_key_id} does not exist", 404)
     return APIKey(**item)
 
+async def aget_api_key(api_key_id: str) -> APIKey:
+    item = await aget_item(API_KEYS_TABLE_NAME, API_KEYS_PRIMARY_KEY, api_key_id)
+    if item is None:
+        raise Exception(f"APIKey with id: {api_key_id} does not exist", 404)
+    return APIKey(**item)
+
 def revoke_api_key(api_key_id: str) -> APIKey:
     """
     Revoke an API key by setting valid=False.
@@ -1,8 +1,9 @@
 import os
 from datetime import datetime
 import uuid
-from AWS.DynamoDB import get_item, get_items_by_scan, put_item, delete_item, get_all_items_by_index
+from AWS.DynamoDB import get_item, batch_get_items, put_item, delete_item, get_all_items_by_index, aget_item
 from AWS.CloudWatchLogs import get_logger
+from lib.ReadThroughCache import ReadThroughCache
 from pydantic import BaseModel
 from typing import Optional
 from Models import User, Tool
@@ -12,6 +13,8 @@ logger = get_logger(log_level=os.environ["LOG_LEVEL"])
 
 AGENTS_TABLE_NAME = os.environ["AGENTS_TABLE_NAME"]
 AGENTS_PRIMARY_KEY = os.environ["AGENTS_PRIMARY_KEY"]
+# get_agent/aget_agent are served from here; 0 disables caching
+AGENT_CACHE = ReadThroughCache("agent", float(os.environ.get("AGENT_CACHE_TTL_SECONDS", "60")))
 
 class Agent(BaseModel):
     agent_id: str
@@ -102,21 +105,42 @@ def create_agent(
     put_item(AGENTS_TABLE_NAME, agentData)
     return agent
 
-def get_agent(agent_id: str) -> Agent:
+def load_agent(agent_id: str) -> Optional[Agent]:
     item = get_item(AGENTS_TABLE_NAME, AGENTS_PRIMARY_KEY, agent_id)
-    if item is None:
+    return Agent(**item) if item is not None else None
+
+async def aload_agent(agent_id: str) -> Optional[Agent]:
+    item = await aget_item(AGENTS_TABLE_NAME, AGENTS_PRIMARY_KEY, agent_id)
+    return Agent(**item) if item is not None else None
+
+def get_agent(agent_id: str) -> Agent:
+    agent = AGENT_CACHE.get(agent_id, lambda: load_agent(agent_id))
+    if agent is None:
         raise Exception(f"Agent with id: {agent_id} does not exist", 404)
-    return Agent(**item)
+    return agent
+
+async def aget_agent(agent_id: str) -> Agent:
+    agent = await AGENT_CACHE.aget(agent_id, lambda: aload_agent(agent_id))
+    if agent is None:
+        raise Exception(f"Agent with id: {agent_id} does not exist", 404)
+    return agent
 
 def save_agent(agent: Agent) -> None:
     agent.updated_at = int(datetime.timestamp(datetime.now()))
     put_item(AGENTS_TABLE_NAME, agent.model_dump())
+    AGENT_CACHE.invalidate_everywhere(agent.agent_id, agent.updated_at)
 
 def delete_agent(agent_id: str) -> None:
     delete_item(AGENTS_TABLE_NAME, AGENTS_PRIMARY_KEY, agent_id)
+    AGENT_CACHE.invalidate_everywhere(agent_id)
 
 def get_agent_for_user(agent_id: str, user: User.User) -> Agent:
-    agent = get_agent(agent_id)
+    return check_agent_access(get_agent(agent_id), user)
+
+async def aget_agent_for_user(agent_id: str, user: User.User) -> Agent:
+    return check_agent_access(await aget_agent(agent_id), user)
+
+def check_agent_access(agent: Agent, user: User.User) -> Agent:
     if (agent.is_public):
         return agent
     if (agent.org_id == "default"):
@@ -135,7 +159,7 @@ def parse_agent_items(items: list[dict]) -> list[Agent]:
     return agents
 
 def get_agents_from_ids(agent_ids: list[str]) -> list[Agent]:
-    items = get_items_by_scan(AGENTS_TABLE_NAME, AGENTS_PRIMARY_KEY, agent_ids)
+    items = batch_get_items(AGENTS_TABLE_NAME, AGENTS_PRIMARY_KEY, agent_ids)
     return parse_agent_items(items)
 
 def get_agents_in_org(org_id: str) -> list[Agent]:
@@ -1,9 +1,14 @@
+import copy
 import os
 from datetime import datetime
 import uuid
-from AWS.DynamoDB import get_item, put_item, get_all_items_by_index, delete_item, get_latest_items_by_index
+from AWS.DynamoDB import get_item, get_all_items_by_index, delete_item, get_latest_items_by_index, aget_item, aget_item_attributes, describe_table
+from AWS.DynamoDB import delete_items, get_all_items_by_key, aget_all_items_by_key, run_in_pool, update_item_expression
+from AWS.DynamoDB import put_items_unless_newer, delete_items_unless_newer, ConditionFailed
+from AWS.DynamoDB import save_changes, merge_item_changes, retry_on_conflict, aretry_on_conflict, VERSION_ATTRIBUTE, TRANSACT_MAX_ITEMS
 from AWS.CloudWatchLogs import get_logger
-from pydantic import BaseModel, Field
+from lib.MessageCompression import encode_message, encode_messages, decode_message, decode_messages
+from pydantic import BaseModel, Field, PrivateAttr
 from typing import List, Optional, Union
 from Models import Agent, Tool
 from langchain_core.messages import AIMessage, ToolMessage, SystemMessage, HumanMessage
@@ -14,6 +19,22 @@ logger = get_logger(log_level=os.environ["LOG_LEVEL"])
 
 CONTEXTS_TABLE_NAME = os.environ["CONTEXTS_TABLE_NAME"]
 CONTEXTS_PRIMARY_KEY = os.environ["CONTEXTS_PRIMARY_KEY"]
+# Optional: one item per message, keyed by (context_id, seq). The context item becomes a
+# small header and a turn writes only its new messages. Unset keeps messages inline.
+CONTEXT_MESSAGES_TABLE_NAME = os.environ.get("CONTEXT_MESSAGES_TABLE_NAME")
+MESSAGES_PARTITION_KEY = "context_id"
+MESSAGES_SORT_KEY = "seq"
+# Marks a header item. Message items at seq >= message_count are leftovers of an interrupted write.
+MESSAGE_COUNT_ATTRIBUTE = "message_count"
+# On message items: the header version of the save that wrote them
+WRITTEN_VERSION_ATTRIBUTE = "written_version"
+# On header items: the last message's content, for listings that don't load the messages
+LAST_MESSAGE_ATTRIBUTE = "last_message"
+HEADER_ATTRIBUTES = ("messages", MESSAGE_COUNT_ATTRIBUTE, LAST_MESSAGE_ATTRIBUTE)
+USER_UPDATED_AT_INDEX = "user_id-updated_at-index"
+describe_table(CONTEXTS_TABLE_NAME, CONTEXTS_PRIMARY_KEY, indexes={USER_UPDATED_AT_INDEX: ("user_id", "updated_at")})
+if CONTEXT_MESSAGES_TABLE_NAME:
+    describe_table(CONTEXT_MESSAGES_TABLE_NAME, MESSAGES_PARTITION_KEY, MESSAGES_SORT_KEY)
 
 class Context(BaseModel):
     context_id: str
@@ -29,6 +50,13 @@ class Context(BaseModel):
     model_id: Optional[str] = None
     client_id: Optional[str] = None
     expires_at: Optional[int] = None
+    # Optimistic locking: saves require the version that was read, see save_context
+    version: Optional[int] = None
+    # The context item and messages as last read or written (None: never stored)
+    _stored_item: Optional[dict] = PrivateAttr(default=None)
+    _stored_messages: Optional[list[dict]] = PrivateAttr(default=None)
+    # From the header, when the messages were not loaded (see get_contexts_by_user_id)
+    _last_message: Optional[str] = PrivateAttr(default=None)
 
 class InitializeTool(BaseModel):
     tool_id: str
@@ -195,16 +223,197 @@ def create_context(
         
         context.messages = base_messages_to_dict_messages(initialization_messages)
 
-    put_item(CONTEXTS_TABLE_NAME, context.model_dump(exclude_none=True))
+    save_context(context)
     return context
 
 
+def is_header(item: dict) -> bool:
+    """Whether a contexts table item keeps its messages in the messages table."""
+    return MESSAGE_COUNT_ATTRIBUTE in item
+
+def messages_table(context_id: str) -> str:
+    if not CONTEXT_MESSAGES_TABLE_NAME:
+        raise Exception(f"Context {context_id} stores its messages in a separate table but CONTEXT_MESSAGES_TABLE_NAME is not set", 500)
+    return CONTEXT_MESSAGES_TABLE_NAME
+
+def remember_stored(context: Context, item: dict, messages: list[dict]) -> None:
+    """
+    Record what is stored now, which the next save diffs against and a rebase merges from.
+    The item keeps its messages in stored form (see MessageCompression); messages are the
+    same, decoded.
+    """
+    stored = copy.deepcopy({key: value for key, value in item.items() if key != "messages"})
+    if "messages" in item:
+        stored["messages"] = list(item["messages"])
+    context._stored_item = stored
+    context._stored_messages = list(messages)
+    context.version = int(item[VERSION_ATTRIBUTE]) if VERSION_ATTRIBUTE in item else None
+
+def context_from_item(item: dict, messages: list[dict]) -> Context:
+    attributes = {key: value for key, value in item.items() if key not in HEADER_ATTRIBUTES}
+    context = Context(**attributes, messages=messages)
+    remember_stored(context, item, messages)
+    return context
+
+def context_from_items(item: dict, message_items: list[dict]) -> Context:
+    """Build a Context from its header and message items (in seq order)."""
+    count = int(item[MESSAGE_COUNT_ATTRIBUTE])
+    messages = [decode_message(message_item["message"]) for message_item in message_items if message_item[MESSAGES_SORT_KEY] < count]
+    if len(messages) != count:
+        logger.error(f"Context {item[CONTEXTS_PRIMARY_KEY]} has {len(messages)} of {count} messages")
+    return context_from_item(item, messages)
+
+def common_prefix_length(stored_messages: list[dict], messages: list[dict]) -> int:
+    """How many messages from the start are unchanged since they were stored."""
+    length = 0
+    while length < min(len(stored_messages), len(messages)) and stored_messages[length] == messages[length]:
+        length += 1
+    return length
+
+def plan_context_write(context: Context) -> tuple[dict, dict, list[dict], list[dict], list[dict]]:
+    """
+    What saving the context writes, from its current state: the context item, attributes
+    to list_append instead of rewrite, message items to put, message keys to delete, and
+    the messages as they will be stored.
+
+    Inline, a turn that only added messages appends them to the stored list. With the
+    messages table, only messages after the first one that differs from what is stored
+    there are written - one or two items for a normal turn. A context read in the inline
+    layout writes all of its messages, which migrates it. Only the messages written are
+    encoded (compressed if large); the stored ones before them are kept as stored.
+    """
+    # exclude_none avoids sending NULL for GSI-indexed attrs (client_id).
+    item = context.model_dump(exclude_none=True)
+    item.pop(VERSION_ATTRIBUTE, None)
+    messages = item["messages"]
+    stored = context._stored_item
+    stored_messages = context._stored_messages or []
+
+    if not CONTEXT_MESSAGES_TABLE_NAME:
+        inline = stored is not None and "messages" in stored
+        start = common_prefix_length(stored_messages, messages) if inline else 0
+        item["messages"] = (stored["messages"][:start] if start else []) + encode_messages(messages[start:])
+        append_attributes = {}
+        if inline and start == len(stored_messages) < len(messages):
+            append_attributes["messages"] = item["messages"][start:]
+        return item, append_attributes, [], [], messages
+
+    del item["messages"]
+    in_table = stored_messages if stored is not None and is_header(stored) else []
+    start = common_prefix_length(in_table, messages)
+    written_version = int(stored.get(VERSION_ATTRIBUTE, 0)) + 1 if stored is not None else 1
+    message_items = [
+        {
+            MESSAGES_PARTITION_KEY: context.context_id,
+            MESSAGES_SORT_KEY: seq,
+            "message": encode_message(messages[seq]),
+            WRITTEN_VERSION_ATTRIBUTE: written_version,
+        }
+        for seq in range(start, len(messages))
+    ]
+    stale_keys = [
+        {MESSAGES_PARTITION_KEY: context.context_id, MESSAGES_SORT_KEY: seq}
+        for seq in range(len(messages), len(in_table))
+    ]
+    item[MESSAGE_COUNT_ATTRIBUTE] = len(messages)
+    item[LAST_MESSAGE_ATTRIBUTE] = messages[-1]["content"] if messages else ""
+    return item, {}, message_items, stale_keys, messages
+
+def write_context(item: dict, stored: Optional[dict], append_attributes: dict, message_items: list[dict], stale_keys: list[dict]) -> dict:
+    """
+    Write a planned save, conditional on the version that was read. Returns the context
+    item as now stored. Raises ConditionFailed if another writer saved first.
+    """
+    actions = [{"Put": {"TableName": CONTEXT_MESSAGES_TABLE_NAME, "Item": message_item}} for message_item in message_items]
+    actions += [{"Delete": {"TableName": CONTEXT_MESSAGES_TABLE_NAME, "Key": key}} for key in stale_keys]
+    if len(actions) < TRANSACT_MAX_ITEMS:
+        # Message items only land if the header's version check passes
+        return save_changes(CONTEXTS_TABLE_NAME, CONTEXTS_PRIMARY_KEY, item, stored, append_attributes, actions)
+
+    # Too many for one transaction (migrating or rewriting a long conversation). Messages the
+    # stored header doesn't count yet are invisible, so they can go first - as long as no
+    # newer save wrote them. Counted ones are only rewritten with the header's version check,
+    # and the surplus of a shorter history goes after it, unless a newer save reused it.
+    count = int(stored[MESSAGE_COUNT_ATTRIBUTE]) if stored is not None and is_header(stored) else 0
+    rewritten = [message_item for message_item in message_items if message_item[MESSAGES_SORT_KEY] < count]
+    added = [message_item for message_item in message_items if message_item[MESSAGES_SORT_KEY] >= count]
+    if len(rewritten) >= TRANSACT_MAX_ITEMS:
+        raise Exception(f"Context {item[CONTEXTS_PRIMARY_KEY]} rewrites {len(rewritten)} stored messages in one save, at most {TRANSACT_MAX_ITEMS - 1} can be", 413)
+    stored_version = int(stored.get(VERSION_ATTRIBUTE, 0)) if stored is not None else 0
+    try:
+        put_items_unless_newer(CONTEXT_MESSAGES_TABLE_NAME, added, WRITTEN_VERSION_ATTRIBUTE, stored_version)
+    except ConditionFailed:
+        # A newer save wrote them, or an interrupted one at this version did. Moving the header
+        # on makes the latter's items leftovers the retry may write over; after the former it
+        # fails like the header write would.
+        if stored is not None:
+            update_item_expression(CONTEXTS_TABLE_NAME, CONTEXTS_PRIMARY_KEY, item[CONTEXTS_PRIMARY_KEY], expected_version=stored_version)
+        raise
+    actions = [{"Put": {"TableName": CONTEXT_MESSAGES_TABLE_NAME, "Item": message_item}} for message_item in rewritten]
+    written = save_changes(CONTEXTS_TABLE_NAME, CONTEXTS_PRIMARY_KEY, item, stored, append_attributes, actions)
+    delete_items_unless_newer(CONTEXT_MESSAGES_TABLE_NAME, stale_keys, WRITTEN_VERSION_ATTRIBUTE, written[VERSION_ATTRIBUTE])
+    return written
+
+def rebase_context(context: Context, latest: Context) -> None:
+    """
+    Re-apply the unsaved changes in context on top of latest, after another writer saved
+    first. Fields merge per key; messages both sides only appended to keep both appends.
+    """
+    skip = (*HEADER_ATTRIBUTES, VERSION_ATTRIBUTE)
+    base = {key: value for key, value in (context._stored_item or {}).items() if key not in skip}
+    ours = context.model_dump(exclude_none=True, exclude=set(skip))
+    theirs = latest.model_dump(exclude_none=True, exclude=set(skip))
+    merged = merge_item_changes(base, ours, theirs)
+
+    base_messages = context._stored_messages or []
+    if context.messages != base_messages and latest.messages != base_messages:
+        both_appended = context.messages[:len(base_messages)] == base_messages and latest.messages[:len(base_messages)] == base_messages
+        if not both_appended:
+            logger.warning(f"Context {context.context_id} history was rewritten while another writer added to it; keeping this writer's history")
+    messages = merge_item_changes(base_messages, context.messages, latest.messages)
+
+    for field in Context.model_fields:
+        if field not in skip:
+            setattr(context, field, merged.get(field))
+    context.messages = messages
+    context.version = latest.version
+    context._stored_item = latest._stored_item
+    context._stored_messages = latest._stored_messages
+
+def save_context_once(context: Context) -> None:
+    item, append_attributes, message_items, stale_keys, messages = plan_context_write(context)
+    written = write_context(item, context._stored_item, append_attributes, message_items, stale_keys)
+    remember_stored(context, written, messages)
+
 def get_context(context_id: str) -> Context:
     item = get_item(CONTEXTS_TABLE_NAME, CONTEXTS_PRIMARY_KEY, context_id)
     if item is None:
         raise Exception(f"Context with id: {context_id} does not exist", 404)
-    return Context(**item)
+    if not is_header(item):
+        return context_from_item(item, decode_messages(item["messages"]))
+    return context_from_items(item, get_all_items_by_key(messages_table(context_id), MESSAGES_PARTITION_KEY, context_id))
     
+async def aget_context(context_id: str) -> Context:
+    item = await aget_item(CONTEXTS_TABLE_NAME, CONTEXTS_PRIMARY_KEY, context_id)
+    if item is None:
+        raise Exception(f"Context with id: {context_id} does not exist", 404)
+    if not is_header(item):
+        return context_from_item(item, decode_messages(item["messages"]))
+    return context_from_items(item, await aget_all_items_by_key(messages_table(context_id), MESSAGES_PARTITION_KEY, context_id))
+
+async def ais_context_current(context: Context) -> bool:
+    """
+    Whether the stored context is still the one this copy was last read or saved as.
+    Reads only the version (updated_at for items saved before versioning), not the
+    conversation, so checking before every turn costs one small read.
+    """
+    item = await aget_item_attributes(CONTEXTS_TABLE_NAME, CONTEXTS_PRIMARY_KEY, context.context_id, [VERSION_ATTRIBUTE, "updated_at"])
+    if item is None:
+        return False
+    if context.version is not None or VERSION_ATTRIBUTE in item:
+        return item.get(VERSION_ATTRIBUTE) == context.version
+    return item.get("updated_at") == context.updated_at
+
 def get_context_for_user(context_id: str, user_id: str) -> Context:
     context = get_context(context_id)
     if (context.user_id == "public"):
@@ -220,22 +429,58 @@ def get_public_context(context_id: str) -> Context:
     raise Exception(f"Context is not public", 403)
 
 def save_context(context: Context) -> None:
+    """Save what changed since the context was read. If another connection saved in between, merge and retry."""
     context.updated_at = int(datetime.timestamp(datetime.now()))
-    # exclude_none avoids sending NULL for GSI-indexed attrs (client_id).
-    put_item(CONTEXTS_TABLE_NAME, context.model_dump(exclude_none=True))
+    retry_on_conflict(
+        lambda: save_context_once(context),
+        lambda: rebase_context(context, get_context(context.context_id)),
+    )
+
+async def asave_context(context: Context) -> None:
+    context.updated_at = int(datetime.timestamp(datetime.now()))
+
+    async def write():
+        # Planned on the loop, so the write is a snapshot of the context as of this call
+        item, append_attributes, message_items, stale_keys, messages = plan_context_write(context)
+        written = await run_in_pool(write_context, item, context._stored_item, append_attributes, message_items, stale_keys)
+        remember_stored(context, written, messages)
+
+    async def rebase():
+        rebase_context(context, await aget_context(context.context_id))
+
+    await aretry_on_conflict(write, rebase)
+
+def migrate_context(context_id: str) -> bool:
+    """Move an inline-messages context to the messages table. Returns False if there was nothing to do."""
+    if not CONTEXT_MESSAGES_TABLE_NAME:
+        return False
+    context = get_context(context_id)
+    if is_header(context._stored_item):
+        return False
+    save_context_once(context)
+    return True
 
 def get_contexts_by_user_id(user_id: str) -> list[Context]:
-    items = get_latest_items_by_index(CONTEXTS_TABLE_NAME, "user_id-updated_at-index", "user_id", user_id, 50)
+    items = get_latest_items_by_index(CONTEXTS_TABLE_NAME, USER_UPDATED_AT_INDEX, "user_id", user_id, 50)
     contexts = []
     for item in items:
         try:
-            contexts.append(Context(**item))
+            # Listing reads headers only; their messages are not loaded
+            context = Context(**{**item, "messages": decode_messages(item.get("messages", []))})
+            context._last_message = item.get(LAST_MESSAGE_ATTRIBUTE)
+            contexts.append(context)
         except Exception as e:
             logger.error(f"Error parsing context: {item}")
     return contexts
 
 def delete_context(context_id: str) -> None:
     delete_item(CONTEXTS_TABLE_NAME, CONTEXTS_PRIMARY_KEY, context_id)
+    if CONTEXT_MESSAGES_TABLE_NAME:
+        message_items = get_all_items_by_key(CONTEXT_MESSAGES_TABLE_NAME, MESSAGES_PARTITION_KEY, context_id)
+        delete_items(CONTEXT_MESSAGES_TABLE_NAME, [
+            {MESSAGES_PARTITION_KEY: context_id, MESSAGES_SORT_KEY: message_item[MESSAGES_SORT_KEY]}
+            for message_item in message_items
+        ])
 
 def delete_all_contexts_for_user(user_id: str) -> None:
     contexts = get_contexts_by_user_id(user_id)
@@ -260,7 +505,7 @@ def transform_to_history_context(context: Context, agent: Agent.Agent) -> Histor
     return HistoryContext(**{
         "context_id": context.context_id,
         "user_id": context.user_id,
-        "last_message": context.messages[-1]["content"] if len(context.messages) > 0 else "",
+        "last_message": context.messages[-1]["content"] if len(context.messages) > 0 else context._last_message or "",
         "created_at": context.created_at,
         "updated_at": context.updated_at,
         "agent": Agent.transform_to_history_agent(agent)
@@ -447,6 +692,18 @@ def add_async_tool_response(context: Context, tool_call_id: str, response: str)
     """
     Add an async tool response to the queue, replacing any existing response with the same tool_call_id.
     """
+    queue_async_tool_response(context, tool_call_id, response)
+    save_context(context)
+    return context
+
+
+async def aadd_async_tool_response(context: Context, tool_call_id: str, response: str) -> Context:
+    queue_async_tool_response(context, tool_call_id, response)
+    await asave_context(context)
+    return context
+
+
+def queue_async_tool_response(context: Context, tool_call_id: str, response: str) -> None:
     if not context.async_tool_response_queue:
         context.async_tool_response_queue = []
     
@@ -462,11 +719,6 @@ def add_async_tool_response(context: Context, tool_call_id: str, response: str)
         "response": response
     })
 
-    # Save the context
-    save_context(context)
-    
-    return context
-
 
 def process_async_tool_response_queue(context: Context) -> Context:
     """
@@ -477,7 +729,21 @@ def process_async_tool_response_queue(context: Context) -> Context:
     """
     if not context.async_tool_response_queue or len(context.async_tool_response_queue) == 0:
         return context
-    
+    apply_async_tool_responses(context)
+    save_context(context)
+    return context
+
+
+async def aprocess_async_tool_response_queue(context: Context) -> Context:
+    if not context.async_tool_response_queue or len(context.async_tool_response_queue) == 0:
+        return context
+    apply_async_tool_responses(context)
+    await asave_context(context)
+    return context
+
+
+def apply_async_tool_responses(context: Context) -> None:
+    """Move queued responses whose tool call is in the messages into the messages (no save)."""
     # Build a mapping of tool_call_id -> tool_name from existing messages
     tool_call_id_to_name = {}
     for message in context.messages:
@@ -540,11 +806,6 @@ def process_async_tool_response_queue(context: Context) -> Context:
     
     # Update the queue to only contain unmatched responses
     context.async_tool_response_queue = responses_to_keep_queued
-    
-    # Save the context
-    save_context(context)
-    
-    return context
 
 
     
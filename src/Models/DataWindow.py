@@ -1,7 +1,7 @@
 import os
 from datetime import datetime
 import uuid
-from AWS.DynamoDB import get_item, put_item, delete_item, get_all_items_by_index
+from AWS.DynamoDB import get_item, put_item, delete_item, get_all_items_by_index, aget_item
 from pydantic import BaseModel
 from typing import Optional
 
@@ -58,6 +58,12 @@ def get_data_window(data_window_id: str) -> DataWindow:
         raise Exception(f"DataWindow with id: {data_window_id} does not exist", 404)
     return DataWindow(**item)
 
+async def aget_data_window(data_window_id: str) -> DataWindow:
+    item = await aget_item(DATA_WINDOWS_TABLE_NAME, DATA_WINDOWS_PRIMARY_KEY, data_window_id)
+    if item is None:
+        raise Exception(f"DataWindow with id: {data_window_id} does not exist", 404)
+    return DataWindow(**item)
+
 def get_data_window_for_org(data_window_id: str, org_id: str) -> DataWindow:
     data_window = get_data_window(data_window_id)
     if data_window.org_id != org_id:
@@ -1,15 +1,19 @@
+import copy
 import os
 import uuid
 from datetime import datetime
 from typing import Optional, Dict, Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from AWS.DynamoDB import (
     get_item,
-    get_items_by_scan,
+    batch_get_items,
     get_all_items_by_index,
     put_item,
     delete_item,
+    save_changes,
+    merge_item_changes,
+    retry_on_conflict,
 )
 from AWS.CloudWatchLogs import get_logger
 from Models import User
@@ -27,6 +31,10 @@ class Integration(BaseModel):
     integration_config: Dict[str, Any]
     created_at: int
     updated_at: int
+    # Optimistic locking: saves require the version that was read
+    version: Optional[int] = None
+    # The item as last read or written
+    _stored_item: Optional[dict] = PrivateAttr(default=None)
 
 
 class CreateIntegrationParams(BaseModel):
@@ -60,8 +68,14 @@ def create_integration(
         "created_at": now,
         "updated_at": now,
     }
-    integration = Integration(**data)
     put_item(INTEGRATIONS_TABLE_NAME, data)
+    integration = integration_from_item(data)
+    return integration
+
+
+def integration_from_item(item: dict) -> Integration:
+    integration = Integration(**item)
+    integration._stored_item = copy.deepcopy(item)
     return integration
 
 
@@ -69,7 +83,7 @@ def get_integration(integration_id: str) -> Integration:
     item = get_item(INTEGRATIONS_TABLE_NAME, INTEGRATIONS_PRIMARY_KEY, integration_id)
     if item is None:
         raise Exception(f"Integration with id: {integration_id} does not exist", 404)
-    return Integration(**item)
+    return integration_from_item(item)
 
 
 def get_integration_for_user(integration_id: str, user: User.User) -> Integration:
@@ -79,9 +93,28 @@ def get_integration_for_user(integration_id: str, user: User.User) -> Integratio
     return integration
 
 
+def rebase_integration(integration: Integration) -> None:
+    """Re-apply the integration's unsaved changes on top of the copy another writer saved."""
+    item = get_item(INTEGRATIONS_TABLE_NAME, INTEGRATIONS_PRIMARY_KEY, integration.integration_id)
+    if item is None:
+        raise Exception(f"Integration with id: {integration.integration_id} does not exist", 404)
+    merged = merge_item_changes(integration._stored_item, integration.model_dump(), item)
+    for field in Integration.model_fields:
+        if field in merged:
+            setattr(integration, field, merged[field])
+    integration.version = item.get("version")
+    integration._stored_item = copy.deepcopy(item)
+
+
 def save_integration(integration: Integration) -> Integration:
+    """Write the fields that changed since the integration was read. If another writer saved in between, merge and retry."""
     integration.updated_at = int(datetime.timestamp(datetime.now()))
-    put_item(INTEGRATIONS_TABLE_NAME, integration.model_dump())
+    written = retry_on_conflict(
+        lambda: save_changes(INTEGRATIONS_TABLE_NAME, INTEGRATIONS_PRIMARY_KEY, integration.model_dump(), integration._stored_item),
+        lambda: rebase_integration(integration),
+    )
+    integration.version = written["version"]
+    integration._stored_item = copy.deepcopy(written)
     return integration
 
 
@@ -93,14 +126,14 @@ def parse_integration_items(items: list[dict]) -> list[Integration]:
     integrations = []
     for item in items:
         try:
-            integrations.append(Integration(**item))
+            integrations.append(integration_from_item(item))
         except Exception as e:
             logger.error(f"Error parsing integration: {e}")
     return integrations
 
 
 def get_integrations_from_ids(integration_ids: list[str]) -> list[Integration]:
-    items = get_items_by_scan(INTEGRATIONS_TABLE_NAME, INTEGRATIONS_PRIMARY_KEY, integration_ids)
+    items = batch_get_items(INTEGRATIONS_TABLE_NAME, INTEGRATIONS_PRIMARY_KEY, integration_ids)
     return parse_integration_items(items)
 
 
@@ -1,16 +1,24 @@
+import copy
 import os
 import uuid
 import json
 from datetime import datetime
 from typing import Optional, Dict, Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from AWS.DynamoDB import (
     get_item,
     get_all_items_by_index,
-    get_items_by_scan,
+    batch_get_items,
     put_item,
     delete_item,
+    aget_item,
+    aput_item,
+    save_changes,
+    asave_changes,
+    merge_item_changes,
+    retry_on_conflict,
+    aretry_on_conflict,
 )
 from AWS.CloudWatchLogs import get_logger
 from Models import User
@@ -31,6 +39,10 @@ class JSONDocument(BaseModel):
     created_at: int
     updated_at: int
     is_public: bool = False
+    # Optimistic locking: saves require the version that was read
+    version: Optional[int] = None
+    # The item as last read or written; tools edit data in place, so this is a copy
+    _stored_item: Optional[dict] = PrivateAttr(default=None)
 
 
 class CreateJSONDocumentParams(BaseModel):
@@ -49,6 +61,29 @@ class UpdateJSONDocumentParams(BaseModel):
 # --------------------- CRUD Functions ---------------------
 
 
+def document_from_item(item: dict) -> JSONDocument:
+    document = JSONDocument(**item)
+    document._stored_item = copy.deepcopy(item)
+    return document
+
+
+def rebase_json_document(document: JSONDocument, item: Optional[dict]) -> None:
+    """Re-apply the document's unsaved changes on top of item, the document as another writer saved it."""
+    if item is None:
+        raise Exception(f"JSONDocument with id: {document.document_id} does not exist", 404)
+    merged = merge_item_changes(document._stored_item, document.model_dump(), item)
+    for field in JSONDocument.model_fields:
+        if field in merged:
+            setattr(document, field, merged[field])
+    document.version = item.get("version")
+    document._stored_item = copy.deepcopy(item)
+
+
+def write_json_document(document: JSONDocument, written: dict) -> None:
+    document.version = written["version"]
+    document._stored_item = copy.deepcopy(written)
+
+
 def json_document_exists(document_id: str) -> bool:
     return (
         get_item(DOCUMENTS_TABLE_NAME, DOCUMENTS_PRIMARY_KEY, document_id) is not None
@@ -68,8 +103,8 @@ def create_json_document(params: CreateJSONDocumentParams) -> JSONDocument:
         "created_at": now,
         "updated_at": now,
     }
-    document = JSONDocument(**document_data)
     put_item(DOCUMENTS_TABLE_NAME, document_data)
+    document = document_from_item(document_data)
     return document
 
 
@@ -80,7 +115,17 @@ def get_json_document(document_id: str) -> JSONDocument:
     if "name" not in item or item["name"] is None:
         item["name"] = f"Document {item[DOCUMENTS_PRIMARY_KEY]}"
         put_item(DOCUMENTS_TABLE_NAME, item)
-    return JSONDocument(**item)
+    return document_from_item(item)
+
+
+async def aget_json_document(document_id: str) -> JSONDocument:
+    item = await aget_item(DOCUMENTS_TABLE_NAME, DOCUMENTS_PRIMARY_KEY, document_id)
+    if item is None:
+        raise Exception(f"JSONDocument with id: {document_id} does not exist", 404)
+    if "name" not in item or item["name"] is None:
+        item["name"] = f"Document {item[DOCUMENTS_PRIMARY_KEY]}"
+        await aput_item(DOCUMENTS_TABLE_NAME, item)
+    return document_from_item(item)
 
 
 def get_public_json_document(document_id: str) -> JSONDocument:
@@ -91,16 +136,48 @@ def get_public_json_document(document_id: str) -> JSONDocument:
 
 
 def save_json_document(document: JSONDocument) -> None:
+    """Write the fields that changed since the document was read. If another writer saved in between, merge and retry."""
     document.updated_at = int(datetime.timestamp(datetime.now()))
-    put_item(DOCUMENTS_TABLE_NAME, document.model_dump())
+    written = retry_on_conflict(
+        lambda: save_changes(DOCUMENTS_TABLE_NAME, DOCUMENTS_PRIMARY_KEY, document.model_dump(), document._stored_item),
+        lambda: rebase_json_document(document, get_item(DOCUMENTS_TABLE_NAME, DOCUMENTS_PRIMARY_KEY, document.document_id)),
+    )
+    write_json_document(document, written)
 
 
 def delete_json_document(document_id: str) -> None:
     delete_item(DOCUMENTS_TABLE_NAME, DOCUMENTS_PRIMARY_KEY, document_id)
 
 
+async def aget_public_json_document(document_id: str) -> JSONDocument:
+    document = await aget_json_document(document_id)
+    if document.is_public:
+        return document
+    raise Exception(f"Document is not public", 403)
+
+
+async def asave_json_document(document: JSONDocument) -> None:
+    document.updated_at = int(datetime.timestamp(datetime.now()))
+
+    async def rebase():
+        rebase_json_document(document, await aget_item(DOCUMENTS_TABLE_NAME, DOCUMENTS_PRIMARY_KEY, document.document_id))
+
+    written = await aretry_on_conflict(
+        lambda: asave_changes(DOCUMENTS_TABLE_NAME, DOCUMENTS_PRIMARY_KEY, document.model_dump(), document._stored_item),
+        rebase,
+    )
+    write_json_document(document, written)
+
+
 def get_json_document_for_user(document_id: str, user: User.User) -> JSONDocument:
-    doc = get_json_document(document_id)
+    return check_json_document_access(get_json_document(document_id), user)
+
+
+async def aget_json_document_for_user(document_id: str, user: User.User) -> JSONDocument:
+    return check_json_document_access(await aget_json_document(document_id), user)
+
+
+def check_json_document_access(doc: JSONDocument, user: User.User) -> JSONDocument:
     if doc.is_public:
         return doc
     if doc.org_id in user.organizations:
@@ -115,14 +192,14 @@ def parse_json_document_items(items: list[dict]) -> list[JSONDocument]:
             if "name" not in item or item["name"] is None:
                 item["name"] = f"Document {item[DOCUMENTS_PRIMARY_KEY]}"
                 put_item(DOCUMENTS_TABLE_NAME, item)
-            documents.append(JSONDocument(**item))
+            documents.append(document_from_item(item))
         except Exception as e:
             logger.error(f"Error parsing document: {e}")
     return documents
 
 
 def get_json_documents_from_ids(document_ids: list[str]) -> list[JSONDocument]:
-    items = get_items_by_scan(DOCUMENTS_TABLE_NAME, DOCUMENTS_PRIMARY_KEY, document_ids)
+    items = batch_get_items(DOCUMENTS_TABLE_NAME, DOCUMENTS_PRIMARY_KEY, document_ids)
     return parse_json_document_items(items)
 
 
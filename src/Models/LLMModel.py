@@ -1,10 +1,14 @@
 import os
-from AWS.DynamoDB import get_item, put_item, get_all_items
+from AWS.DynamoDB import get_item, put_item, get_all_items, aget_item, describe_table
 from typing import Optional
 from pydantic import BaseModel
+from lib.ReadThroughCache import ReadThroughCache
 
 MODELS_TABLE_NAME = os.environ["MODELS_TABLE_NAME"]
 MODELS_PRIMARY_KEY = "model"
+describe_table(MODELS_TABLE_NAME, MODELS_PRIMARY_KEY)
+# get_model/aget_model/get_model_or_none are served from here; rows change rarely. 0 disables caching
+MODEL_CACHE = ReadThroughCache("llm_model", float(os.environ.get("LLM_MODEL_CACHE_TTL_SECONDS", "300")))
 
 class LLMModel(BaseModel):
     model: str
@@ -15,17 +19,28 @@ class LLMModel(BaseModel):
     order: Optional[int] = None
     use_responses_api: Optional[bool] = False
 
-def get_model(model_name: str) -> LLMModel:
+def load_model(model_name: str) -> LLMModel | None:
     item = get_item(MODELS_TABLE_NAME, MODELS_PRIMARY_KEY, model_name)
-    if item is None:
+    return LLMModel(**item) if item is not None else None
+
+async def aload_model(model_name: str) -> LLMModel | None:
+    item = await aget_item(MODELS_TABLE_NAME, MODELS_PRIMARY_KEY, model_name)
+    return LLMModel(**item) if item is not None else None
+
+def get_model(model_name: str) -> LLMModel:
+    model = get_model_or_none(model_name)
+    if model is None:
         raise Exception(f"Model '{model_name}' not found in models table", 404)
-    return LLMModel(**item)
+    return model
+
+async def aget_model(model_name: str) -> LLMModel:
+    model = await MODEL_CACHE.aget(model_name, lambda: aload_model(model_name))
+    if model is None:
+        raise Exception(f"Model '{model_name}' not found in models table", 404)
+    return model
 
 def get_model_or_none(model_name: str) -> LLMModel | None:
-    item = get_item(MODELS_TABLE_NAME, MODELS_PRIMARY_KEY, model_name)
-    if item is None:
-        return None
-    return LLMModel(**item)
+    return MODEL_CACHE.get(model_name, lambda: load_model(model_name))
 
 def get_all_models() -> list[LLMModel]:
     items = get_all_items(MODELS_TABLE_NAME)
@@ -1,15 +1,18 @@
 import os
 from datetime import datetime
 import uuid
-from AWS.DynamoDB import get_item, put_item, delete_item, get_all_items_by_index
+from AWS.DynamoDB import get_item, put_item, delete_item, get_all_items_by_index, aget_item
 from pydantic import BaseModel, Field
 from enum import Enum
 from typing import Optional, Type
 from Models import User
+from lib.ReadThroughCache import ReadThroughCache
 
 
 PARAMETER_DEFINITIONS_TABLE_NAME = os.environ["PARAMETER_DEFINITIONS_TABLE_NAME"]
 PARAMETER_DEFINITIONS_PRIMARY_KEY = os.environ["PARAMETER_DEFINITIONS_PRIMARY_KEY"]
+# get_parameter_definition/aget_parameter_definition are served from here; 0 disables caching
+PARAMETER_DEFINITION_CACHE = ReadThroughCache("parameter_definition", float(os.environ.get("PARAMETER_DEFINITION_CACHE_TTL_SECONDS", "60")))
 
 class ParamType(str, Enum):
     string = "string"
@@ -60,11 +63,25 @@ def create_parameter_definition(
     put_item(PARAMETER_DEFINITIONS_TABLE_NAME, parameter_definition.model_dump())
     return parameter_definition
 
-def get_parameter_definition(pd_id: str) -> ParameterDefinition:
+def load_parameter_definition(pd_id: str) -> Optional[ParameterDefinition]:
     item = get_item(PARAMETER_DEFINITIONS_TABLE_NAME, PARAMETER_DEFINITIONS_PRIMARY_KEY, pd_id)
-    if item == None:
+    return ParameterDefinition(**item) if item is not None else None
+
+async def aload_parameter_definition(pd_id: str) -> Optional[ParameterDefinition]:
+    item = await aget_item(PARAMETER_DEFINITIONS_TABLE_NAME, PARAMETER_DEFINITIONS_PRIMARY_KEY, pd_id)
+    return ParameterDefinition(**item) if item is not None else None
+
+def get_parameter_definition(pd_id: str) -> ParameterDefinition:
+    parameter_definition = PARAMETER_DEFINITION_CACHE.get(pd_id, lambda: load_parameter_definition(pd_id))
+    if parameter_definition == None:
         raise Exception(f"ParameterDefinition {pd_id} not found", 404)
-    return ParameterDefinition(**item)
+    return parameter_definition
+
+async def aget_parameter_definition(pd_id: str) -> ParameterDefinition:
+    parameter_definition = await PARAMETER_DEFINITION_CACHE.aget(pd_id, lambda: aload_parameter_definition(pd_id))
+    if parameter_definition == None:
+        raise Exception(f"ParameterDefinition {pd_id} not found", 404)
+    return parameter_definition
 
 def get_parameter_definition_for_user(pd_id: str, user: User.User) -> ParameterDefinition:
     parameter_definition = get_parameter_definition(pd_id)
@@ -75,10 +92,12 @@ def get_parameter_definition_for_user(pd_id: str, user: User.User) -> ParameterD
 def save_parameter_definition(parameter_definition: ParameterDefinition) -> ParameterDefinition:
     parameter_definition.updated_at = int(datetime.now().timestamp())
     put_item(PARAMETER_DEFINITIONS_TABLE_NAME, parameter_definition.model_dump())
+    PARAMETER_DEFINITION_CACHE.invalidate_everywhere(parameter_definition.pd_id, parameter_definition.updated_at)
     return parameter_definition
 
 def delete_parameter_definition(pd_id: str) -> None:
     delete_item(PARAMETER_DEFINITIONS_TABLE_NAME, PARAMETER_DEFINITIONS_PRIMARY_KEY, pd_id)
+    PARAMETER_DEFINITION_CACHE.invalidate_everywhere(pd_id)
 
 def get_parameter_definitions_for_org(org_id: str) -> list[ParameterDefinition]:
     return [ParameterDefinition(**item) for item in get_all_items_by_index(PARAMETER_DEFINITIONS_TABLE_NAME, "org_id", org_id)]
@@ -1,10 +1,19 @@
+import asyncio
 import os
 import uuid
 from datetime import datetime
-from AWS.DynamoDB import put_item, get_items_by_index_range
+from AWS.DynamoDB import put_item, get_items_by_index_range, run_in_pool, describe_table
+from AWS.CloudWatchLogs import get_logger
 from pydantic import BaseModel
 
+logger = get_logger(log_level=os.environ["LOG_LEVEL"])
+
 TOKEN_TRACKING_TABLE_NAME = os.environ["TOKEN_TRACKING_TABLE_NAME"]
+TOKEN_TRACKING_PRIMARY_KEY = "tracking_id"
+describe_table(TOKEN_TRACKING_TABLE_NAME, TOKEN_TRACKING_PRIMARY_KEY, indexes={"org_id-created_at-index": ("org_id", "created_at")})
+
+# Background writes started from the event loop - referenced until done
+_pending_writes = set()
 
 class TokenTracking(BaseModel):
     tracking_id: str
@@ -15,19 +24,41 @@ class TokenTracking(BaseModel):
     created_at: int
 
 def build_tracking_callback(org_id: str, model_id: str = None):
-    """Returns an on_response callback that saves token tracking for the given org."""
+    """
+    Returns an on_response callback that saves token tracking for the given org.
+    On the event loop the write runs in the background on the DynamoDB pool.
+    """
     def on_response(response):
         usage = getattr(response, 'usage_metadata', None)
         if usage:
             model_name = model_id or getattr(response, 'response_metadata', {}).get('model_name', 'unknown')
-            create_token_tracking(
+            kwargs = dict(
                 org_id=org_id,
                 model=model_name,
                 input_tokens=usage.get('input_tokens', 0) if isinstance(usage, dict) else getattr(usage, 'input_tokens', 0),
                 output_tokens=usage.get('output_tokens', 0) if isinstance(usage, dict) else getattr(usage, 'output_tokens', 0),
             )
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                create_token_tracking(**kwargs)
+                return
+            task = asyncio.ensure_future(run_in_pool(create_token_tracking, **kwargs))
+            _pending_writes.add(task)
+            task.add_done_callback(lambda done: _write_done(done, kwargs))
     return on_response
 
+def _write_done(task: asyncio.Future, usage: dict) -> None:
+    _pending_writes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Error saving token tracking {usage}: {task.exception()}")
+
+async def flush_pending_writes() -> int:
+    """Wait for the background writes started so far, e.g. before shutting down. Returns how many there were."""
+    pending = list(_pending_writes)
+    await asyncio.gather(*pending, return_exceptions=True)
+    return len(pending)
+
 def get_token_trackings_for_org(org_id: str, start_time: int, end_time: int) -> list[TokenTracking]:
     """Query all token tracking records for an org within a unix-timestamp range."""
     items = get_items_by_index_range(
@@ -43,7 +74,7 @@ def get_token_trackings_for_org(org_id: str, start_time: int, end_time: int) ->
 
 def create_token_tracking(org_id: str, model: str, input_tokens: int, output_tokens: int) -> TokenTracking:
     data = {
-        "tracking_id": str(uuid.uuid4()),
+        TOKEN_TRACKING_PRIMARY_KEY: str(uuid.uuid4()),
         "org_id": org_id,
         "model": model,
         "input_tokens": input_tokens,
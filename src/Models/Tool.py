@@ -3,17 +3,20 @@ import json
 import os
 from datetime import datetime
 import uuid
-from AWS.DynamoDB import get_item, put_item, delete_item, get_all_items_by_index
+from AWS.DynamoDB import get_item, put_item, delete_item, get_all_items_by_index, aget_item
 from pydantic import BaseModel
 from Models import User, ParameterDefinition
 from typing import Optional
 from LLM.AgentTool import AgentTool
 from AWS.Lambda import invoke_lambda
 from Tools import ToolRegistry
+from lib.ReadThroughCache import ReadThroughCache
 
 
 TOOLS_TABLE_NAME = os.environ["TOOLS_TABLE_NAME"]
 TOOLS_PRIMARY_KEY = os.environ["TOOLS_PRIMARY_KEY"]
+# get_tool/aget_tool are served from here; 0 disables caching
+TOOL_CACHE = ReadThroughCache("tool", float(os.environ.get("TOOL_CACHE_TTL_SECONDS", "60")))
 EXECUTION_LAMBDA_NAME = os.environ["EXECUTION_LAMBDA_NAME"]
 
 
@@ -83,24 +86,48 @@ def create_tool(
     return tool
 
 
-def get_tool(tool_id: str) -> Tool:
+def load_tool(tool_id: str) -> Optional[Tool]:
     item = get_item(TOOLS_TABLE_NAME, TOOLS_PRIMARY_KEY, tool_id)
-    if item == None:
+    return Tool(**item) if item is not None else None
+
+
+async def aload_tool(tool_id: str) -> Optional[Tool]:
+    item = await aget_item(TOOLS_TABLE_NAME, TOOLS_PRIMARY_KEY, tool_id)
+    return Tool(**item) if item is not None else None
+
+
+def get_tool(tool_id: str) -> Tool:
+    tool = TOOL_CACHE.get(tool_id, lambda: load_tool(tool_id))
+    if tool == None:
+        raise Exception(f"Tool {tool_id} not found", 404)
+    return tool
+
+
+async def aget_tool(tool_id: str) -> Tool:
+    tool = await TOOL_CACHE.aget(tool_id, lambda: aload_tool(tool_id))
+    if tool == None:
         raise Exception(f"Tool {tool_id} not found", 404)
-    return Tool(**item)
+    return tool
+
+
+def get_registry_tool(tool_id: str) -> Optional[AgentTool]:
+    if tool_id not in ToolRegistry.tool_registry:
+        return None
+    # Return a copy of the registry tool with tool_id set
+    registry_tool = ToolRegistry.tool_registry[tool_id]
+    return AgentTool(
+        tool_id=tool_id,
+        function=registry_tool.function,
+        params=registry_tool.params,
+        pass_context=registry_tool.pass_context,
+        is_async=registry_tool.is_async
+    )
 
 
 def get_agent_tool_with_id(tool_id: str) -> AgentTool:
-    if tool_id in ToolRegistry.tool_registry:
-        # Return a copy of the registry tool with tool_id set
-        registry_tool = ToolRegistry.tool_registry[tool_id]
-        return AgentTool(
-            tool_id=tool_id,
-            function=registry_tool.function,
-            params=registry_tool.params,
-            pass_context=registry_tool.pass_context,
-            is_async=registry_tool.is_async
-        )
+    registry_tool = get_registry_tool(tool_id)
+    if registry_tool:
+        return registry_tool
 
     tool: Tool = get_tool(tool_id)
 
@@ -109,6 +136,24 @@ def get_agent_tool_with_id(tool_id: str) -> AgentTool:
         parameter_definition = ParameterDefinition.get_parameter_definition(
             tool.pd_id)
 
+    return build_agent_tool(tool_id, tool, parameter_definition)
+
+
+async def aget_agent_tool_with_id(tool_id: str) -> AgentTool:
+    registry_tool = get_registry_tool(tool_id)
+    if registry_tool:
+        return registry_tool
+
+    tool: Tool = await aget_tool(tool_id)
+
+    parameter_definition = None
+    if (tool.pd_id):
+        parameter_definition = await ParameterDefinition.aget_parameter_definition(tool.pd_id)
+
+    return build_agent_tool(tool_id, tool, parameter_definition)
+
+
+def build_agent_tool(tool_id: str, tool: Tool, parameter_definition: Optional[ParameterDefinition.ParameterDefinition]) -> AgentTool:
     params = ParameterDefinition.create_pydantic_class(
         tool.name,
         parameter_definition.parameters if parameter_definition else [],
@@ -166,11 +211,13 @@ def get_tool_for_org(tool_id: str, org_id: str) -> Tool:
 def save_tool(tool: Tool) -> Tool:
     tool.updated_at = int(datetime.now().timestamp())
     put_item(TOOLS_TABLE_NAME, tool.model_dump())
+    TOOL_CACHE.invalidate_everywhere(tool.tool_id, tool.updated_at)
     return tool
 
 
 def delete_tool(tool_id: str) -> None:
     delete_item(TOOLS_TABLE_NAME, TOOLS_PRIMARY_KEY, tool_id)
+    TOOL_CACHE.invalidate_everywhere(tool_id)
 
 
 def get_tools_for_org(org_id: str) -> list[Tool]:
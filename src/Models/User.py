@@ -1,6 +1,6 @@
 import os
 from datetime import datetime
-from AWS.DynamoDB import get_item, put_item, delete_item
+from AWS.DynamoDB import get_item, put_item, delete_item, aget_item
 from pydantic import BaseModel
 from Models import APIKey
 
@@ -36,18 +36,30 @@ def get_user(user_id: str) -> User:
     # If not found, try API Keys table (for API key authentication)
     try:
         api_key = APIKey.get_api_key(user_id)
-        
-        # Only return mocked user if API key is valid
-        if api_key.valid:
-            # Create a mocked User with the API key's details
-            return User(
-                user_id=api_key.user_id,  # Use the user_id from the API key
-                organizations=[api_key.org_id],
-                created_at=api_key.created_at,
-                updated_at=api_key.updated_at
-            )
     except Exception:
-        pass  # API key not found, proceed to raise user not found error
+        api_key = None  # API key not found, proceed to raise user not found error
+    return user_from_api_key(user_id, api_key)
+
+async def aget_user(user_id: str) -> User:
+    item = await aget_item(USERS_TABLE_NAME, USERS_PRIMARY_KEY, user_id)
+    if item is not None:
+        return User(**item)
+    try:
+        api_key = await APIKey.aget_api_key(user_id)
+    except Exception:
+        api_key = None
+    return user_from_api_key(user_id, api_key)
+
+def user_from_api_key(user_id: str, api_key) -> User:
+    # Only return mocked user if API key is valid
+    if api_key is not None and api_key.valid:
+        # Create a mocked User with the API key's details
+        return User(
+            user_id=api_key.user_id,  # Use the user_id from the API key
+            organizations=[api_key.org_id],
+            created_at=api_key.created_at,
+            updated_at=api_key.updated_at
+        )
     
     raise Exception(f"User with id: {user_id} does not exist")
 
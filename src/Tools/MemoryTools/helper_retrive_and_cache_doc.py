@@ -34,4 +34,11 @@ def retrieve_and_cache_doc(document_id, context):
     if not memory_document:
         raise Exception(f"Error: Memory document with ID {document_id} not found.")
     
-    return memory_document
\ No newline at end of file
+    return memory_document
+
+
+async def aretrieve_and_cache_doc(document_id, context):
+    if "user_id" in context:
+        user = await User.aget_user(context["user_id"])
+        return await JSONDocument.aget_json_document_for_user(document_id, user)
+    return await JSONDocument.aget_public_json_document(document_id)
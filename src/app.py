@@ -1,13 +1,34 @@
 from fastapi import FastAPI, WebSocket, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+import asyncio
 import os
+from typing import Optional
 from lib.Connection import Connection
+from lib.Codecs import negotiate_codec
 from stores.connections import CONNECTIONS
+from stores.streams import STREAMS
+from stores.bus import BUS
+from stores.drain import DRAINER
+from stores.reaper import REAPER
+from stores.watchdog import WATCHDOG
+from stores.persister import PERSISTER
+from lib.Drainer import DEFAULT_DEADLINE_SECONDS, STOP_GRACE_SECONDS, SERVICE_RESTART
+from lib.ConnectionDirectory import register_bus_handlers, list_connections, stop_connection, notify_context
+from Models import Context, TokenTracking
+from AWS import DynamoDB
+from pydantic import BaseModel
 from handlers.connect_to_context import connect_to_context
 from handlers.add_message import add_message
 from handlers.stop_invocation import stop_invocation
 from handlers.set_last_messages import set_last_messages
 from handlers.client_side_tool_responses import client_side_tool_responses
+from handlers.ping import ping
+from handlers.resume_stream import resume_stream
+from lib.Dispatcher import SERIAL, CONCURRENT, SUPERSEDE
+from lib import Metrics
+from lib import Log
+from lib import ReadThroughCache
 
 app = FastAPI()
 
@@ -20,11 +41,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def count_active_invocations() -> int:
+    agent_chats = {id(connection.agent_chat) for connection in CONNECTIONS.values() if connection.agent_chat and connection.agent_chat.is_generating}
+    # Generations still running for a socket that went away
+    agent_chats.update(id(stream.agent_chat) for stream in STREAMS.values() if stream.agent_chat and stream.agent_chat.is_generating)
+    return len(agent_chats)
+
+
+Metrics.Gauge("active_invocations", "Agent invocations currently generating", callback=count_active_invocations)
+Metrics.Gauge("websocket_connections", "Open WebSocket connections", callback=lambda: len(CONNECTIONS))
+Metrics.Gauge("handler_tasks", "Request handlers in flight", callback=lambda: sum(connection.dispatcher.active_count for connection in CONNECTIONS.values()))
+Metrics.Gauge("send_queue_frames", "Frames waiting in send queues", callback=lambda: sum(connection.outbound.depth for connection in CONNECTIONS.values()))
+Metrics.Gauge("dynamodb_calls_in_flight", "Async DynamoDB calls running or queued on the thread pool", callback=DynamoDB.in_flight)
+Metrics.Gauge("contexts_unsaved", "Contexts with changes waiting for a write-behind save", callback=lambda: PERSISTER.dirty_count)
+Metrics.Gauge("log_records_dropped", "Log records dropped because the log queue was full, since start", callback=Log.dropped_records)
+
+
+async def metrics_snapshot() -> dict:
+    return {"worker_id": BUS.worker_id, "metrics": Metrics.snapshot()}
+
+
+@app.get("/metrics")
+async def metrics(key: str = Query(default=None)):
+    """Prometheus scrape endpoint - merged across all workers."""
+    if key != os.environ.get("METRICS_KEY", os.environ.get("RESET_KEY")):
+        return PlainTextResponse("Forbidden", status_code=403)
+    snapshots = [await metrics_snapshot()] + await BUS.broadcast("metrics_snapshot", {})
+    merged = Metrics.merge({snapshot["worker_id"]: snapshot["metrics"] for snapshot in snapshots})
+    return PlainTextResponse(Metrics.render(merged), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health():
+    # Failing health checks is how the load balancer learns to stop sending traffic here
+    if DRAINER.draining:
+        return JSONResponse(status_code=503, content={"status": "draining", "num_connections": len(CONNECTIONS)})
     return {
         "status": "ok",
         "num_connections": len(CONNECTIONS),
+        "num_streams": len(STREAMS),
     }
 
 @app.get("/reset")
@@ -40,20 +95,200 @@ async def reset(key: str = Query(default=None)):
         "num_connections": len(CONNECTIONS),
     }
 
+@app.get("/admin/connections")
+async def admin_connections(key: str = Query(default=None)):
+    if key != os.environ.get("RESET_KEY"):
+        return
+    # Every worker's connections, not just this process's
+    connections = await list_connections()
+    return {
+        "worker_id": BUS.worker_id,
+        "num_workers": len(BUS.peers()) + 1,
+        "num_connections": len(connections),
+        "num_streams": len(STREAMS),
+        "connections": connections,
+    }
+
+
+@app.get("/admin/memory")
+async def admin_memory(key: str = Query(default=None), limit: int = Query(default=50)):
+    """Estimated agent memory per connection across workers, largest first."""
+    if key != os.environ.get("RESET_KEY"):
+        return
+    connections = await list_connections()
+    connections.sort(key=lambda connection: connection["memory"]["total_bytes"], reverse=True)
+    by_worker = {}
+    for connection in connections:
+        by_worker[connection["worker_id"]] = by_worker.get(connection["worker_id"], 0) + connection["memory"]["total_bytes"]
+    return {
+        "total_bytes": sum(by_worker.values()),
+        "by_worker": by_worker,
+        "num_connections": len(connections),
+        "num_dehydrated": sum(1 for connection in connections if connection["dehydrated"]),
+        "reaper": REAPER.stats(),
+        "connections": [
+            {field: connection[field] for field in ("connection_id", "worker_id", "context_id", "idle_seconds", "dehydrated", "memory")}
+            for connection in connections[:limit]
+        ],
+    }
+
+
+@app.post("/admin/reap")
+async def admin_reap(key: str = Query(default=None)):
+    """Run the idle sweep on this worker now."""
+    if key != os.environ.get("RESET_KEY"):
+        return
+    return await REAPER.sweep()
+
+
+async def loop_report(limit: int = 50, reset: bool = False) -> dict:
+    report = dict(WATCHDOG.report(limit), worker_id=BUS.worker_id)
+    if reset:
+        WATCHDOG.reset()
+    return report
+
+
+@app.get("/admin/loop")
+async def admin_loop(key: str = Query(default=None), limit: int = Query(default=50), reset: bool = Query(default=False)):
+    """Code that blocked the event loop, aggregated by call site, per worker."""
+    if key != os.environ.get("RESET_KEY"):
+        return
+    reports = [await loop_report(limit, reset)] + await BUS.broadcast("loop_report", {"limit": limit, "reset": reset})
+    return {"workers": reports}
+
+
+async def cache_stats() -> dict:
+    return {"worker_id": BUS.worker_id, "caches": {name: cache.stats() for name, cache in ReadThroughCache.CACHES.items()}}
+
+
+async def cache_invalidate(cache: str, id: str, updated_at: Optional[int] = None) -> dict:
+    return {"worker_id": BUS.worker_id, "invalidated": ReadThroughCache.invalidate(cache, id, updated_at)}
+
+
+@app.get("/admin/cache")
+async def admin_cache(key: str = Query(default=None)):
+    if key != os.environ.get("RESET_KEY"):
+        return
+    return {"workers": [await cache_stats()] + await BUS.broadcast("cache_stats", {})}
+
+
+@app.post("/admin/cache/{cache}/{id}/invalidate")
+async def admin_cache_invalidate(cache: str, id: str, key: str = Query(default=None), updated_at: Optional[int] = Query(default=None)):
+    """
+    Called by whatever changed an agent, tool, parameter definition or model row.
+    Workers whose cached copy is at least as new as updated_at keep it.
+    """
+    if key != os.environ.get("RESET_KEY"):
+        return
+    payload = {"cache": cache, "id": id, "updated_at": updated_at}
+    return {"workers": [await cache_invalidate(**payload)] + await BUS.broadcast("cache_invalidate", payload)}
+
+
+@app.post("/admin/connections/{connection_id}/stop_invocation")
+async def admin_stop_invocation(connection_id: str, key: str = Query(default=None)):
+    if key != os.environ.get("RESET_KEY"):
+        return
+    return {"success": await stop_connection(connection_id)}
+
+
+class AsyncToolResponse(BaseModel):
+    tool_call_id: str
+    response: str
+
+
+@app.post("/contexts/{context_id}/async_tool_response")
+async def async_tool_response(context_id: str, body: AsyncToolResponse, key: str = Query(default=None)):
+    """Queue the result of a long-running tool and tell the context's connected clients, on any worker."""
+    if key != os.environ.get("RESET_KEY"):
+        return
+    context = await Context.aget_context(context_id)
+    await Context.aadd_async_tool_response(context, body.tool_call_id, body.response)
+    notified = await notify_context(
+        context_id,
+        "on_async_tool_response",
+        {"context_id": context_id, "tool_call_id": body.tool_call_id},
+    )
+    return {"success": True, "notified_connections": notified}
+
+
+async def drain_worker(deadline_seconds: float = DEFAULT_DEADLINE_SECONDS) -> dict:
+    report = await DRAINER.drain(deadline_seconds)
+    return dict(report, worker_id=BUS.worker_id)
+
+
+@app.post("/admin/drain")
+async def admin_drain(key: str = Query(default=None), deadline_seconds: float = Query(default=DEFAULT_DEADLINE_SECONDS)):
+    """Drain every worker and return what each one flushed. The workers stay up, but unhealthy."""
+    if key != os.environ.get("RESET_KEY"):
+        return
+    timeout = deadline_seconds + STOP_GRACE_SECONDS + 30
+    reports = await asyncio.gather(
+        drain_worker(deadline_seconds),
+        BUS.broadcast("drain", {"deadline_seconds": deadline_seconds}, timeout=timeout),
+    )
+    return {"workers": [reports[0]] + reports[1]}
+
+
+@app.get("/admin/drain")
+async def admin_drain_status(key: str = Query(default=None)):
+    if key != os.environ.get("RESET_KEY"):
+        return
+    return DRAINER.status()
+
+
+@app.on_event("startup")
+async def startup():
+    register_bus_handlers(BUS)
+    BUS.on("drain", drain_worker)
+    BUS.on("metrics_snapshot", metrics_snapshot)
+    BUS.on("loop_report", loop_report)
+    BUS.on("cache_stats", cache_stats)
+    BUS.on("cache_invalidate", cache_invalidate)
+    await BUS.start()
+    ReadThroughCache.broadcast_invalidations(BUS)
+    # SIGTERM (ECS task replacement) drains before uvicorn shuts down
+    DRAINER.install_signal_handler()
+    REAPER.start()
+    WATCHDOG.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await PERSISTER.close()
+    await TokenTracking.flush_pending_writes()
+    await WATCHDOG.close()
+    await REAPER.close()
+    await BUS.close()
+
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    connection = Connection(websocket)
+    if DRAINER.draining:
+        # Refuse the upgrade so the client retries against another task
+        await websocket.close(code=SERVICE_RESTART)
+        return
+
+    # Binary clients (voice server, native apps) can pick MessagePack via Sec-WebSocket-Protocol
+    codec, subprotocol = negotiate_codec(websocket.scope.get("subprotocols", []))
+    connection = Connection(websocket, codec=codec, subprotocol=subprotocol)
     CONNECTIONS[connection.id] = connection
     
-    connection.on("connect_to_context", connect_to_context)
-    connection.on("add_message", add_message)
-    connection.on("stop_invocation", stop_invocation)
-    connection.on("set_last_messages", set_last_messages)
-    connection.on("client_side_tool_responses", client_side_tool_responses)
+    connection.on("connect_to_context", connect_to_context, policy=SERIAL)
+    connection.on("add_message", add_message, policy=SERIAL, streaming=True)
+    connection.on("stop_invocation", stop_invocation, policy=CONCURRENT)
+    connection.on("set_last_messages", set_last_messages, policy=SUPERSEDE, streaming=True)
+    connection.on("client_side_tool_responses", client_side_tool_responses, policy=SERIAL, streaming=True)
+    connection.on("ping", ping, policy=CONCURRENT)
+    connection.on("resume_stream", resume_stream, policy=SERIAL, streaming=True)
 
     try:
         await connection.start()
     finally:
         CONNECTIONS.pop(connection.id, None)
-        print(f"[Connection {connection.id}] Removed from registry")
+        Log.info("connection", "Removed from registry")
+        if connection.context:
+            # Save the last turn now rather than on the timer; a detached generation marks it dirty again
+            try:
+                await PERSISTER.flush(connection.context.context_id)
+            except Exception as e:
+                Log.error("persister", "Error saving context on disconnect", error=e)
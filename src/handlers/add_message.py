@@ -1,8 +1,9 @@
 import uuid
 from Models import Context
-from LLM.BaseMessagesConverter import base_messages_to_dict_messages, dict_messages_to_base_messages
+from LLM.BaseMessagesConverter import base_messages_to_dict_messages
 from lib.Connection import Connection
 from stores.connections import CONNECTIONS
+from stores.persister import PERSISTER
 
 async def add_message(connection_id: str, message: str):
 
@@ -22,12 +23,16 @@ async def add_message(connection_id: str, message: str):
     # Get the agent
     agent = connection.agent_chat
 
-    # Refresh context
-    connection.context = Context.get_context(connection.context.context_id)
+    # Refresh context, once our own write-behind save of it has landed. Usually nothing
+    # else changed it since the last turn; a version check then saves the reload.
+    await PERSISTER.flush(connection.context.context_id)
+    if not await Context.ais_context_current(connection.context):
+        connection.context = await Context.aget_context(connection.context.context_id)
 
     # Process any pending async tool responses
-    connection.context = Context.process_async_tool_response_queue(connection.context)
-    agent.messages = dict_messages_to_base_messages(connection.context.messages)
+    connection.context = await Context.aprocess_async_tool_response_queue(connection.context)
+    # Convert only the messages that changed, and drop any a failed turn left in the agent
+    connection.sync_agent_messages()
     
     # Invoke the agent chat stream
     token_stream = await agent.add_human_message_and_invoke(message)
@@ -38,18 +43,20 @@ async def add_message(connection_id: str, message: str):
     # Stream tokens - now using async for since token_stream is an async generator
     if token_stream:
         async for token in token_stream:
-            await connection.peer.call(method="on_token", params={"token": token, "response_id": response_id})
+            await connection.send_token(response_id, token)
 
     # Send stop token signal
-    await connection.peer.call(method="on_stop_token", params={"response_id": response_id})
+    await connection.send_stop_token(response_id)
 
-    # Save the new message to context 
+    # Save the new message to context (write-behind)
     connection.context.messages = base_messages_to_dict_messages(connection.agent_chat.messages)
-    Context.save_context(connection.context)
+    connection.mark_messages_synced()
+    PERSISTER.mark_dirty(connection.context)
 
     # Notify client of pending client-side tool calls
     if agent.pending_client_side_tool_calls:
-        await connection.peer.call(
+        await connection.send_stream_event(
+            response_id,
             method="on_client_side_tool_calls",
             params={
                 "tool_calls": agent.pending_client_side_tool_calls,
@@ -59,5 +66,5 @@ async def add_message(connection_id: str, message: str):
 
     # Check if there are chat events to send
     if (agent.context.get("events")):
-        await connection.peer.call(method="on_events", params={"events": agent.context["events"], "response_id": response_id})
+        await connection.send_stream_event(response_id, method="on_events", params={"events": agent.context["events"], "response_id": response_id})
         agent.context["events"] = []
@@ -3,6 +3,7 @@ from Models import Context
 from LLM.BaseMessagesConverter import base_messages_to_dict_messages, dict_messages_to_base_messages
 from lib.Connection import Connection
 from stores.connections import CONNECTIONS
+from stores.persister import PERSISTER
 from langchain_core.messages import AIMessage, ToolMessage
 
 
@@ -73,18 +74,20 @@ async def client_side_tool_responses(connection_id: str, tool_responses: list):
     # Stream tokens if there are any
     if token_stream:
         async for token in token_stream:
-            await connection.peer.call(method="on_token", params={"token": token, "response_id": response_id})
+            await connection.send_token(response_id, token)
 
     # Send stop token signal
-    await connection.peer.call(method="on_stop_token", params={"response_id": response_id})
+    await connection.send_stop_token(response_id)
 
-    # Save context
+    # Save context (write-behind)
     connection.context.messages = base_messages_to_dict_messages(agent.messages)
-    Context.save_context(connection.context)
+    connection.mark_messages_synced()
+    PERSISTER.mark_dirty(connection.context)
 
     # Check for another round of client-side tool calls
     if agent.pending_client_side_tool_calls:
-        await connection.peer.call(
+        await connection.send_stream_event(
+            response_id,
             method="on_client_side_tool_calls",
             params={
                 "tool_calls": agent.pending_client_side_tool_calls,
@@ -94,5 +97,5 @@ async def client_side_tool_responses(connection_id: str, tool_responses: list):
 
     # Check if there are chat events to send
     if agent.context.get("events"):
-        await connection.peer.call(method="on_events", params={"events": agent.context["events"], "response_id": response_id})
+        await connection.send_stream_event(response_id, method="on_events", params={"events": agent.context["events"], "response_id": response_id})
         agent.context["events"] = []
@@ -1,16 +1,100 @@
 import asyncio
+import time
 import uuid
+from typing import Optional, Union
 from lib.Connection import Connection
+from lib.Dispatcher import SERIAL
+from lib import Log
+from lib import Metrics
 from stores.connections import CONNECTIONS
+from stores.persister import PERSISTER
 from AWS import Cognito
-from Models import User, Context, Agent, Tool, APIKey
+from Models import User, Context, Agent, Tool, APIKey, LLMModel
 from Models.TokenTracking import build_tracking_callback
 from LLM.TokenStreamingAgentChat import TokenStreamingAgentChat
 from LLM.CreateLLM import create_llm
 from LLM.BaseMessagesConverter import base_messages_to_dict_messages, dict_messages_to_base_messages
 
 
-async def connect_to_context(connection_id: str, context_id: str, access_token: str = None):
+async def authenticate(access_token: str) -> tuple[User.User, Optional[dict]]:
+    """The user an access token (API key or Cognito token) belongs to, and the API key's contents if it is one."""
+    key_contents = APIKey.get_signed_api_key_contents(access_token)
+    if key_contents:
+        # The key's signature names its user, so the user's row loads alongside the check that the key is still valid
+        active, user = await asyncio.gather(
+            APIKey.ais_api_key_active(key_contents["api_key_id"]),
+            load_key_user(key_contents["user_id"]),
+            return_exceptions=True,
+        )
+        if active is True:
+            if isinstance(user, BaseException):
+                raise user
+            return user, key_contents
+    cognito_user = await Cognito.aget_user_from_cognito(access_token)
+    return await User.aget_user(cognito_user.sub), None
+
+
+async def load_key_user(user_id: str) -> User.User:
+    # Note: public-agent contexts carry ``user_id="public"`` and the auto-minted
+    # client API key inherits that value — there is no row in the users table
+    # for "public", so we synthesize a stub User in that case. All downstream
+    # authorization either short-circuits on ``agent.is_public`` or relies on
+    # the key's ``client_id`` claim, so the stub's empty org list is safe.
+    if user_id == "public":
+        return User.User(
+            user_id="public",
+            organizations=[],
+            created_at=0,
+            updated_at=0,
+        )
+    return await User.aget_user(user_id)
+
+
+async def load_context(context_id: str) -> Context.Context:
+    # A turn on this worker may still be waiting in the write-behind persister
+    await PERSISTER.flush(context_id)
+    return await Context.aget_context(context_id)
+
+
+async def load_tools(agent: Agent.Agent, context: Context.Context) -> list:
+    # Combine agent tools with context additional_agent_tools (remove duplicates)
+    agent_tool_ids = agent.tools if agent.tools else []
+    context_tool_ids = context.additional_agent_tools if context.additional_agent_tools else []
+    combined_tool_ids = list(dict.fromkeys(agent_tool_ids + context_tool_ids))  # Preserve order, remove duplicates
+
+    # Each tool's row and parameter definition load in parallel with every other tool's
+    return list(await asyncio.gather(*[Tool.aget_agent_tool_with_id(tool_id) for tool_id in combined_tool_ids]))
+
+
+async def warm_model(model_id: Optional[str]) -> None:
+    # Warm the model cache so create_llm's lookup doesn't block the loop
+    if model_id:
+        await LLMModel.aget_model(model_id)
+
+
+async def timed(timings: dict, stage: str, awaitable):
+    """Await one stage of the connect pipeline, recording its duration in timings (ms) and the stage histogram."""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        seconds = time.perf_counter() - started
+        timings[stage] = round(seconds * 1000, 3)
+        Metrics.CONNECT_STAGE_DURATION.observe(seconds, (stage,))
+
+
+async def gather_or_cancel(*awaitables) -> list:
+    """asyncio.gather, except that the first failure cancels the other stages instead of leaving them running."""
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def connect_to_context(connection_id: str, context_id: str, access_token: str = None, token_batching: Union[bool, dict] = None, short_stream_ids: bool = False):
 
     # Get the connection - used later
     connection = CONNECTIONS[connection_id]
@@ -21,37 +105,48 @@ async def connect_to_context(connection_id: str, context_id: str, access_token:
     if not access_token:
         raise Exception("access_token required")
 
-    # Resolve the user and (if applicable) API key contents.
-    #
-    # Note: public-agent contexts carry ``user_id="public"`` and the auto-minted
-    # client API key inherits that value — there is no row in the users table
-    # for "public", so we synthesize a stub User in that case. All downstream
-    # authorization either short-circuits on ``agent.is_public`` or relies on
-    # the key's ``client_id`` claim, so the stub's empty org list is safe.
-    key_contents = None
-    user = None
-    if APIKey.validate_api_key(access_token):
-        key_contents = APIKey.get_api_key_contents(access_token)
-        key_user_id = key_contents["user_id"]
-        if key_user_id == "public":
-            user = User.User(
-                user_id="public",
-                organizations=[],
-                created_at=0,
-                updated_at=0,
-            )
-        else:
-            user = User.get_user(key_user_id)
-    else:
-        cognito_user = Cognito.get_user_from_cognito(access_token)
-        user = User.get_user(cognito_user.sub)
-
     if context_id is None:
         raise Exception("No context_id provided")
 
-    # Load the context and agent. get_agent_for_user already resolves public agents.
-    context = Context.get_context(context_id)
-    agent = Agent.get_agent_for_user(context.agent_id, user)
+    # The loads run as a dependency graph rather than one after another:
+    #
+    #   auth ───────────────────────────────┐
+    #   context ─┬─ agent ── tools ─────────┼─ authorize, build the agent chat
+    #            └─ model ──────────────────┘
+    #
+    # Nothing is attached to the connection until the caller is authorized, and an
+    # auth failure is raised ahead of any load's.
+    started = time.perf_counter()
+    timings = {}
+
+    async def load_agent_and_tools(context: Context.Context) -> tuple[Agent.Agent, list]:
+        agent = await timed(timings, "agent", Agent.aget_agent(context.agent_id))
+        tools = await timed(timings, "tools", load_tools(agent, context))
+        return agent, tools
+
+    async def load_conversation() -> tuple[Context.Context, Agent.Agent, list]:
+        context = await timed(timings, "context", load_context(context_id))
+        (agent, tools), _ = await gather_or_cancel(
+            load_agent_and_tools(context),
+            timed(timings, "model", warm_model(context.model_id)),
+        )
+        return context, agent, tools
+
+    conversation = asyncio.ensure_future(load_conversation())
+    try:
+        # Auth's outcome comes first, so a failed load (say, an unknown context_id) tells an
+        # unauthenticated caller nothing
+        user, key_contents = await timed(timings, "auth", authenticate(access_token))
+        context, agent, tools = await conversation
+    except BaseException:
+        conversation.cancel()
+        # If the load had failed too, its error is superseded rather than left unretrieved
+        conversation.add_done_callback(lambda task: task.cancelled() or task.exception())
+        raise
+    Log.bind(context_id=context_id)
+
+    # Public agents are always accessible; otherwise the agent must be in one of the user's orgs
+    agent = Agent.check_agent_access(agent, user)
 
     # Authorization: if the API key is scoped to a client_id, it must match the
     # context's client_id. Otherwise fall back to the classic user_id ownership
@@ -64,24 +159,15 @@ async def connect_to_context(connection_id: str, context_id: str, access_token:
         if context.user_id != "public" and context.user_id != user.user_id:
             raise Exception("Context does not belong to user", 403)
 
-    # Context dict - passed to agent for events
-    context_dict = context.model_dump()
-
     # Tool call listener - tool call notification used in agent
     async def on_tool_call(id, tool_name, tool_input):
-        print(f"Tool call: {id} {tool_name} {tool_input}")
-        await connection.peer.call(
-            method="on_tool_call",
-            params={
-                "tool_call_id": id,
-                "tool_name": tool_name,
-                "tool_input": tool_input,
-            }
-        )
+        Log.info("tool.call", "Tool call", tool_call_id=id, tool_name=tool_name, tool_input=tool_input)
+        await connection.send_tool_call(id, tool_name, tool_input)
 
     # Tool response listener - tool response notification used in agent
     async def on_tool_response(id, tool_name, tool_output):
-        print(f"Tool response: {id} {tool_name} {tool_output}")
+        Log.info("tool.response", "Tool response", tool_call_id=id, tool_name=tool_name, tool_output=tool_output)
+        await connection.flush_tokens()
         await connection.peer.call(
             method="on_tool_response",
             params={
@@ -91,30 +177,44 @@ async def connect_to_context(connection_id: str, context_id: str, access_token:
             }
         )
 
-    # Combine agent tools with context additional_agent_tools (remove duplicates)
-    agent_tool_ids = agent.tools if agent.tools else []
-    context_tool_ids = context.additional_agent_tools if context.additional_agent_tools else []
-    combined_tool_ids = list(dict.fromkeys(agent_tool_ids + context_tool_ids))  # Preserve order, remove duplicates
-    
-    # Get tool objects
-    tools = [Tool.get_agent_tool_with_id(tool_id) for tool_id in combined_tool_ids] if combined_tool_ids else []
-
-    # Create the agent chat stream
-    agent_chat = TokenStreamingAgentChat(
-        create_llm(context.model_id, for_streaming=True),
-        agent.prompt,
-        messages=dict_messages_to_base_messages(context.messages),
-        tools=tools,
-        context=context_dict,
-        on_tool_call=on_tool_call,
-        on_tool_response=on_tool_response,
-        on_response=build_tracking_callback(agent.org_id, context.model_id),
-        prompt_arg_names=agent.prompt_arg_names if agent.prompt_arg_names else []
-    )
+    def create_agent_chat(context: Context.Context, tools: list) -> TokenStreamingAgentChat:
+        # Create the agent chat stream
+        return TokenStreamingAgentChat(
+            create_llm(context.model_id, for_streaming=True),
+            agent.prompt,
+            messages=dict_messages_to_base_messages(context.messages),
+            tools=tools,
+            # Context dict - passed to agent for events
+            context=context.model_dump(),
+            on_tool_call=on_tool_call,
+            on_tool_response=on_tool_response,
+            on_response=build_tracking_callback(agent.org_id, context.model_id),
+            prompt_arg_names=agent.prompt_arg_names if agent.prompt_arg_names else [],
+            model_id=context.model_id,
+        )
+
+    # Rebuilds the agent after the connection was dehydrated for being idle
+    async def rehydrate():
+        context = await load_context(context_id)
+        tools, _ = await gather_or_cancel(load_tools(agent, context), warm_model(context.model_id))
+        connection.context = context
+        connection.agent_chat = create_agent_chat(context, tools)
+        connection.mark_messages_synced()
 
     # Set the connection's context and agent_chat - used later in message calls
+    build_started = time.perf_counter()
     connection.context = context
-    connection.agent_chat = agent_chat
+    connection.agent_chat = create_agent_chat(context, tools)
+    connection.mark_messages_synced()
+    timings["build"] = round((time.perf_counter() - build_started) * 1000, 3)
+    connection.rehydrate = rehydrate
+    connection.dehydrated = False
+
+    # Opt-in on_tokens coalescing - None when the client didn't ask for it
+    token_batching_options = connection.enable_token_batching(token_batching)
+
+    # Opt-in integer stream ids announced via on_stream_start instead of a UUID per frame
+    connection.short_stream_ids = bool(short_stream_ids)
 
     # Check if there are any AI messages with content (not just tool calls)
     has_ai_content = any(
@@ -125,13 +225,21 @@ async def connect_to_context(connection_id: str, context_id: str, access_token:
     # Invoke the first message if agent speaks first and no AI content messages exist
     generate_first_message = agent.agent_speaks_first and not has_ai_content
     if (generate_first_message):
-        asyncio.create_task(send_first_message(connection))
+        # Queued behind this handler on the serial lane, ahead of any add_message
+        connection.dispatcher.spawn(connection.dispatcher.run(SERIAL, send_first_message, connection))
+
+    timings["total"] = round((time.perf_counter() - started) * 1000, 3)
+    Log.info("connect", "Connected", timings_ms=timings)
 
     # Return acknowledgement
     return {
         "success": True,
         "agent_speaks_first": generate_first_message,
         "agent": agent.model_dump(),
+        "token_batching": token_batching_options,
+        "short_stream_ids": connection.short_stream_ids,
+        # Per-stage load times; stages in parallel overlap, so they add up to more than total
+        "timings_ms": timings,
     }
 
     
@@ -146,18 +254,20 @@ async def send_first_message(connection: Connection):
     token_stream = await agent.invoke()
     if token_stream:
         async for token in token_stream:
-            await connection.peer.call(method="on_token", params={"token": token, "response_id": response_id})
+            await connection.send_token(response_id, token)
 
     # Send stop token signal
-    await connection.peer.call(method="on_stop_token", params={"response_id": response_id})
+    await connection.send_stop_token(response_id)
 
-    # Save the new message to context 
+    # Save the new message to context (write-behind)
     connection.context.messages = base_messages_to_dict_messages(connection.agent_chat.messages)
-    Context.save_context(connection.context)
+    connection.mark_messages_synced()
+    PERSISTER.mark_dirty(connection.context)
 
     # Notify client of pending client-side tool calls
     if agent.pending_client_side_tool_calls:
-        await connection.peer.call(
+        await connection.send_stream_event(
+            response_id,
             method="on_client_side_tool_calls",
             params={
                 "tool_calls": agent.pending_client_side_tool_calls,
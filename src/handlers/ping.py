@@ -0,0 +1,9 @@
+import time
+
+
+async def ping(connection_id: str):
+    """
+    Lightweight liveness check. Dispatched concurrently, so it answers even
+    while a generation is streaming on the same connection.
+    """
+    return {"pong": True, "timestamp": time.time()}
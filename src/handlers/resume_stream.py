@@ -0,0 +1,47 @@
+from Models import Context
+from LLM.BaseMessagesConverter import dict_messages_to_base_messages
+from lib.Connection import Connection
+from lib.ConnectionDirectory import resume_remote_stream
+from stores.connections import CONNECTIONS
+from stores.persister import PERSISTER
+from stores.streams import STREAMS
+
+
+async def resume_stream(connection_id: str, context_id: str, response_id: str, last_seq: int = 0):
+    """
+    Reattach to a response that was streaming when the client's previous
+    socket dropped. Frames after last_seq are replayed from the stream's
+    buffer, then live frames follow on this connection. Returns once the
+    response has finished and been persisted.
+    """
+    # Get the connection
+    connection: Connection = CONNECTIONS[connection_id]
+
+    # The client must already be connected to the same context
+    if connection.context is None or connection.context.context_id != context_id:
+        raise Exception("Connect to the context before resuming a stream", 403)
+
+    stream = STREAMS.get(response_id)
+    if stream:
+        stream.check_resume(context_id, last_seq)
+        replayed = await connection.attach_stream(stream, last_seq)
+        await stream.wait_finished()
+        connection.attached_streams.discard(stream)
+        result = {"replayed": replayed, "last_seq": stream.seq}
+    else:
+        # The reconnect may have landed on a different worker than the generation
+        result = await resume_remote_stream(connection, context_id, response_id, last_seq)
+        if result is None:
+            raise Exception("Stream not found or expired", 404)
+
+    # Pick up the turn the original handler saved
+    await PERSISTER.flush(context_id)
+    connection.context = await Context.aget_context(context_id)
+    if connection.agent_chat:
+        connection.agent_chat.messages = dict_messages_to_base_messages(connection.context.messages)
+
+    return {
+        "success": True,
+        "replayed": result["replayed"],
+        "last_seq": result["last_seq"],
+    }
@@ -3,6 +3,7 @@ from Models import Context
 from LLM.BaseMessagesConverter import base_messages_to_dict_messages, dict_messages_to_base_messages
 from lib.Connection import Connection
 from stores.connections import CONNECTIONS
+from stores.persister import PERSISTER
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from LLM.ContentNormalizer import normalize_content
 
@@ -48,9 +49,10 @@ async def set_last_messages(connection_id: str, human_message: str, ai_message:
     # Update agent messages
     agent.messages = messages
     
-    # Save context with updated messages to database (before re-invoke)
+    # Save context with updated messages (write-behind, coalesced with the save after streaming)
     connection.context.messages = base_messages_to_dict_messages(agent.messages)
-    Context.save_context(connection.context)
+    connection.mark_messages_synced()
+    PERSISTER.mark_dirty(connection.context)
     
     # Re-invoke the agent and stream tokens
     token_stream = await agent.invoke()
@@ -61,18 +63,20 @@ async def set_last_messages(connection_id: str, human_message: str, ai_message:
     # Stream tokens
     if token_stream:
         async for token in token_stream:
-            await connection.peer.call(method="on_token", params={"token": token, "response_id": response_id})
+            await connection.send_token(response_id, token)
     
     # Send stop token signal
-    await connection.peer.call(method="on_stop_token", params={"response_id": response_id})
+    await connection.send_stop_token(response_id)
     
     # Save the final messages to context after streaming completes
     connection.context.messages = base_messages_to_dict_messages(agent.messages)
-    Context.save_context(connection.context)
+    connection.mark_messages_synced()
+    PERSISTER.mark_dirty(connection.context)
     
     # Notify client of pending client-side tool calls
     if agent.pending_client_side_tool_calls:
-        await connection.peer.call(
+        await connection.send_stream_event(
+            response_id,
             method="on_client_side_tool_calls",
             params={
                 "tool_calls": agent.pending_client_side_tool_calls,
@@ -82,7 +86,7 @@ async def set_last_messages(connection_id: str, human_message: str, ai_message:
 
     # Check if there are chat events to send
     if agent.context.get("events"):
-        await connection.peer.call(method="on_events", params={"events": agent.context["events"], "response_id": response_id})
+        await connection.send_stream_event(response_id, method="on_events", params={"events": agent.context["events"], "response_id": response_id})
         agent.context["events"] = []
 
 
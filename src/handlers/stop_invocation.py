@@ -12,10 +12,12 @@ async def stop_invocation(connection_id: str):
     
     # Check that connection has agent_chat
     if connection.agent_chat is None:
+        if connection.dehydrated:
+            return {"success": True}  # Idle and unloaded - nothing is generating
         raise Exception("No agent_chat set for connection")
     
-    # Call stop_invocation on the agent
-    connection.agent_chat.stop_invocation()
+    # Stop the agent, and any stream resumed onto this connection
+    connection.stop_generation()
     
     return {"success": True}
 
@@ -0,0 +1,92 @@
+import decimal
+import json
+from enum import Enum
+from typing import Any, List, Optional, Tuple, Union
+from lib import FrameEncoder
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency - binary subprotocol is simply not offered
+    msgpack = None
+
+
+class JSONCodec:
+    """JSON text frames - the default for browser clients."""
+    name = "json"
+    binary = False
+
+    def encode(self, obj: Any) -> str:
+        return FrameEncoder.dumps(obj)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+    def stream_key(self, response_id: str, stream_id: Optional[int] = None) -> str:
+        return FrameEncoder.render_stream_key(response_id, stream_id)
+
+    def encode_on_token(self, token: str, stream_key: str, seq: int) -> str:
+        return FrameEncoder.encode_on_token(token, stream_key, seq)
+
+    def encode_on_tokens(self, tokens: List[str], stream_key: str, seq: int) -> str:
+        return FrameEncoder.encode_on_tokens(tokens, stream_key, seq)
+
+    def encode_on_stop_token(self, stream_key: str, seq: int) -> str:
+        return FrameEncoder.encode_on_stop_token(stream_key, seq)
+
+    def encode_on_tool_call(self, tool_call_id: str, tool_name: str, tool_input: Any) -> str:
+        return FrameEncoder.encode_on_tool_call(tool_call_id, tool_name, tool_input)
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj % 1 == 0 else float(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj)} is not MessagePack serializable")
+
+
+class MsgPackCodec:
+    """MessagePack binary frames carrying the same JSON-RPC message shapes."""
+    name = "msgpack"
+    binary = True
+
+    def encode(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True, default=_msgpack_default)
+
+    def decode(self, data: Union[str, bytes]) -> Any:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return msgpack.unpackb(data, raw=False)
+
+    def stream_key(self, response_id: str, stream_id: Optional[int] = None) -> Tuple[str, Any]:
+        return ("stream_id", stream_id) if stream_id is not None else ("response_id", response_id)
+
+    def encode_on_token(self, token: str, stream_key: Tuple[str, Any], seq: int) -> bytes:
+        return self.encode({"method": "on_token", "params": {"token": token, "seq": seq, stream_key[0]: stream_key[1]}})
+
+    def encode_on_tokens(self, tokens: List[str], stream_key: Tuple[str, Any], seq: int) -> bytes:
+        return self.encode({"method": "on_tokens", "params": {"tokens": tokens, "seq": seq, stream_key[0]: stream_key[1]}})
+
+    def encode_on_stop_token(self, stream_key: Tuple[str, Any], seq: int) -> bytes:
+        return self.encode({"method": "on_stop_token", "params": {"seq": seq, stream_key[0]: stream_key[1]}})
+
+    def encode_on_tool_call(self, tool_call_id: str, tool_name: str, tool_input: Any) -> bytes:
+        return self.encode({
+            "method": "on_tool_call",
+            "params": {"tool_call_id": tool_call_id, "tool_name": tool_name, "tool_input": tool_input},
+        })
+
+
+# Sec-WebSocket-Protocol value -> codec. Clients that offer none of these get JSON.
+SUBPROTOCOL_CODECS = {"jsonrpc.json": JSONCodec}
+if msgpack is not None:
+    SUBPROTOCOL_CODECS["jsonrpc.msgpack"] = MsgPackCodec
+
+
+def negotiate_codec(requested_subprotocols: List[str]):
+    """Pick the first subprotocol the client offered that we support. Returns (codec, subprotocol)."""
+    for subprotocol in requested_subprotocols or []:
+        codec_class = SUBPROTOCOL_CODECS.get(subprotocol)
+        if codec_class:
+            return codec_class(), subprotocol
+    return JSONCodec(), None
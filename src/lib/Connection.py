@@ -1,37 +1,126 @@
+import asyncio
+import time
 import uuid
-from typing import Callable, Dict, Any, Optional, Awaitable
+from typing import Callable, Dict, Any, Optional, Awaitable, List, Union
 from fastapi import WebSocket
 from lib.JSONRPCPeer import JSONRPCPeer
-from Models.Context import Context
+from lib.TokenBatcher import TokenBatcher
+from lib.Dispatcher import Dispatcher, SERIAL, CONCURRENT
+from lib.OutboundQueue import OutboundQueue
+from lib.Codecs import JSONCodec
+from lib.ResponseStream import ResponseStream, TOKEN, STOP, EVENT
+from stores.streams import STREAMS, evict_expired_streams
+from stores.bus import BUS
+from stores.persister import PERSISTER
+from Models import Context
 from LLM.TokenStreamingAgentChat import TokenStreamingAgentChat
+from LLM.BaseMessagesConverter import base_messages_to_dict_messages, dict_messages_to_base_messages
+from lib import MemoryEstimator
+from lib import Log
 
 
 class Connection:
-    def __init__(self, websocket: WebSocket):
+    def __init__(self, websocket: WebSocket, codec=None, subprotocol: Optional[str] = None):
         self.websocket = websocket
         self.id = str(uuid.uuid4())
-        self.peer = JSONRPCPeer(sender=self.send)
-        self.context: Context = None
+        # Negotiated from Sec-WebSocket-Protocol, see Codecs.negotiate_codec
+        self.codec = codec or JSONCodec()
+        self.subprotocol = subprotocol
+        self.peer = JSONRPCPeer(sender=self.send, codec=self.codec)
+        self.context: Context.Context = None
         self.agent_chat: TokenStreamingAgentChat = None
+        # Set when the client opts into on_tokens coalescing in connect_to_context
+        self.token_batcher: Optional[TokenBatcher] = None
+        # response_id -> codec-specific stream reference, see codec.stream_key
+        self.stream_keys: Dict[str, Any] = {}
+        # Set when the client opts into integer stream ids in connect_to_context
+        self.short_stream_ids = False
+        self.next_stream_id = 1
+        # Streams from an earlier socket that were resumed onto this one
+        self.attached_streams: set[ResponseStream] = set()
+        # response_ids of streams resumed from another worker, see ConnectionDirectory
+        self.remote_streams: set[str] = set()
+        self.closed = False
+        # Set while the server drains - only CONCURRENT methods (stop, ping) are still accepted
+        self.draining = False
+        # Idle connections can drop their agent_chat (dehydrate) and rebuild it
+        # on the next request with the rehydrate callback set by connect_to_context
+        self.last_activity = time.monotonic()
+        self.dehydrated = False
+        self.rehydrate: Optional[Callable[[], Awaitable[None]]] = None
+        self.hydrate_lock = asyncio.Lock()
+        self.messages_size = MemoryEstimator.MessagesSizeCache()
+        # Shallow copies of context.messages and agent_chat.messages from when they last matched,
+        # so sync_agent_messages converts only what changed since
+        self.synced_messages: Optional[tuple[list, list]] = None
+        self.tools_size = (None, 0)
+        self.dispatcher = Dispatcher(on_supersede=self._abort_generation, is_generating=self._is_generating)
+        # Single writer per socket - producers never await the network directly
+        self.outbound = OutboundQueue(
+            write=self.websocket.send_bytes if self.codec.binary else self.websocket.send_text,
+            encode_tokens=self._encode_tokens,
+            on_slow_consumer=self._close_slow_consumer,
+        )
 
-    async def send(self, message: str):
-        await self.websocket.send_text(message)
+    async def send(self, message: Union[str, bytes]):
+        if self.closed:
+            return
+        try:
+            await self.outbound.put(message)
+        except ConnectionError:
+            pass  # Socket went away mid-stream - the generation keeps going for resume_stream
+
+    def _encode_tokens(self, stream_key, tokens: List[str], seq: int) -> Union[str, bytes]:
+        return self.codec.encode_on_token("".join(tokens), stream_key, seq)
+
+    async def _close_slow_consumer(self):
+        Log.warning("connection", "Dropping slow consumer", connection_id=self.id, outbound=self.outbound.stats())
+        await self.websocket.close(code=1013)
 
     async def receive_loop(self):
         try:
             while True:
-                message = await self.websocket.receive_text()
-                await self.peer.handle_message(message)
+                if self.codec.binary:
+                    message = await self.websocket.receive_bytes()
+                else:
+                    message = await self.websocket.receive_text()
+                self.last_activity = time.monotonic()
+                # Handlers run as tracked tasks so control messages are never stuck behind a stream
+                self.dispatcher.spawn(self.peer.handle_message(message))
         except Exception as e:
-            print(f"[Connection {self.id}] WebSocket error:", e)
+            Log.info("connection", "WebSocket closed", error=e)
         finally:
-            await self.websocket.close()
+            # Running generations are left to finish: they persist the turn and
+            # keep recording frames so the client can resume_stream elsewhere
+            self.closed = True
+            if self.token_batcher:
+                self.token_batcher.close()
+            await self.outbound.close()
+            self.peer.cancel_pending()
+            try:
+                await self.websocket.close()
+            except RuntimeError:
+                pass  # Already closed - by the client, or by us (drain, slow consumer)
+
+    def on(self, method: str, handler: Callable[..., Awaitable[Any]], policy: str = SERIAL, streaming: bool = False):
+        async def hydrated_handler(**params):
+            await self.ensure_hydrated()
+            return await handler(**params)
 
-    def on(self, method: str, handler: Callable[..., Awaitable[Any]]):
         async def wrapped_handler(**params):
-            return await handler(connection_id=self.id, **params)
+            if self.draining and policy != CONCURRENT:
+                raise Exception("Server is restarting, reconnect to continue", 503)
+            if self.context:
+                Log.bind(context_id=self.context.context_id)
+            try:
+                # stop_invocation / ping never need the agent rebuilt
+                run = handler if policy == CONCURRENT else hydrated_handler
+                return await self.dispatcher.run(policy, run, connection_id=self.id, **params)
+            finally:
+                self.last_activity = time.monotonic()
 
-        self.peer.on(method, wrapped_handler)
+        # streaming: the handler returns when its generation does (see JSONRPCPeer batches)
+        self.peer.on(method, wrapped_handler, streaming=streaming)
 
     async def call(
         self,
@@ -42,7 +131,223 @@ class Connection:
     ) -> Optional[Dict[str, Any]]:
         return await self.peer.call(method, params, await_response, timeout)
 
+    def _is_generating(self) -> bool:
+        """Whether a generation is streaming to this connection, its own or a resumed one."""
+        generating = self.agent_chat is not None and self.agent_chat.is_generating
+        return generating or bool(self.attached_streams) or bool(self.remote_streams)
+
+    def _abort_generation(self):
+        if self.agent_chat:
+            self.agent_chat.stop_invocation()
+        for stream in self.attached_streams:
+            stream.stop()
+        for response_id in self.remote_streams:
+            self.dispatcher.spawn(BUS.broadcast("stop_stream", {"response_id": response_id}))
+
+    def stop_generation(self):
+        self._abort_generation()
+
+    def enable_token_batching(self, options) -> Optional[dict]:
+        """Turn on on_tokens coalescing; returns the effective options or None if not requested."""
+        self.token_batcher = TokenBatcher.from_options(self._send_token_batch, options)
+        return self.token_batcher.options() if self.token_batcher else None
+
+    async def _get_stream_key(self, response_id: str):
+        stream_key = self.stream_keys.get(response_id)
+        if stream_key is not None:
+            return stream_key
+
+        stream_id = None
+        if self.short_stream_ids:
+            stream_id = self.next_stream_id
+            self.next_stream_id += 1
+            await self.peer.call(method="on_stream_start", params={"response_id": response_id, "stream_id": stream_id})
+
+        stream_key = self.stream_keys[response_id] = self.codec.stream_key(response_id, stream_id)
+        return stream_key
+
+    async def _send_token_batch(self, response_id: str, tokens: List[str], seq: int):
+        await self.send(self.codec.encode_on_tokens(tokens, self.stream_keys[response_id], seq))
+
+    def _get_stream(self, response_id: str) -> ResponseStream:
+        stream = STREAMS.get(response_id)
+        if stream is None:
+            evict_expired_streams()
+            stream = STREAMS[response_id] = ResponseStream(
+                response_id,
+                context_id=self.context.context_id if self.context else None,
+                connection=self,
+                agent_chat=self.agent_chat,
+            )
+            Log.bind(response_id=response_id)
+        return stream
+
+    async def send_token(self, response_id: str, token: str):
+        stream = self._get_stream(response_id)
+        seq = stream.record(TOKEN, token)
+        # Delivered to whichever socket currently owns the stream
+        await stream.connection._deliver(response_id, seq, TOKEN, token)
+
+    async def flush_tokens(self):
+        """Push out any batched tokens so they precede the next non-token notification."""
+        if self.token_batcher:
+            await self.token_batcher.flush_all()
+
+    async def send_stop_token(self, response_id: str):
+        stream = self._get_stream(response_id)
+        seq = stream.record(STOP, None)
+        await stream.connection._deliver(response_id, seq, STOP, None)
+
+    async def send_stream_event(self, response_id: str, method: str, params: Dict[str, Any]):
+        """Response-scoped notification (e.g. on_events) - sequenced and replayable like tokens."""
+        stream = self._get_stream(response_id)
+        seq = stream.record(EVENT, (method, params))
+        await stream.connection._deliver(response_id, seq, EVENT, (method, params))
+
+    async def _deliver(self, response_id: str, seq: int, kind: str, payload: Any):
+        if self.closed:
+            return
+        try:
+            if kind == TOKEN:
+                stream_key = await self._get_stream_key(response_id)
+                if self.token_batcher:
+                    await self.token_batcher.add(response_id, payload, seq)
+                else:
+                    await self.outbound.put_token(stream_key, payload, seq)
+            elif kind == STOP:
+                if self.token_batcher:
+                    await self.token_batcher.flush(response_id)
+                stream_key = await self._get_stream_key(response_id)
+                await self.send(self.codec.encode_on_stop_token(stream_key, seq))
+                self.stream_keys.pop(response_id, None)
+            else:
+                method, params = payload
+                await self.flush_tokens()
+                await self.send(self.peer.encode(method, {**params, "seq": seq}))
+        except ConnectionError:
+            pass
+
+    async def attach_stream(self, stream: ResponseStream, last_seq: int) -> int:
+        """Replay a stream from last_seq and take over its live frames. Returns frames replayed."""
+        replayed = await stream.attach(self, last_seq)
+        self.attached_streams.add(stream)
+        return replayed
+
+    async def send_tool_call(self, tool_call_id: str, tool_name: str, tool_input: dict):
+        await self.flush_tokens()
+        await self.send(self.codec.encode_on_tool_call(tool_call_id, tool_name, tool_input))
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None, flush_timeout: float = 2.0):
+        """Close from the server side once queued frames have been written."""
+        await self.flush_tokens()
+        await self.outbound.wait_empty(flush_timeout)
+        await self.websocket.close(code=code, reason=reason)
+
+    @property
+    def is_idle(self) -> bool:
+        return self.dispatcher.active_count == 0 and not self.attached_streams and not self.remote_streams
+
+    @property
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_activity
+
+    def mark_messages_synced(self):
+        """Record that context.messages and agent_chat.messages hold the same conversation."""
+        self.synced_messages = (list(self.context.messages), list(self.agent_chat.messages))
+
+    def sync_agent_messages(self) -> int:
+        """
+        Bring agent_chat.messages up to date with context.messages, e.g. after the
+        context was reloaded. Messages both still share with the last synced state
+        are kept as they are; only the rest are converted. Returns how many were.
+        """
+        messages = self.context.messages
+        start = 0
+        if self.synced_messages is not None:
+            synced_dicts, synced_agent = self.synced_messages
+            agent_messages = self.agent_chat.messages
+            limit = min(len(synced_dicts), len(messages), len(agent_messages))
+            # Identity first: an unchanged list shares its message objects with the synced copy
+            while start < limit and agent_messages[start] is synced_agent[start] and (
+                    messages[start] is synced_dicts[start] or messages[start] == synced_dicts[start]):
+                start += 1
+        self.agent_chat.messages = self.agent_chat.messages[:start] + dict_messages_to_base_messages(messages[start:])
+        self.mark_messages_synced()
+        return len(messages) - start
+
+    async def persist_messages(self) -> bool:
+        """Save the in-memory conversation now, with any write-behind save still pending. True if saved."""
+        if self.context is None or self.agent_chat is None:
+            return False
+        messages = base_messages_to_dict_messages(self.agent_chat.messages)
+        if messages != self.context.messages:
+            self.context.messages = messages
+            self.mark_messages_synced()
+            PERSISTER.mark_dirty(self.context)
+        return await PERSISTER.flush(self.context.context_id)
+
+    async def dehydrate(self) -> int:
+        """Persist and drop the agent state of an idle connection. Returns the estimated bytes freed."""
+        if self.agent_chat is None or self.rehydrate is None or not self.is_idle:
+            return 0
+        freed = self.memory()["total_bytes"]
+        await self.flush_tokens()
+        await self.persist_messages()
+        self.agent_chat = None
+        self.synced_messages = None
+        self.tools_size = (None, 0)
+        self.messages_size = MemoryEstimator.MessagesSizeCache()
+        # Keep the context for its id and header fields. Its stored state holds the whole
+        # history too, so that goes as well - handlers rehydrate (reload it) before any save.
+        context = self.context.model_copy(update={"messages": []})
+        context._stored_item = None
+        context._stored_messages = None
+        self.context = context
+        self.dehydrated = True
+        Log.info("connection", "Dehydrated", connection_id=self.id, bytes_freed=freed)
+        return freed
+
+    async def ensure_hydrated(self):
+        if not self.dehydrated:
+            return
+        async with self.hydrate_lock:
+            if self.dehydrated:
+                await self.rehydrate()
+                self.dehydrated = False
+                Log.info("connection", "Rehydrated")
+
+    def memory(self) -> dict:
+        """Estimated bytes retained by this connection's agent state, see MemoryEstimator."""
+        if self.agent_chat is None:
+            return {"messages_bytes": 0, "tools_bytes": 0, "agent_chat_bytes": 0, "total_bytes": 0}
+        messages_bytes = self.messages_size.measure(self.agent_chat.messages)
+        if self.tools_size[0] is not self.agent_chat:
+            self.tools_size = (self.agent_chat, MemoryEstimator.tools_bytes(self.agent_chat))
+        tools_bytes = self.tools_size[1]
+        agent_chat_bytes = MemoryEstimator.AGENT_CHAT_OVERHEAD_BYTES
+        return {
+            "messages_bytes": messages_bytes,
+            "tools_bytes": tools_bytes,
+            "agent_chat_bytes": agent_chat_bytes,
+            "total_bytes": messages_bytes + tools_bytes + agent_chat_bytes,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "connection_id": self.id,
+            "context_id": self.context.context_id if self.context else None,
+            "codec": self.codec.name,
+            "active_tasks": self.dispatcher.active_count,
+            "idle_seconds": round(self.idle_seconds, 1),
+            "dehydrated": self.dehydrated,
+            "memory": self.memory(),
+            "outbound": self.outbound.stats(),
+        }
+
     async def start(self):
-        await self.websocket.accept()
-        print(f"[Connection {self.id}] Connection accepted")
+        await self.websocket.accept(subprotocol=self.subprotocol)
+        self.outbound.start()
+        # Inherited by every handler task spawned from the receive loop
+        Log.bind(connection_id=self.id)
+        Log.info("connection", "Connection accepted", codec=self.codec.name)
         await self.receive_loop()
@@ -0,0 +1,183 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Optional
+from lib.Connection import Connection
+from lib.MessageBus import MessageBus
+from lib import Log
+from stores.bus import BUS
+from stores.connections import CONNECTIONS
+from stores.streams import STREAMS
+
+# Cross-worker view of connections and streams. Each worker only holds its
+# own sockets in CONNECTIONS/STREAMS; anything addressed to a connection,
+# context or stream that isn't local is asked of the other workers over the
+# bus, and only the owner answers.
+
+# Frames a remote connection may have waiting for the bus before it is given up on.
+# Its stream keeps recording them, so the client can resume again.
+REMOTE_OUTBOX_MAX_FRAMES = int(os.environ.get("REMOTE_OUTBOX_MAX_FRAMES", "4096"))
+
+
+class RemoteConnection:
+    """
+    Stand-in for a connection on another worker - stream frames are forwarded over the bus.
+
+    Delivering only queues the frame: one sender task per remote connection sends
+    everything queued since its last bus call as a single message, so the generation
+    streams at the model's pace rather than one bus round trip per token.
+    """
+
+    def __init__(self, worker_id: str, connection_id: str):
+        self.worker_id = worker_id
+        self.connection_id = connection_id
+        self.closed = False
+        # [response_id, seq, kind, payload] waiting for the sender, in order
+        self.outbox: List[list] = []
+        self.sender: Optional[asyncio.Task] = None
+
+    async def _deliver(self, response_id: str, seq: int, kind: str, payload: Any):
+        if self.closed:
+            return
+        if len(self.outbox) >= REMOTE_OUTBOX_MAX_FRAMES:
+            Log.warning("bus", "Remote connection fell behind", worker_id=BUS.worker_id, remote_worker_id=self.worker_id, remote_connection_id=self.connection_id)
+            self._lose()
+            return
+        self.outbox.append([response_id, seq, kind, payload])
+        if self.sender is None or self.sender.done():
+            self.sender = asyncio.create_task(self._send_outbox())
+
+    async def _send_outbox(self):
+        while self.outbox and not self.closed:
+            frames, self.outbox = self.outbox, []
+            try:
+                delivered = await BUS.send(self.worker_id, "deliver_frames", {"connection_id": self.connection_id, "frames": frames})
+            except Exception as e:
+                Log.warning("bus", "Lost remote connection", worker_id=BUS.worker_id, remote_worker_id=self.worker_id, remote_connection_id=self.connection_id, error=e)
+                delivered = False
+            # Frames keep being recorded, so the client can resume again elsewhere
+            if not delivered:
+                self._lose()
+
+    def _lose(self):
+        self.closed = True
+        self.outbox.clear()
+
+    async def drain(self):
+        """Wait until every frame queued so far has been sent (or the connection is lost)."""
+        while self.sender is not None and not self.sender.done():
+            await asyncio.wait([self.sender])
+
+
+def _local_connections_for_context(context_id: str) -> List[Connection]:
+    return [
+        connection for connection in CONNECTIONS.values()
+        if connection.context and connection.context.context_id == context_id and not connection.closed
+    ]
+
+
+async def stop_connection(connection_id: str) -> bool:
+    """stop_invocation on a connection, wherever it lives. False if no worker has it."""
+    connection = CONNECTIONS.get(connection_id)
+    if connection:
+        connection.stop_generation()
+        return True
+    return bool(await BUS.request_any("stop_invocation", {"connection_id": connection_id}))
+
+
+async def notify_context(context_id: str, method: str, params: Dict[str, Any]) -> int:
+    """Send a notification to every connection on a context across workers. Returns how many got it."""
+    notified = await _on_notify_context(context_id, method, params)
+    replies = await BUS.broadcast("notify_context", {"context_id": context_id, "method": method, "params": params})
+    return notified + sum(replies)
+
+
+async def list_connections() -> List[dict]:
+    connections = await _on_list_connections()
+    for worker_connections in await BUS.broadcast("list_connections", {}):
+        connections.extend(worker_connections)
+    return connections
+
+
+async def resume_remote_stream(connection: Connection, context_id: str, response_id: str, last_seq: int) -> Optional[dict]:
+    """
+    Resume a stream that is running on another worker onto this connection.
+    Returns once the response has finished, or None if no worker has it.
+    """
+    connection.remote_streams.add(response_id)
+    try:
+        result = await BUS.request_any("resume_stream", {
+            "worker_id": BUS.worker_id,
+            "connection_id": connection.id,
+            "context_id": context_id,
+            "response_id": response_id,
+            "last_seq": last_seq,
+        }, timeout=None)
+    finally:
+        connection.remote_streams.discard(response_id)
+    if result and result.get("error"):
+        raise Exception(result["error"], result.get("code"))
+    return result
+
+
+# Bus handlers - reply None when the addressee isn't on this worker
+
+async def _on_stop_invocation(connection_id: str) -> Optional[bool]:
+    connection = CONNECTIONS.get(connection_id)
+    if not connection:
+        return None
+    connection.stop_generation()
+    return True
+
+
+async def _on_stop_stream(response_id: str) -> Optional[bool]:
+    stream = STREAMS.get(response_id)
+    if not stream:
+        return None
+    stream.stop()
+    return True
+
+
+async def _on_notify_context(context_id: str, method: str, params: Dict[str, Any]) -> int:
+    connections = _local_connections_for_context(context_id)
+    for connection in connections:
+        await connection.call(method, params)
+    return len(connections)
+
+
+async def _on_list_connections() -> List[dict]:
+    return [dict(connection.stats(), worker_id=BUS.worker_id) for connection in CONNECTIONS.values()]
+
+
+async def _on_resume_stream(worker_id: str, connection_id: str, context_id: str, response_id: str, last_seq: int) -> Optional[dict]:
+    stream = STREAMS.get(response_id)
+    if not stream:
+        return None
+    try:
+        stream.check_resume(context_id, last_seq)
+    except Exception as e:
+        return {"error": e.args[0], "code": e.args[1]}
+
+    remote = RemoteConnection(worker_id, connection_id)
+    replayed = await stream.attach(remote, last_seq)
+    await stream.wait_finished()
+    # The requester returns on this reply, so its frames must be there first
+    await remote.drain()
+    return {"replayed": replayed, "last_seq": stream.seq}
+
+
+async def _on_deliver_frames(connection_id: str, frames: List[list]) -> bool:
+    connection = CONNECTIONS.get(connection_id)
+    if not connection or connection.closed:
+        return False
+    for response_id, seq, kind, payload in frames:
+        await connection._deliver(response_id, seq, kind, payload)
+    return True
+
+
+def register_bus_handlers(bus: MessageBus = BUS):
+    bus.on("stop_invocation", _on_stop_invocation)
+    bus.on("stop_stream", _on_stop_stream)
+    bus.on("notify_context", _on_notify_context)
+    bus.on("list_connections", _on_list_connections)
+    bus.on("resume_stream", _on_resume_stream)
+    bus.on("deliver_frames", _on_deliver_frames)
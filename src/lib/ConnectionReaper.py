@@ -0,0 +1,111 @@
+import asyncio
+import os
+from typing import Optional
+from lib import Log
+from stores.connections import CONNECTIONS
+from stores.drain import DRAINER
+from stores.streams import evict_expired_streams
+
+REAPER_INTERVAL_SECONDS = float(os.environ.get("REAPER_INTERVAL_SECONDS", "30"))
+# Idle connections drop their agent_chat after this long, and are closed after IDLE_TIMEOUT_SECONDS
+IDLE_DEHYDRATE_SECONDS = float(os.environ.get("IDLE_DEHYDRATE_SECONDS", "300"))
+IDLE_TIMEOUT_SECONDS = float(os.environ.get("IDLE_TIMEOUT_SECONDS", "3600"))
+# Soft cap on the estimated agent memory of this worker; 0 disables it
+MEMORY_CAP_BYTES = int(float(os.environ.get("MEMORY_CAP_MB", "1024")) * 1024 * 1024)
+
+
+class ConnectionReaper:
+    """
+    Periodic sweep over this worker's connections.
+
+    Idle connections are dehydrated (conversation persisted, agent_chat
+    dropped, rebuilt on the next request) and eventually closed. When the
+    estimated total exceeds the memory cap, the least recently active idle
+    connections are dehydrated early until it fits. Finished streams past
+    their replay TTL are dropped too, so a quiet worker doesn't keep them.
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float = REAPER_INTERVAL_SECONDS,
+        dehydrate_after_seconds: float = IDLE_DEHYDRATE_SECONDS,
+        timeout_seconds: float = IDLE_TIMEOUT_SECONDS,
+        memory_cap_bytes: int = MEMORY_CAP_BYTES,
+    ):
+        self.interval_seconds = interval_seconds
+        self.dehydrate_after_seconds = dehydrate_after_seconds
+        self.timeout_seconds = timeout_seconds
+        self.memory_cap_bytes = memory_cap_bytes
+        self.task: Optional[asyncio.Task] = None
+        self.last_sweep: Optional[dict] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.sweep()
+            except Exception as e:
+                Log.error("reaper", "Error sweeping connections", error=e)
+
+    async def sweep(self) -> dict:
+        if DRAINER.draining:
+            return self.last_sweep  # The drain persists and closes everything itself
+        report = {"closed": 0, "dehydrated": 0, "dehydrated_for_cap": 0, "bytes_freed": 0}
+        report["streams_evicted"] = evict_expired_streams()
+
+        for connection in list(CONNECTIONS.values()):
+            if not connection.is_idle or connection.closed:
+                continue
+            if connection.idle_seconds >= self.timeout_seconds:
+                report["bytes_freed"] += await connection.dehydrate()
+                await connection.close(code=1000, reason="Idle timeout")
+                report["closed"] += 1
+            elif connection.idle_seconds >= self.dehydrate_after_seconds and not connection.dehydrated:
+                freed = await connection.dehydrate()
+                if freed:
+                    report["dehydrated"] += 1
+                    report["bytes_freed"] += freed
+
+        total = self.total_bytes()
+        if self.memory_cap_bytes and total > self.memory_cap_bytes:
+            # Least recently active first
+            candidates = sorted(
+                (connection for connection in CONNECTIONS.values() if connection.is_idle and not connection.dehydrated),
+                key=lambda connection: connection.last_activity,
+            )
+            for connection in candidates:
+                if total <= self.memory_cap_bytes:
+                    break
+                freed = await connection.dehydrate()
+                total -= freed
+                if freed:
+                    report["dehydrated_for_cap"] += 1
+                    report["bytes_freed"] += freed
+            if total > self.memory_cap_bytes:
+                Log.warning("reaper", "Still over memory cap after dehydrating idle connections", total_bytes=total)
+
+        report["total_bytes"] = total
+        self.last_sweep = report
+        if report["closed"] or report["dehydrated"] or report["dehydrated_for_cap"] or report["streams_evicted"]:
+            Log.info("reaper", "Sweep", report=report)
+        return report
+
+    def total_bytes(self) -> int:
+        return sum(connection.memory()["total_bytes"] for connection in CONNECTIONS.values())
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "dehydrate_after_seconds": self.dehydrate_after_seconds,
+            "timeout_seconds": self.timeout_seconds,
+            "memory_cap_bytes": self.memory_cap_bytes,
+            "total_bytes": self.total_bytes(),
+            "last_sweep": self.last_sweep,
+        }
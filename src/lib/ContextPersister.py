@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional
+from lib import Log
+from lib import Metrics
+from Models import Context
+
+# How long a changed context waits for more changes before it is written
+PERSIST_DELAY_SECONDS = float(os.environ.get("CONTEXT_PERSIST_DELAY_MS", "250")) / 1000
+# A failed save is retried after this long, doubling up to the max
+RETRY_SECONDS = 0.5
+MAX_RETRY_SECONDS = 30.0
+
+
+class PendingContext:
+    def __init__(self, context: Context.Context):
+        self.context = context
+        self.dirty = False
+        self.dirty_since = 0.0
+        self.failures = 0
+        # One save in flight per context, so saves land in the order they were made
+        self.lock = asyncio.Lock()
+        self.timer: Optional[asyncio.Task] = None
+
+
+class ContextPersister:
+    """
+    Write-behind saves for contexts changed by a turn.
+
+    Handlers call mark_dirty once the client has its response; the save runs
+    on a short timer instead of on the request path. Changes made while a
+    save is pending are coalesced into it - the latest Context object for an
+    id is what gets written. Saves of one context never overlap, and a save
+    that fails stays dirty and is retried with backoff.
+
+    Anything that reads a context back from DynamoDB on this worker must
+    flush it first; disconnect, drain and shutdown flush what is left.
+    """
+
+    def __init__(self, delay_seconds: float = PERSIST_DELAY_SECONDS):
+        self.delay_seconds = delay_seconds
+        self.pending: Dict[str, PendingContext] = {}
+
+    @property
+    def dirty_count(self) -> int:
+        return sum(1 for entry in self.pending.values() if entry.dirty)
+
+    def mark_dirty(self, context: Context.Context):
+        """Schedule a save of the context's current state."""
+        entry = self.pending.get(context.context_id)
+        if entry is None:
+            entry = self.pending[context.context_id] = PendingContext(context)
+        if entry.dirty:
+            Metrics.CONTEXT_WRITES_COALESCED.inc()
+        else:
+            entry.dirty = True
+            entry.dirty_since = time.monotonic()
+        entry.context = context
+        if entry.timer is None:
+            entry.timer = asyncio.create_task(self._flush_later(context.context_id, self.delay_seconds))
+
+    async def _flush_later(self, context_id: str, delay: float):
+        await asyncio.sleep(delay)
+        entry = self.pending.get(context_id)
+        if entry is None:
+            return
+        entry.timer = None
+        try:
+            await self.flush(context_id)
+        except Exception as e:
+            retry = min(RETRY_SECONDS * 2 ** (entry.failures - 1), MAX_RETRY_SECONDS)
+            Log.error("persister", "Error saving context, will retry", context_id=context_id, failures=entry.failures, retry_seconds=retry, error=e)
+            if entry.timer is None:
+                entry.timer = asyncio.create_task(self._flush_later(context_id, retry))
+
+    async def flush(self, context_id: str) -> bool:
+        """Save the context now if it has unsaved changes, after any save already running. True if saved."""
+        entry = self.pending.get(context_id)
+        if entry is None:
+            return False
+        async with entry.lock:
+            if not entry.dirty:
+                self._forget(context_id, entry)
+                return False
+            # asave_context takes its snapshot before the first await; changes after that mark it dirty again
+            context, dirty_since = entry.context, entry.dirty_since
+            entry.dirty = False
+            try:
+                await Context.asave_context(context)
+            except Exception:
+                if not entry.dirty:
+                    entry.dirty = True
+                    entry.dirty_since = dirty_since
+                entry.failures += 1
+                Metrics.CONTEXT_WRITES.inc(("failed",))
+                raise
+            entry.failures = 0
+            Metrics.CONTEXT_WRITES.inc(("saved",))
+            Metrics.CONTEXT_WRITE_DELAY.observe(time.monotonic() - dirty_since)
+            self._forget(context_id, entry)
+            return True
+
+    def _forget(self, context_id: str, entry: PendingContext):
+        if not entry.dirty and entry.timer is None and self.pending.get(context_id) is entry:
+            del self.pending[context_id]
+
+    async def flush_all(self) -> dict:
+        """Save every dirty context now. Used on drain and shutdown."""
+        context_ids = [context_id for context_id, entry in self.pending.items() if entry.dirty]
+        results = await asyncio.gather(*(self.flush(context_id) for context_id in context_ids), return_exceptions=True)
+        report = {"saved": [], "errors": []}
+        for context_id, result in zip(context_ids, results):
+            if isinstance(result, Exception):
+                Log.error("persister", "Error saving context", context_id=context_id, error=result)
+                report["errors"].append({"context_id": context_id, "error": str(result)})
+            elif result:
+                report["saved"].append(context_id)
+        return report
+
+    async def close(self) -> dict:
+        report = await self.flush_all()
+        for context_id, entry in list(self.pending.items()):
+            if entry.timer:
+                entry.timer.cancel()
+                entry.timer = None
+            self._forget(context_id, entry)
+        unsaved = [context_id for context_id, entry in self.pending.items() if entry.dirty]
+        if unsaved:
+            Log.warning("persister", "Contexts left unsaved at shutdown", context_ids=unsaved)
+        return report
+
+    def stats(self) -> dict:
+        return {
+            "delay_seconds": self.delay_seconds,
+            "pending": len(self.pending),
+            "dirty": self.dirty_count,
+        }
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Optional, Set
+from lib import Log
+
+# Dispatch policies
+SERIAL = "serial"          # One at a time per connection (i.e. per context), in arrival order
+CONCURRENT = "concurrent"  # Runs immediately, never waits behind a generation
+SUPERSEDE = "supersede"    # Aborts the generation in flight, then runs serialized
+
+# How long superseded work gets to wind down cooperatively before it is cancelled
+SUPERSEDE_GRACE_SECONDS = 0.5
+
+
+class SupersededError(Exception):
+    pass
+
+
+class Dispatcher:
+    """
+    Runs a connection's handlers as tracked tasks so the receive loop never
+    blocks on a long generation. Each handler runs under a dispatch policy.
+    """
+
+    def __init__(self, on_supersede: Optional[Callable[[], None]] = None, is_generating: Optional[Callable[[], bool]] = None):
+        self.on_supersede = on_supersede
+        self.is_generating = is_generating or (lambda: True)
+        self.tasks: Set[asyncio.Task] = set()
+        self.serial_lock = asyncio.Lock()
+        # The serial task holding the lock - the only one SUPERSEDE aborts, and only while it
+        # is generating. Queued requests (a user's next add_message) still run, in order.
+        self.running_task: Optional[asyncio.Task] = None
+        self.superseded_tasks: Set[asyncio.Task] = set()
+
+    def spawn(self, coro: Awaitable[Any]) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+        return task
+
+    def _on_task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            Log.error("dispatcher", "Error in dispatched task", error=task.exception())
+
+    async def run(self, policy: str, handler: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        if policy == CONCURRENT:
+            return await handler(*args, **kwargs)
+
+        if policy == SUPERSEDE:
+            await self._supersede()
+
+        task = asyncio.current_task()
+        try:
+            async with self.serial_lock:
+                self.running_task = task
+                try:
+                    return await handler(*args, **kwargs)
+                finally:
+                    self.running_task = None
+        except asyncio.CancelledError:
+            if task in self.superseded_tasks:
+                # Report to the caller instead of silently dropping the request
+                raise SupersededError("Invocation superseded by a newer request")
+            raise
+        finally:
+            self.superseded_tasks.discard(task)
+
+    async def _supersede(self):
+        task = self.running_task
+        # Nothing streaming (connect_to_context, a turn still loading): wait behind it instead
+        if task is None or task.done() or not self.is_generating():
+            return
+
+        # Give the running generation a chance to stop on its own (flushes on_stop_token)
+        if self.on_supersede:
+            self.on_supersede()
+        done, _ = await asyncio.wait({task}, timeout=SUPERSEDE_GRACE_SECONDS)
+
+        if not done:
+            self.superseded_tasks.add(task)
+            task.cancel()
+
+    @property
+    def active_count(self) -> int:
+        return len(self.tasks)
+
+    async def cancel_all(self):
+        for task in list(self.tasks):
+            task.cancel()
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
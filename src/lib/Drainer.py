@@ -0,0 +1,147 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+from typing import Callable, Optional
+from lib import Log
+from stores.connections import CONNECTIONS
+from stores.streams import STREAMS
+from stores.persister import PERSISTER
+from Models import TokenTracking
+
+DEFAULT_DEADLINE_SECONDS = float(os.environ.get("DRAIN_DEADLINE_SECONDS", "25"))
+# After the deadline, stopped generations get this long to save their own turn
+STOP_GRACE_SECONDS = 2.0
+
+# WebSocket close code for "server restarting, reconnect"
+SERVICE_RESTART = 1012
+
+
+class Drainer:
+    """
+    Takes this worker out of service without losing in-flight turns.
+
+    Once draining, new /ws upgrades are refused and /health fails so the
+    load balancer moves traffic away. Running invocations get until the
+    deadline to finish, are then stopped, and every connection's
+    agent_chat.messages is persisted before the sockets are closed.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.drain_task: Optional[asyncio.Task] = None
+        self.report: Optional[dict] = None
+
+    def drain(self, deadline_seconds: float = DEFAULT_DEADLINE_SECONDS) -> asyncio.Task:
+        """Start draining (idempotent) and return the task that resolves to the report."""
+        if self.drain_task is None:
+            self.drain_task = asyncio.create_task(self._drain(deadline_seconds))
+        return self.drain_task
+
+    def _pending_tasks(self) -> set:
+        tasks = set()
+        for connection in CONNECTIONS.values():
+            tasks.update(connection.dispatcher.tasks)
+        # Generations detached from a closed socket are only reachable through their stream
+        for stream in STREAMS.values():
+            if stream.task and not stream.task.done():
+                tasks.add(stream.task)
+        tasks.discard(asyncio.current_task())
+        return {task for task in tasks if not task.done()}
+
+    async def _wait_for_invocations(self, timeout: float) -> bool:
+        """Wait until no handler is running, or timeout. Tasks may spawn more, so re-check."""
+        deadline = time.monotonic() + timeout
+        while True:
+            pending = self._pending_tasks()
+            remaining = deadline - time.monotonic()
+            if not pending:
+                return True
+            if remaining <= 0:
+                return False
+            await asyncio.wait(pending, timeout=remaining)
+
+    async def _drain(self, deadline_seconds: float) -> dict:
+        started = time.monotonic()
+        self.draining = True
+        Log.warning("drain", "Draining", connections=len(CONNECTIONS), deadline_seconds=deadline_seconds)
+        report = {
+            "connections": len(CONNECTIONS),
+            "invocations_at_start": len(self._pending_tasks()),
+            "invocations_stopped": 0,
+            "contexts_persisted": [],
+            "contexts_unchanged": 0,
+            "errors": [],
+        }
+
+        for connection in list(CONNECTIONS.values()):
+            connection.draining = True
+            await connection.call("on_server_draining", {"deadline_seconds": deadline_seconds})
+
+        if not await self._wait_for_invocations(deadline_seconds):
+            stopped = self._pending_tasks()
+            report["invocations_stopped"] = len(stopped)
+            for connection in list(CONNECTIONS.values()):
+                connection.stop_generation()
+            for stream in list(STREAMS.values()):
+                stream.stop()
+            if not await self._wait_for_invocations(STOP_GRACE_SECONDS):
+                for task in self._pending_tasks():
+                    task.cancel()
+
+        for connection in list(CONNECTIONS.values()):
+            try:
+                await connection.flush_tokens()
+                if await connection.persist_messages():
+                    report["contexts_persisted"].append(connection.context.context_id)
+                else:
+                    report["contexts_unchanged"] += 1
+            except Exception as e:
+                Log.error("drain", "Error persisting connection", connection_id=connection.id, error=e)
+                report["errors"].append({"connection_id": connection.id, "error": str(e)})
+
+        # Write-behind saves of generations that outlived their socket
+        flushed = await PERSISTER.flush_all()
+        report["contexts_persisted"].extend(flushed["saved"])
+        report["errors"].extend(flushed["errors"])
+        # Token usage of the turns that just finished is written in the background
+        report["token_tracking_flushed"] = await TokenTracking.flush_pending_writes()
+
+        for connection in list(CONNECTIONS.values()):
+            await connection.close(code=SERVICE_RESTART)
+
+        report["duration_seconds"] = round(time.monotonic() - started, 3)
+        Log.warning("drain", "Done", report=report)
+        self.report = report
+        return report
+
+    def status(self) -> dict:
+        return {
+            "draining": self.draining,
+            "done": self.report is not None,
+            "report": self.report,
+        }
+
+    def install_signal_handler(self, sig: int = signal.SIGTERM):
+        """
+        Drain on SIGTERM, then hand the signal to the previous handler
+        (uvicorn's) so the server shuts down as usual.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return  # Signals can only be handled on the main thread, e.g. not under a test client
+        loop = asyncio.get_running_loop()
+        previous: Callable = signal.getsignal(sig)
+
+        async def drain_then_exit():
+            try:
+                await self.drain()
+            finally:
+                if callable(previous):
+                    previous(sig, None)
+
+        def handle(signum, frame):
+            Log.warning("drain", "Received signal", signal=signum)
+            loop.call_soon_threadsafe(lambda: asyncio.ensure_future(drain_then_exit()))
+
+        signal.signal(sig, handle)
@@ -0,0 +1,75 @@
+# Hot-path encoders for server-to-client notifications.
+#
+# on_token / on_tokens / on_stop_token frames are built from pre-rendered
+# templates: the per-stream suffix (response_id or short stream_id) is
+# rendered once per response and only the escaped token is spliced in per
+# frame, followed by the frame's seq within its response (see
+# ResponseStream). orjson is used when installed, otherwise the stdlib C
+# encoder.
+import json
+from typing import Any, List, Optional
+
+try:
+    import orjson
+except ImportError:  # Optional dependency
+    orjson = None
+
+
+def dumps(obj: Any) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            # e.g. non-str keys, or a lone surrogate - \u-escaped so the frame can still be sent as UTF-8
+            return json.dumps(obj, separators=(",", ":"))
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _dumps_str(value: str) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode("utf-8")
+        except TypeError:
+            # A lone surrogate in model output: \u-escaped, the frame can still be sent as UTF-8
+            return json.dumps(value)
+    return json.dumps(value, ensure_ascii=False)
+
+
+_ON_TOKEN_PREFIX = '{"method":"on_token","params":{"token":'
+_ON_TOKENS_PREFIX = '{"method":"on_tokens","params":{"tokens":'
+_ON_STOP_TOKEN_PREFIX = '{"method":"on_stop_token","params":{"seq":'
+_SEQ = ',"seq":'
+_ON_TOOL_CALL_PREFIX = '{"method":"on_tool_call","params":{"tool_call_id":'
+# Closes params and the frame. Notifications carry "id": null, like every frame before templates.
+_END = '},"id":null}'
+
+
+def render_stream_key(response_id: str, stream_id: Optional[int] = None) -> str:
+    """
+    Render the tail shared by every frame of one response - the stream
+    reference plus the end of the frame. Rendered once per response.
+    """
+    if stream_id is not None:
+        return ',"stream_id":' + str(int(stream_id)) + _END
+    return ',"response_id":' + _dumps_str(response_id) + _END
+
+
+def encode_on_token(token: str, stream_key: str, seq: int) -> str:
+    return _ON_TOKEN_PREFIX + _dumps_str(token) + _SEQ + str(seq) + stream_key
+
+
+def encode_on_tokens(tokens: List[str], stream_key: str, seq: int) -> str:
+    # seq is that of the last token in the batch
+    return _ON_TOKENS_PREFIX + dumps(tokens) + _SEQ + str(seq) + stream_key
+
+
+def encode_on_stop_token(stream_key: str, seq: int) -> str:
+    return _ON_STOP_TOKEN_PREFIX + str(seq) + stream_key
+
+
+def encode_on_tool_call(tool_call_id: str, tool_name: str, tool_input: Any) -> str:
+    return (
+        _ON_TOOL_CALL_PREFIX + _dumps_str(tool_call_id)
+        + ',"tool_name":' + _dumps_str(tool_name)
+        + ',"tool_input":' + dumps(tool_input) + _END
+    )
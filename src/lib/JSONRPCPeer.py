@@ -1,7 +1,10 @@
-import json
+import asyncio
+import time
 import uuid
-from typing import Callable, Dict, Any, Optional
-from lib.till_true import till_true
+from typing import Callable, Dict, Any, Optional, Set, Union
+from lib.Codecs import JSONCodec
+from lib import Metrics
+from lib import Log
 
 
 class JSONRPCResponse:
@@ -11,13 +14,26 @@ class JSONRPCResponse:
 
 
 class JSONRPCPeer:
-    def __init__(self, sender: Callable[[str], None]):
+    def __init__(self, sender: Callable[[Union[str, bytes]], None], codec=None):
         self.sender = sender
-        self.response_queue: Dict[str, Optional[JSONRPCResponse]] = {}
+        # Wire encoding (JSON text or a binary subprotocol); handlers never see it
+        self.codec = codec or JSONCodec()
+        # Pending awaited calls: msg_id -> future resolved by handle_message
+        self.response_queue: Dict[str, asyncio.Future] = {}
         self.handler_registry: Dict[str, Callable[[Dict[str, Any]], Any]] = {}
+        # Methods that return once their generation is done - a batch doesn't wait for them
+        self.streaming_methods: Set[str] = set()
 
-    def on(self, method: str, handler: Callable[[Dict[str, Any]], Any]):
+    def on(self, method: str, handler: Callable[[Dict[str, Any]], Any], streaming: bool = False):
         self.handler_registry[method] = handler
+        if streaming:
+            self.streaming_methods.add(method)
+        else:
+            self.streaming_methods.discard(method)
+
+    def encode(self, method: str, params: Dict[str, Any], msg_id: Optional[str] = None) -> Union[str, bytes]:
+        # Notifications keep "id": null, as clients have always received them
+        return self.codec.encode({"method": method, "params": params, "id": msg_id})
 
     async def call(
         self,
@@ -29,23 +45,26 @@ class JSONRPCPeer:
 
         msg_id = str(uuid.uuid4()) if await_response else None
 
-        message = json.dumps({
-            "method": method,
-            "params": params,
-            "id": msg_id
-        })
-
-        await self.sender(message)
+        message = self.encode(method, params, msg_id)
 
         if not await_response or msg_id is None:
+            await self.sender(message)
             return
 
-        self.response_queue[msg_id] = None
+        # Register the future before sending so a fast response can't race us
+        future = asyncio.get_running_loop().create_future()
+        self.response_queue[msg_id] = future
 
-        if not await till_true(lambda: self.response_queue[msg_id] is not None, timeout=timeout):
+        started = time.perf_counter()
+        try:
+            await self.sender(message)
+            response: JSONRPCResponse = await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
             raise TimeoutError(f"Timeout waiting for response to {method}")
-
-        response = self.response_queue.pop(msg_id)
+        finally:
+            # Always drop the slot - covers timeout, cancellation and send failure
+            self.response_queue.pop(msg_id, None)
+            Metrics.JSONRPC_CALL_DURATION.observe(time.perf_counter() - started, (method,))
 
         if response.result.get("error"):
             raise Exception(
@@ -53,49 +72,111 @@ class JSONRPCPeer:
 
         return response.result
 
-    async def handle_message(self, message: str):
+    def cancel_pending(self, reason: str = "Connection closed"):
+        """Fail every outstanding awaited call, e.g. when the socket goes away."""
+        for msg_id, future in list(self.response_queue.items()):
+            if not future.done():
+                future.set_exception(ConnectionError(reason))
+        self.response_queue.clear()
+
+    async def handle_message(self, message: Union[str, bytes]):
         try:
-            parsed_message = json.loads(message)
+            parsed_message = self.codec.decode(message)
         except Exception as e:
-            print("Error parsing message", e)
+            Log.warning("jsonrpc", "Error parsing message", error=e)
+            return
+
+        # Batch - entries run concurrently (dispatch policies still serialize
+        # what must be serialized) and answer with a single array response.
+        # Streaming entries answer on their own once their generation is done,
+        # so a stop_invocation batched with a new turn isn't held up behind it.
+        if isinstance(parsed_message, list):
+            if not parsed_message:
+                Log.warning("jsonrpc", "Empty batch")
+                return
+            # Started in batch order, which is the order serialized entries run in
+            tasks = [asyncio.ensure_future(self._process_message(entry)) for entry in parsed_message]
+            streaming = [task for task, entry in zip(tasks, parsed_message) if self._is_streaming(entry)]
+            try:
+                responses = await asyncio.gather(*[task for task in tasks if task not in streaming])
+                responses = [response for response in responses if response is not None]
+                if responses:
+                    await self.sender(self.codec.encode(responses))
+                for task in streaming:
+                    response = await task
+                    if response is not None:
+                        await self.sender(self.codec.encode(response))
+            finally:
+                for task in tasks:
+                    task.cancel()
             return
 
+        response = await self._process_message(parsed_message)
+        if response is not None:
+            await self.sender(self.codec.encode(response))
+
+    def _is_streaming(self, parsed_message: Any) -> bool:
+        return isinstance(parsed_message, dict) and parsed_message.get("method") in self.streaming_methods
+
+    async def _process_message(self, parsed_message: Any) -> Optional[Dict[str, Any]]:
+        """Handle one request, notification or response. Returns the response to send, if any."""
+        if not isinstance(parsed_message, dict):
+            Log.warning("jsonrpc", "Message is not an object", message=parsed_message)
+            return None
+
         # Request
         if "method" in parsed_message and "params" in parsed_message:
             handler = self.handler_registry.get(parsed_message["method"])
             if not handler:
-                print("Error: no handler for message", parsed_message)
-                return
-            
-            print("Method called: ", parsed_message["method"])
+                Log.warning("jsonrpc", "No handler for method", method=parsed_message["method"], id=parsed_message.get("id"))
+                return None
 
-            if not parsed_message.get("id"):
-                await handler(**parsed_message["params"])
-                return
+            Log.info("jsonrpc.request", "Method called", method=parsed_message["method"], id=parsed_message.get("id"))
+            # Only registered methods get here, so the label set stays bounded
+            labels = (parsed_message["method"],)
+            started = time.perf_counter()
+            status = "ok"
 
             try:
-                result = await handler(**parsed_message["params"])
-                await self.sender(json.dumps({
-                    "id": parsed_message["id"],
-                    "result": result
-                }))
-            except Exception as e:
-                print("Error handling message", e)
-                await self.sender(json.dumps({
-                    "id": parsed_message["id"],
-                    "result": {
-                        "error": str(e)
+                if not parsed_message.get("id"):
+                    try:
+                        await handler(**parsed_message["params"])
+                    except Exception as e:
+                        status = "error"
+                        Log.error("jsonrpc", "Error handling notification", method=parsed_message["method"], error=e)
+                    return None
+
+                try:
+                    result = await handler(**parsed_message["params"])
+                    return {
+                        "id": parsed_message["id"],
+                        "result": result
                     }
-                }))
-            return
+                except Exception as e:
+                    status = "error"
+                    Log.error("jsonrpc", "Error handling request", method=parsed_message["method"], id=parsed_message["id"], error=e)
+                    return {
+                        "id": parsed_message["id"],
+                        "result": {
+                            "error": str(e)
+                        }
+                    }
+            finally:
+                Metrics.JSONRPC_REQUEST_DURATION.observe(time.perf_counter() - started, labels)
+                Metrics.JSONRPC_REQUESTS.inc((parsed_message["method"], status))
 
         # Response
-        if "id" not in parsed_message or parsed_message["id"] not in self.response_queue:
-            print("Error: message is not a response or unknown ID", parsed_message)
-            print("Response Queue", self.response_queue)
-            return
-
-        self.response_queue[parsed_message["id"]] = JSONRPCResponse(
-            id=parsed_message["id"],
-            result=parsed_message.get("result", {})
-        )
+        future = None
+        if isinstance(parsed_message.get("id"), str):
+            future = self.response_queue.get(parsed_message["id"])
+        if future is None:
+            # Unknown, late (already timed out) or orphaned id
+            Log.warning("jsonrpc", "Message is not a response or has an unknown id", id=parsed_message.get("id"))
+            return None
+
+        if not future.done():
+            future.set_result(JSONRPCResponse(
+                id=parsed_message["id"],
+                result=parsed_message.get("result", {})
+            ))
+        return None
@@ -0,0 +1,114 @@
+# Structured, sampled logging for the request and streaming paths.
+#
+# Events are JSON lines written by AWS/CloudWatchLogs' queue listener thread,
+# so the event loop only pays for building a small dict and a put_nowait.
+# Field values are truncated before they are queued: a tool that returns a
+# whole web page costs the same to log as one that returns "ok".
+#
+# Correlation fields (connection_id, context_id, response_id) are carried in
+# a contextvar. Connection binds them for each handler task and asyncio
+# copies them into any task spawned from there, so call sites only pass
+# what is specific to the event.
+import logging
+import os
+import random
+from contextvars import ContextVar
+from typing import Any, Dict
+from AWS.CloudWatchLogs import get_logger, dropped_records
+
+# category=rate pairs; categories not listed are always logged. Warnings and
+# errors are never sampled out.
+DEFAULT_SAMPLE_RATES = "jsonrpc.request=0.1"
+# Longest string kept in a field; longer values are cut and marked with their full length
+MAX_FIELD_CHARS = int(os.environ.get("LOG_MAX_FIELD_CHARS", "512"))
+# Items kept per list/dict and nesting depth when logging structured values
+MAX_ITEMS = 20
+MAX_DEPTH = 3
+
+_logger = get_logger("token_streaming", os.environ.get("LOG_LEVEL", "INFO"), structured=True)
+_correlation: ContextVar[Dict[str, Any]] = ContextVar("log_correlation", default={})
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for pair in value.split(","):
+        if "=" not in pair:
+            continue
+        category, rate = pair.split("=", 1)
+        try:
+            rates[category.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+SAMPLE_RATES = parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES", DEFAULT_SAMPLE_RATES))
+
+
+def truncate(value: Any, depth: int = 0) -> Any:
+    """Bounded copy of a value for logging. Cost depends on the limits, not the value's size."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if len(value) <= MAX_FIELD_CHARS:
+            return value
+        return f"{value[:MAX_FIELD_CHARS]}...[{len(value)} chars]"
+    if depth >= MAX_DEPTH:
+        return f"<{type(value).__name__}>"
+    if isinstance(value, dict):
+        items = {}
+        for index, (key, item) in enumerate(value.items()):
+            if index == MAX_ITEMS:
+                items["..."] = f"[{len(value)} keys]"
+                break
+            items[str(key)] = truncate(item, depth + 1)
+        return items
+    if isinstance(value, (list, tuple)):
+        items = [truncate(item, depth + 1) for item in value[:MAX_ITEMS]]
+        if len(value) > MAX_ITEMS:
+            items.append(f"...[{len(value)} items]")
+        return items
+    if isinstance(value, BaseException):
+        return truncate(f"{type(value).__name__}: {value}", depth)
+    return truncate(str(value), depth)
+
+
+def bind(**fields):
+    """Add correlation fields to every event logged from the current task (and tasks it spawns)."""
+    _correlation.set({**_correlation.get(), **{key: value for key, value in fields.items() if value is not None}})
+
+
+def correlation() -> Dict[str, Any]:
+    return _correlation.get()
+
+
+def sampled(category: str) -> bool:
+    rate = SAMPLE_RATES.get(category, 1.0)
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+def log(level: int, category: str, message: str, **fields):
+    if not _logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING and not sampled(category):
+        return
+    event = {"category": category, **_correlation.get()}
+    for key, value in fields.items():
+        event[key] = truncate(value)
+    _logger.log(level, message, extra={"fields": event})
+
+
+def debug(category: str, message: str, **fields):
+    log(logging.DEBUG, category, message, **fields)
+
+
+def info(category: str, message: str, **fields):
+    log(logging.INFO, category, message, **fields)
+
+
+def warning(category: str, message: str, **fields):
+    log(logging.WARNING, category, message, **fields)
+
+
+def error(category: str, message: str, **fields):
+    log(logging.ERROR, category, message, **fields)
@@ -0,0 +1,178 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+from lib import Log
+from lib import Metrics
+
+# Stalls at least this long are captured and attributed to a call site; 0 disables the watchdog
+THRESHOLD_MS = float(os.environ.get("LOOP_WATCHDOG_THRESHOLD_MS", "100"))
+# How often the loop checks in; also the resolution of the event_loop_lag_seconds histogram
+HEARTBEAT_MS = float(os.environ.get("LOOP_WATCHDOG_HEARTBEAT_MS", "25"))
+# Strict mode (tests, load runs): any stall at least this long is a violation; 0 disables
+STRICT_MS = float(os.environ.get("LOOP_WATCHDOG_STRICT_MS", "0"))
+# Distinct call sites kept; stalls at new sites beyond this are counted under "other"
+MAX_SITES = 200
+STACK_DEPTH = 12
+
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THIS_FILE = os.path.abspath(__file__)
+
+
+class BlockingCallError(Exception):
+    pass
+
+
+def _is_own_code(filename: str) -> bool:
+    filename = os.path.abspath(filename)
+    return filename.startswith(SRC_ROOT) and filename != _THIS_FILE and "site-packages" not in filename
+
+
+def _frame_name(frame: traceback.FrameSummary) -> str:
+    filename = os.path.relpath(frame.filename, SRC_ROOT) if _is_own_code(frame.filename) else frame.filename
+    return f"{filename}:{frame.lineno} in {frame.name}"
+
+
+def call_site(stack: Optional[traceback.StackSummary]) -> str:
+    """The innermost frame in this repo's code - the handler line that made the blocking call."""
+    if not stack:
+        return "unknown"
+    for frame in reversed(stack):
+        if _is_own_code(frame.filename):
+            return _frame_name(frame)
+    return _frame_name(stack[-1])
+
+
+class LoopWatchdog:
+    """
+    Detects synchronous code blocking the event loop.
+
+    A heartbeat task wakes every HEARTBEAT_MS and records how late it ran. A
+    watcher thread notices when the heartbeat is overdue by the threshold and
+    samples the loop thread's stack while it is still blocked. When the loop
+    comes back, the stall is attributed to the innermost frame in this repo
+    (e.g. handlers/add_message.py:27 in add_message for a boto3 call) and
+    aggregated per call site.
+    """
+
+    def __init__(self, threshold_ms: float = THRESHOLD_MS, heartbeat_ms: float = HEARTBEAT_MS, strict_ms: float = STRICT_MS):
+        self.threshold = threshold_ms / 1000
+        self.heartbeat = heartbeat_ms / 1000
+        self.strict = strict_ms / 1000
+        self.sites: Dict[str, dict] = {}
+        self.violations: List[dict] = []
+        self.stalls = 0
+        self.blocked_seconds = 0.0
+        self.last_beat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+        # Stack sampled by the watcher thread during the current stall
+        self.lock = threading.Lock()
+        self.pending_stack: Optional[traceback.StackSummary] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def start(self):
+        if not self.enabled or self.task:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self._heartbeat())
+        self.thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+
+    async def close(self):
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.heartbeat
+            await asyncio.sleep(self.heartbeat)
+            now = time.monotonic()
+            self.last_beat = now
+            lag = max(now - expected, 0.0)
+            Metrics.EVENT_LOOP_LAG.observe(lag)
+            with self.lock:
+                stack, self.pending_stack = self.pending_stack, None
+            if lag >= self.threshold:
+                self._record(lag, stack)
+
+    def _watch(self):
+        sampled_beat = None
+        while not self.stopped.wait(self.threshold / 2):
+            beat = self.last_beat
+            if beat == sampled_beat or time.monotonic() - beat - self.heartbeat < self.threshold:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            with self.lock:
+                self.pending_stack = stack
+            sampled_beat = beat
+
+    def _record(self, seconds: float, stack: Optional[traceback.StackSummary]):
+        site = call_site(stack)
+        if site not in self.sites and len(self.sites) >= MAX_SITES:
+            site = "other"
+        entry = self.sites.get(site)
+        if entry is None:
+            entry = self.sites[site] = {"site": site, "count": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        entry["count"] += 1
+        entry["total_seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        entry["last_seen"] = time.time()
+        if stack:
+            entry["stack"] = [_frame_name(frame) for frame in stack[-STACK_DEPTH:]]
+        self.stalls += 1
+        self.blocked_seconds += seconds
+        Metrics.EVENT_LOOP_BLOCKED.observe(seconds, (site,))
+
+        if self.strict and seconds >= self.strict:
+            violation = {"site": site, "seconds": seconds, "stack": entry.get("stack")}
+            self.violations.append(violation)
+            Log.error("loop", "Event loop blocked in strict mode", site=site, blocked_ms=round(seconds * 1000, 1))
+            asyncio.get_running_loop().call_exception_handler({
+                "message": f"Event loop blocked for {seconds * 1000:.0f}ms at {site}",
+                "exception": BlockingCallError(site),
+            })
+        else:
+            Log.warning("loop", "Event loop blocked", site=site, blocked_ms=round(seconds * 1000, 1))
+
+    def check(self):
+        """Strict mode: raise if any stall crossed the strict threshold since the last reset."""
+        if self.violations:
+            worst = max(self.violations, key=lambda violation: violation["seconds"])
+            raise BlockingCallError(
+                f"Event loop blocked {len(self.violations)} time(s) over {self.strict * 1000:.0f}ms, "
+                f"worst {worst['seconds'] * 1000:.0f}ms at {worst['site']}"
+            )
+
+    def reset(self):
+        self.sites.clear()
+        self.violations.clear()
+        self.stalls = 0
+        self.blocked_seconds = 0.0
+
+    def report(self, limit: int = 50) -> dict:
+        sites = sorted(self.sites.values(), key=lambda entry: entry["total_seconds"], reverse=True)
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold * 1000,
+            "strict_ms": self.strict * 1000,
+            "stalls": self.stalls,
+            "blocked_seconds": self.blocked_seconds,
+            "violations": len(self.violations),
+            "sites": sites[:limit],
+        }
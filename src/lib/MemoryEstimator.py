@@ -0,0 +1,70 @@
+# Rough retained-memory estimates for a connection's agent state.
+#
+# Walking objects with sys.getsizeof is slow and misses most of what a
+# LangChain message holds, so these are byte counts of the serialized
+# payload plus a fixed per-object overhead. They are meant for ranking
+# connections and enforcing a soft cap, not for exact accounting.
+import json
+from typing import Any, List
+
+# Python object overhead of one BaseMessage (pydantic model, dicts, str headers)
+MESSAGE_OVERHEAD_BYTES = 1200
+# Per bound tool: the pydantic params class plus the LLM-side schema copy
+TOOL_OVERHEAD_BYTES = 4000
+# LLM client, prompt chain and agent_chat bookkeeping
+AGENT_CHAT_OVERHEAD_BYTES = 64 * 1024
+
+
+def _json_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(str(value))
+
+
+def message_bytes(message) -> int:
+    size = MESSAGE_OVERHEAD_BYTES
+    content = message.content
+    size += len(content) if isinstance(content, str) else _json_size(content)
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        size += _json_size(tool_calls)
+    if message.additional_kwargs:
+        size += _json_size(message.additional_kwargs)
+    return size
+
+
+def messages_bytes(messages: List) -> int:
+    return sum(message_bytes(message) for message in messages)
+
+
+def tools_bytes(agent_chat) -> int:
+    """Size of the tool schemas bound to the agent's LLM."""
+    size = 0
+    for tool in getattr(agent_chat, "name_to_tool", {}).values():
+        size += TOOL_OVERHEAD_BYTES + _json_size(tool.params.model_json_schema())
+    return size
+
+
+class MessagesSizeCache:
+    """
+    Incremental messages_bytes for one agent_chat: messages are appended in
+    place during a turn, so only the new tail is measured. A different list
+    (reload from the context) or a shorter one (set_last_messages) is
+    measured from scratch.
+    """
+
+    def __init__(self):
+        self.list_id = None
+        self.count = 0
+        self.size = 0
+
+    def measure(self, messages: List) -> int:
+        if id(messages) != self.list_id or len(messages) < self.count:
+            self.list_id = id(messages)
+            self.count = 0
+            self.size = 0
+        if len(messages) > self.count:
+            self.size += messages_bytes(messages[self.count:])
+            self.count = len(messages)
+        return self.size
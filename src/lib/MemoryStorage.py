@@ -0,0 +1,307 @@
+import copy
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+from lib.StorageBackend import StorageBackend, ConditionFailed, VERSION_ATTRIBUTE
+
+# Injected per call, to make local runs behave like a network round trip to DynamoDB
+LATENCY_SECONDS = float(os.environ.get("STORAGE_MEMORY_LATENCY_MS", "0")) / 1000
+# Plus up to this much, uniformly at random
+JITTER_SECONDS = float(os.environ.get("STORAGE_MEMORY_JITTER_MS", "0")) / 1000
+
+TABLE_NAME_SUFFIX = "_TABLE_NAME"
+PRIMARY_KEY_SUFFIX = "_PRIMARY_KEY"
+
+
+def schemas_from_environment() -> Dict[str, str]:
+    """{table name: partition key} for every FOO_TABLE_NAME with a FOO_PRIMARY_KEY next to it."""
+    schemas = {}
+    for name, table_name in os.environ.items():
+        if name.endswith(TABLE_NAME_SUFFIX):
+            primary_key = os.environ.get(name[:-len(TABLE_NAME_SUFFIX)] + PRIMARY_KEY_SUFFIX)
+            if primary_key:
+                schemas[table_name] = primary_key
+    return schemas
+
+
+class Table:
+    def __init__(self, partition_key: Optional[str], sort_key: Optional[str] = None):
+        # No partition key: nothing has declared one yet, and items are kept under generated keys
+        self.partition_key = partition_key
+        self.sort_key = sort_key
+        self.items: Dict = {}
+        # index name -> (partition key, sort key)
+        self.index_names: Dict[str, Tuple[str, Optional[str]]] = {}
+        # (partition key, sort key) -> partition value -> keys of the items in it
+        self.indexes: Dict[Tuple[str, Optional[str]], Dict] = {}
+
+    def key(self, item: dict):
+        if self.partition_key is None:
+            return str(uuid.uuid4())
+        if self.sort_key is not None:
+            return (item[self.partition_key], item[self.sort_key])
+        return item[self.partition_key]
+
+    def index(self, partition_key: str, sort_key: Optional[str]) -> Dict:
+        """The entries of the index on these attributes, built from the items on first use."""
+        entries = self.indexes.get((partition_key, sort_key))
+        if entries is None:
+            entries = self.indexes[(partition_key, sort_key)] = {}
+            for key, item in self.items.items():
+                self._add(entries, partition_key, sort_key, key, item)
+        return entries
+
+    @staticmethod
+    def _add(entries: Dict, partition_key: str, sort_key: Optional[str], key, item: dict):
+        # Sparse, like a GSI: items without the index's key attributes aren't in it
+        if partition_key in item and (sort_key is None or sort_key in item):
+            entries.setdefault(item[partition_key], set()).add(key)
+
+    def put(self, key, item: dict):
+        self.remove(key)
+        self.items[key] = item
+        for (partition_key, sort_key), entries in self.indexes.items():
+            self._add(entries, partition_key, sort_key, key, item)
+
+    def remove(self, key):
+        item = self.items.pop(key, None)
+        if item is None:
+            return
+        for (partition_key, sort_key), entries in self.indexes.items():
+            keys = entries.get(item.get(partition_key))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del entries[item[partition_key]]
+
+    def query(self, partition_key: str, sort_key: Optional[str], value) -> list[dict]:
+        items = [self.items[key] for key in self.index(partition_key, sort_key).get(value, ())]
+        if sort_key is not None:
+            items.sort(key=lambda item: item[sort_key])
+        return items
+
+
+class MemoryStorage(StorageBackend):
+    """
+    In-process tables for running the server, tests and benchmarks without AWS.
+
+    Safe to call from any number of threads: every operation, including the
+    conditional ones, is atomic under one lock. Items are copied in and out as a
+    round trip would. Secondary indexes are kept up to date on every write -
+    declared through describe_table, or built on first query. Each call sleeps
+    latency_seconds (+ up to jitter_seconds) outside the lock, so the pool and
+    event loop see something like DynamoDB's round trips.
+
+    Tables are keyed by the FOO_TABLE_NAME / FOO_PRIMARY_KEY environment pairs,
+    describe_table, or the primary key name a call passes. Until then, a table's
+    items are kept under generated keys (fine for append-only tables).
+    """
+
+    name = "memory"
+
+    def __init__(self, latency_seconds: float = LATENCY_SECONDS, jitter_seconds: float = JITTER_SECONDS, schemas: Optional[Dict[str, str]] = None):
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.lock = threading.RLock()
+        self.tables: Dict[str, Table] = {}
+        for table_name, partition_key in (schemas if schemas is not None else schemas_from_environment()).items():
+            self.describe_table(table_name, partition_key)
+
+    def _round_trip(self):
+        delay = self.latency_seconds + (random.uniform(0, self.jitter_seconds) if self.jitter_seconds else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _table(self, table_name: str, primary_key_name: Optional[str] = None) -> Table:
+        table = self.tables.get(table_name)
+        if table is None:
+            table = self.tables[table_name] = Table(primary_key_name)
+        elif table.partition_key is None and primary_key_name is not None:
+            self.describe_table(table_name, primary_key_name)
+            table = self.tables[table_name]
+        return table
+
+    def _check(self, table_name: str, key, current: Optional[dict], expected_version: Optional[int], must_exist: bool):
+        if current is None and (must_exist or expected_version):
+            raise ConditionFailed(f"Item {key} in {table_name} does not exist", 404)
+        if expected_version is not None and current is not None and current.get(VERSION_ATTRIBUTE, 0) != expected_version:
+            raise ConditionFailed(f"Item {key} in {table_name} was changed by another writer", 409)
+
+    def describe_table(self, table_name, partition_key, sort_key=None, indexes=None):
+        with self.lock:
+            existing = self.tables.get(table_name)
+            table = Table(partition_key, sort_key)
+            if existing is not None:
+                table.index_names = existing.index_names
+                for key, item in existing.items.items():
+                    table.put(table.key(item) if partition_key in item else key, item)
+            table.index_names.update(indexes or {})
+            self.tables[table_name] = table
+
+    def get_item(self, table_name, primary_key_name, key):
+        self._round_trip()
+        with self.lock:
+            return copy.deepcopy(self._table(table_name, primary_key_name).items.get(key))
+
+    def get_item_attributes(self, table_name, primary_key_name, key, attributes):
+        self._round_trip()
+        with self.lock:
+            item = self._table(table_name, primary_key_name).items.get(key)
+            if item is None:
+                return None
+            return {attribute: copy.deepcopy(item[attribute]) for attribute in attributes if attribute in item}
+
+    def get_items_by_scan(self, table_name, primary_key_name, keys):
+        self._round_trip()
+        with self.lock:
+            wanted = set(keys)
+            items = self._table(table_name, primary_key_name).items.values()
+            return [copy.deepcopy(item) for item in items if item.get(primary_key_name) in wanted]
+
+    def batch_get_items(self, table_name, primary_key_name, keys):
+        self._round_trip()
+        with self.lock:
+            items = self._table(table_name, primary_key_name).items
+            return [copy.deepcopy(items[key]) for key in dict.fromkeys(keys) if key in items]
+
+    def get_all_items(self, table_name):
+        self._round_trip()
+        with self.lock:
+            return [copy.deepcopy(item) for item in self._table(table_name).items.values()]
+
+    def put_item(self, table_name, item):
+        self._round_trip()
+        with self.lock:
+            table = self._table(table_name)
+            table.put(table.key(item), copy.deepcopy(item))
+
+    def put_items(self, table_name, items):
+        self._round_trip()
+        with self.lock:
+            table = self._table(table_name)
+            for item in items:
+                table.put(table.key(item), copy.deepcopy(item))
+
+    def put_items_unless_newer(self, table_name, items, version_attribute, version):
+        self._round_trip()
+        with self.lock:
+            table = self._table(table_name)
+            for item in items:
+                key = table.key(item)
+                current = table.items.get(key)
+                if current is not None and current.get(version_attribute, 0) > version:
+                    raise ConditionFailed(f"Item {key} in {table_name} was written by a newer save", 409)
+                table.put(key, copy.deepcopy(item))
+
+    def update_item(self, table_name, primary_key_name, key, update_attributes):
+        return self.update_item_expression(table_name, primary_key_name, key, set_attributes=update_attributes, return_values="ALL_NEW")
+
+    def update_item_expression(self, table_name, primary_key_name, key, set_attributes=None, append_attributes=None,
+                               remove_attributes=None, expected_version=None, must_exist=True, return_values="NONE"):
+        self._round_trip()
+        with self.lock:
+            table = self._table(table_name, primary_key_name)
+            current = table.items.get(key)
+            self._check(table_name, key, current, expected_version, must_exist)
+            item = dict(current) if current is not None else {primary_key_name: key}
+            item.update(copy.deepcopy(set_attributes or {}))
+            for attribute, values in (append_attributes or {}).items():
+                item[attribute] = list(item.get(attribute, [])) + copy.deepcopy(values)
+            for attribute in remove_attributes or []:
+                item.pop(attribute, None)
+            if expected_version is not None:
+                item[VERSION_ATTRIBUTE] = expected_version + 1
+            table.put(key, item)
+            if return_values == "ALL_NEW":
+                return copy.deepcopy(item)
+            if return_values == "ALL_OLD":
+                return copy.deepcopy(current)
+            return None
+
+    def save_changes(self, table_name, primary_key_name, item, stored, append_attributes=None, actions=None):
+        self._round_trip()
+        with self.lock:
+            table = self._table(table_name, primary_key_name)
+            key = item[primary_key_name]
+            current = table.items.get(key)
+            version = 1
+            if stored is not None:
+                version = int(stored.get(VERSION_ATTRIBUTE, 0)) + 1
+                self._check(table_name, key, current, version - 1, True)
+            written = dict(copy.deepcopy(item), **{VERSION_ATTRIBUTE: version})
+            if current is not None:
+                for attribute, values in (append_attributes or {}).items():
+                    written[attribute] = list(current.get(attribute, [])) + copy.deepcopy(values)
+            table.put(key, written)
+            for action in actions or []:
+                if "Put" in action:
+                    target = self._table(action["Put"]["TableName"])
+                    target.put(target.key(action["Put"]["Item"]), copy.deepcopy(action["Put"]["Item"]))
+                else:
+                    target = self._table(action["Delete"]["TableName"])
+                    target.remove(target.key(action["Delete"]["Key"]))
+            return dict(item, **{VERSION_ATTRIBUTE: version})
+
+    def delete_item(self, table_name, primary_key_name, key):
+        self._round_trip()
+        with self.lock:
+            self._table(table_name, primary_key_name).remove(key)
+
+    def delete_items(self, table_name, keys):
+        self._round_trip()
+        with self.lock:
+            table = self._table(table_name)
+            for key in keys:
+                table.remove(table.key(key))
+
+    def delete_items_unless_newer(self, table_name, keys, version_attribute, version):
+        self._round_trip()
+        with self.lock:
+            table = self._table(table_name)
+            for key in keys:
+                current = table.items.get(table.key(key))
+                if current is None or current.get(version_attribute, 0) <= version:
+                    table.remove(table.key(key))
+
+    def get_all_items_by_key(self, table_name, key_name, key_value):
+        self._round_trip()
+        with self.lock:
+            table = self._table(table_name, key_name)
+            return copy.deepcopy(table.query(key_name, table.sort_key, key_value))
+
+    def get_all_items_by_index(self, table_name, index_key, key_value):
+        self._round_trip()
+        with self.lock:
+            partition_key, sort_key = self._table(table_name).index_names.get(index_key, (index_key, None))
+            return copy.deepcopy(self._table(table_name).query(partition_key, sort_key, key_value))
+
+    def get_items_by_index_range(self, table_name, index_name, partition_key, partition_value, sort_key, sort_min, sort_max):
+        self._round_trip()
+        with self.lock:
+            items = self._table(table_name).query(partition_key, sort_key, partition_value)
+            return copy.deepcopy([item for item in items if sort_min <= item[sort_key] <= sort_max])
+
+    def get_latest_items_by_index(self, table_name, index_name, index_key, index_value, limit):
+        self._round_trip()
+        with self.lock:
+            table = self._table(table_name)
+            _, sort_key = table.index_names.get(index_name, (index_key, None))
+            if sort_key is None and index_name.startswith(f"{index_key}-") and index_name.endswith("-index"):
+                # Undeclared, but named the usual way: <partition key>-<sort key>-index
+                sort_key = index_name[len(index_key) + 1:-len("-index")]
+            items = table.query(index_key, sort_key, index_value)
+            return copy.deepcopy(list(reversed(items))[:limit])
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "latency_seconds": self.latency_seconds,
+                "jitter_seconds": self.jitter_seconds,
+                "tables": {
+                    table_name: {"items": len(table.items), "indexes": len(table.indexes)}
+                    for table_name, table in self.tables.items()
+                },
+            }
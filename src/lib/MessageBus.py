@@ -0,0 +1,203 @@
+import asyncio
+import contextlib
+import glob
+import json
+import os
+import struct
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from lib import Log
+
+# Bus backends
+LOCAL = "local"  # Single process - or several in-process workers sharing a hub, for tests
+UNIX = "unix"    # One Unix domain socket per worker process in BUS_DIR
+
+DEFAULT_BACKEND = os.environ.get("MESSAGE_BUS", LOCAL)
+DEFAULT_BUS_DIR = os.environ.get("BUS_DIR", "/tmp/token-streaming-bus")
+DEFAULT_TIMEOUT = 5
+
+_HEADER = struct.Struct(">I")
+
+
+class MessageBus:
+    """
+    Worker-to-worker request/reply bus.
+
+    Handlers are registered per topic and called with the payload as keyword
+    arguments; whatever they return (JSON-serializable, or None for "not
+    mine") is the reply. Backends only implement peers() and _send(), so a
+    network broker can be dropped in without touching the callers.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or str(os.getpid())
+        self.handlers: Dict[str, Callable[..., Awaitable[Any]]] = {}
+
+    def on(self, topic: str, handler: Callable[..., Awaitable[Any]]):
+        self.handlers[topic] = handler
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def peers(self) -> List[str]:
+        """Worker ids of every other live worker."""
+        return []
+
+    async def _send(self, worker_id: str, topic: str, payload: Dict[str, Any], timeout: Optional[float]) -> Any:
+        raise NotImplementedError
+
+    async def _handle(self, topic: str, payload: Dict[str, Any]) -> Any:
+        handler = self.handlers.get(topic)
+        if not handler:
+            Log.warning("bus", "No handler for topic", worker_id=self.worker_id, topic=topic)
+            return None
+        return await handler(**payload)
+
+    async def send(self, worker_id: str, topic: str, payload: Dict[str, Any], timeout: Optional[float] = DEFAULT_TIMEOUT) -> Any:
+        if worker_id == self.worker_id:
+            return await self._handle(topic, payload)
+        return await self._send(worker_id, topic, payload, timeout)
+
+    async def broadcast(self, topic: str, payload: Dict[str, Any], timeout: Optional[float] = DEFAULT_TIMEOUT) -> List[Any]:
+        """Send to every other worker; returns the non-None replies. Unreachable workers are skipped."""
+        peers = self.peers()
+        if not peers:
+            return []
+        replies = await asyncio.gather(
+            *[self._send(peer, topic, payload, timeout) for peer in peers],
+            return_exceptions=True,
+        )
+        results = []
+        for peer, reply in zip(peers, replies):
+            if isinstance(reply, Exception):
+                Log.warning("bus", "Error from worker", worker_id=self.worker_id, peer=peer, topic=topic, error=reply)
+            elif reply is not None:
+                results.append(reply)
+        return results
+
+    async def request_any(self, topic: str, payload: Dict[str, Any], timeout: Optional[float] = DEFAULT_TIMEOUT) -> Any:
+        """Ask every other worker and return the first non-None reply (the owner's), or None."""
+        peers = self.peers()
+        if not peers:
+            return None
+        pending = {asyncio.create_task(self._send(peer, topic, payload, timeout)) for peer in peers}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result() is not None:
+                        return task.result()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+class LocalBus(MessageBus):
+    """In-process bus. Buses sharing a hub dict behave like separate workers."""
+
+    def __init__(self, worker_id: Optional[str] = None, hub: Optional[Dict[str, "LocalBus"]] = None):
+        super().__init__(worker_id)
+        self.hub = hub if hub is not None else {}
+
+    async def start(self):
+        self.hub[self.worker_id] = self
+
+    async def close(self):
+        self.hub.pop(self.worker_id, None)
+
+    def peers(self) -> List[str]:
+        return [worker_id for worker_id in self.hub if worker_id != self.worker_id]
+
+    async def _send(self, worker_id: str, topic: str, payload: Dict[str, Any], timeout: Optional[float]) -> Any:
+        peer = self.hub.get(worker_id)
+        if peer is None:
+            raise ConnectionError(f"Worker {worker_id} is gone")
+        # Round-trip through JSON so local tests see the same payloads as the socket bus
+        payload = json.loads(json.dumps(payload, default=str))
+        return await asyncio.wait_for(peer._handle(topic, payload), timeout=timeout)
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> Any:
+    header = await reader.readexactly(_HEADER.size)
+    return json.loads(await reader.readexactly(_HEADER.unpack(header)[0]))
+
+
+def _write_frame(writer: asyncio.StreamWriter, obj: Any):
+    body = json.dumps(obj, default=str).encode("utf-8")
+    writer.write(_HEADER.pack(len(body)) + body)
+
+
+class UnixSocketBus(MessageBus):
+    """
+    Each worker listens on BUS_DIR/<worker_id>.sock; the directory listing
+    is the set of live workers. Frames are length-prefixed JSON, one
+    request/reply per short-lived connection.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None, bus_dir: str = DEFAULT_BUS_DIR):
+        super().__init__(worker_id)
+        self.bus_dir = bus_dir
+        self.path = os.path.join(bus_dir, f"{self.worker_id}.sock")
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        os.makedirs(self.bus_dir, exist_ok=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._serve, path=self.path)
+        Log.info("bus", "Listening", worker_id=self.worker_id, path=self.path)
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+    def peers(self) -> List[str]:
+        paths = glob.glob(os.path.join(self.bus_dir, "*.sock"))
+        worker_ids = [os.path.basename(path)[:-len(".sock")] for path in paths]
+        return [worker_id for worker_id in worker_ids if worker_id != self.worker_id]
+
+    async def _send(self, worker_id: str, topic: str, payload: Dict[str, Any], timeout: Optional[float]) -> Any:
+        path = os.path.join(self.bus_dir, f"{worker_id}.sock")
+        try:
+            reader, writer = await asyncio.open_unix_connection(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Worker died without cleaning up its socket - another sender may have removed it already
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+            raise ConnectionError(f"Worker {worker_id} is gone")
+        try:
+            _write_frame(writer, {"topic": topic, "payload": payload})
+            await writer.drain()
+            reply = await asyncio.wait_for(_read_frame(reader), timeout=timeout)
+        finally:
+            writer.close()
+        if reply.get("error"):
+            raise Exception(f"Worker {worker_id} failed {topic}: {reply['error']}")
+        return reply.get("result")
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            message = await _read_frame(reader)
+            try:
+                reply = {"result": await self._handle(message["topic"], message["payload"])}
+            except Exception as e:
+                reply = {"error": str(e)}
+            _write_frame(writer, reply)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # Caller gave up (e.g. timed out)
+        finally:
+            writer.close()
+
+
+def create_bus(backend: str = DEFAULT_BACKEND) -> MessageBus:
+    if backend == UNIX:
+        return UnixSocketBus()
+    if backend == LOCAL:
+        return LocalBus()
+    raise Exception(f"Unknown MESSAGE_BUS backend: {backend}")
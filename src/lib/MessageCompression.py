@@ -0,0 +1,103 @@
+# Stored form of Context messages.
+#
+# A message whose JSON is at least COMPRESSION_THRESHOLD_BYTES is stored as a
+# binary attribute: one format byte, then the compressed UTF-8 JSON. Smaller
+# messages - most of a conversation - stay plain maps, and plain maps are
+# always read back as they are, so items written before this (or with
+# compression off) need no migration. Compressing per message keeps the
+# list_append and messages-table writes of save_context: a turn still writes
+# only its new messages, and the large ones are exactly the tool outputs
+# (emails, pages, memory windows) that push items towards DynamoDB's 400 KB.
+#
+# Off by default. Servers that can't decode a binary message fail to load the
+# context, so turning it on goes: deploy decode_message to every server that
+# reads contexts (API workers, Lambdas, scripts) and finish that rollout; then
+# set MESSAGE_COMPRESSION=zlib - or zstd, once zstandard is installed on all
+# of them. Switching back to none only stops new writes from compressing.
+import decimal
+import json
+import os
+import zlib
+from enum import Enum
+from typing import Any, Union
+from lib import Metrics
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency - zlib is always available
+    zstandard = None
+
+FORMAT_ZLIB = 1
+FORMAT_ZSTD = 2
+FORMATS = {"zlib": FORMAT_ZLIB, "zstd": FORMAT_ZSTD}
+
+# "none" writes plain maps; "zlib" or "zstd" (needs zstandard wherever contexts are read), see above
+MESSAGE_COMPRESSION = os.environ.get("MESSAGE_COMPRESSION", "none")
+COMPRESSION_THRESHOLD_BYTES = int(os.environ.get("MESSAGE_COMPRESSION_THRESHOLD_BYTES", "4096"))
+ZLIB_LEVEL = int(os.environ.get("MESSAGE_COMPRESSION_ZLIB_LEVEL", "6"))
+ZSTD_LEVEL = int(os.environ.get("MESSAGE_COMPRESSION_ZSTD_LEVEL", "3"))
+
+if MESSAGE_COMPRESSION not in (*FORMATS, "none"):
+    raise Exception(f"Unknown MESSAGE_COMPRESSION {MESSAGE_COMPRESSION}, expected zlib, zstd or none", 500)
+if MESSAGE_COMPRESSION == "zstd" and zstandard is None:
+    raise Exception("MESSAGE_COMPRESSION is zstd but the zstandard package is not installed", 500)
+
+
+def _default(obj):
+    # Messages read back as plain maps carry DynamoDB's Decimals
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj % 1 == 0 else float(obj)
+    if isinstance(obj, Enum):
+        return obj.value
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+def compress(data: bytes, codec: str = MESSAGE_COMPRESSION) -> bytes:
+    # zstandard (de)compressor objects aren't thread-safe and saves run on the pool, so one per call
+    if codec == "zstd":
+        return bytes([FORMAT_ZSTD]) + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return bytes([FORMAT_ZLIB]) + zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(data: bytes) -> bytes:
+    if not data:
+        raise Exception("Empty compressed message", 500)
+    if data[0] == FORMAT_ZLIB:
+        return zlib.decompress(data[1:])
+    if data[0] == FORMAT_ZSTD:
+        if zstandard is None:
+            raise Exception("Message is zstd-compressed but the zstandard package is not installed", 500)
+        return zstandard.ZstdDecompressor().decompress(data[1:])
+    raise Exception(f"Unknown compressed message format {data[0]}", 500)
+
+
+def encode_message(message: dict, codec: str = MESSAGE_COMPRESSION, threshold: int = COMPRESSION_THRESHOLD_BYTES) -> Union[dict, bytes]:
+    """The message as stored: itself, or compressed if it is large and that makes it smaller."""
+    if codec == "none":
+        return message
+    data = json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=_default).encode("utf-8")
+    if len(data) < threshold:
+        return message
+    compressed = compress(data, codec)
+    if len(compressed) >= len(data):
+        return message
+    # Sync saves encode on the DynamoDB pool
+    Metrics.inc_threadsafe(Metrics.MESSAGE_COMPRESSION_BYTES, ("raw",), len(data))
+    Metrics.inc_threadsafe(Metrics.MESSAGE_COMPRESSION_BYTES, ("stored",), len(compressed))
+    return compressed
+
+
+def decode_message(value: Any) -> dict:
+    """A message as read back: plain maps as they are, binary ones decompressed."""
+    if isinstance(value, dict):
+        return value
+    # boto3 reads binary attributes as Binary, which holds the bytes in .value
+    return json.loads(decompress(bytes(getattr(value, "value", value))))
+
+
+def encode_messages(messages: list[dict]) -> list:
+    return [encode_message(message) for message in messages]
+
+
+def decode_messages(values: list) -> list[dict]:
+    return [decode_message(value) for value in values]
@@ -0,0 +1,251 @@
+# Process-local metrics rendered in the Prometheus text format at /metrics.
+#
+# Recording is a dict lookup plus in-place arithmetic on preallocated
+# lists: no locks (everything runs on the event loop thread) and no
+# per-call allocation once a label combination has been seen. Streaming
+# code counts tokens in a local int and records once per LLM call, never
+# per token.
+#
+# With several workers, /metrics merges snapshot() from every worker over
+# the bus: counters and histograms are summed, gauges get a worker label.
+# Pool threads record through on_loop / inc_threadsafe, which hand the
+# update to the loop thread they work for.
+import asyncio
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from lib import Log
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+RATE_BUCKETS = (5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.series: Dict[Tuple, object] = {}
+        REGISTRY.append(self)
+
+    def snapshot(self) -> dict:
+        return {
+            "type": self.type,
+            "help": self.help,
+            "label_names": list(self.label_names),
+            "series": [[list(labels), value] for labels, value in self.series.items()],
+        }
+
+
+class Counter(Metric):
+    type = COUNTER
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = GAUGE
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (), callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, label_names)
+        # Evaluated at scrape time, for values that are cheaper to count than to track
+        self.callback = callback
+
+    def set(self, value: float, labels: Tuple = ()):
+        self.series[labels] = value
+
+    def snapshot(self) -> dict:
+        if self.callback:
+            try:
+                self.series[()] = self.callback()
+            except Exception as e:
+                Log.error("metrics", "Error collecting gauge", gauge=self.name, error=e)
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    type = HISTOGRAM
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: Tuple = ()):
+        # Per label set: [count per bucket (last is +Inf), sum, count]
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def snapshot(self) -> dict:
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+
+REGISTRY: List[Metric] = []
+
+_thread = threading.local()
+
+
+def bind_loop(loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """Mark this (pool) thread as working for loop, so recording from it happens on loop's thread."""
+    _thread.loop = loop
+
+
+def bound_loop() -> Optional[asyncio.AbstractEventLoop]:
+    return getattr(_thread, "loop", None)
+
+
+def on_loop(function: Callable, *args) -> None:
+    """Call function on the bound loop's thread - directly on threads not bound to one."""
+    loop = bound_loop()
+    if loop is not None:
+        loop.call_soon_threadsafe(function, *args)
+    else:
+        function(*args)
+
+
+def inc_threadsafe(counter: Counter, labels: Tuple = (), amount: float = 1) -> None:
+    on_loop(counter.inc, labels, amount)
+
+
+def snapshot() -> Dict[str, dict]:
+    return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+
+def merge(snapshots: Dict[str, Dict[str, dict]]) -> Dict[str, dict]:
+    """Merge per-worker snapshots keyed by worker id into one."""
+    merged: Dict[str, dict] = {}
+    for worker_id, worker_snapshot in snapshots.items():
+        for name, metric in worker_snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = dict(metric, series={})
+                if metric["type"] == GAUGE:
+                    target["label_names"] = metric["label_names"] + ["worker"]
+            for labels, value in metric["series"]:
+                if metric["type"] == GAUGE:
+                    target["series"][tuple(labels) + (worker_id,)] = value
+                elif metric["type"] == COUNTER:
+                    key = tuple(labels)
+                    target["series"][key] = target["series"].get(key, 0) + value
+                else:
+                    key = tuple(labels)
+                    existing = target["series"].get(key)
+                    if existing is None:
+                        target["series"][key] = [list(value[0]), value[1], value[2]]
+                    else:
+                        existing[0] = [a + b for a, b in zip(existing[0], value[0])]
+                        existing[1] += value[1]
+                        existing[2] += value[2]
+    for metric in merged.values():
+        metric["series"] = [[list(labels), value] for labels, value in metric["series"].items()]
+    return merged
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(metrics: Dict[str, dict]) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name, metric in metrics.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["label_names"]
+        for labels, value in metric["series"]:
+            if metric["type"] != HISTOGRAM:
+                lines.append(f"{name}{_labels(names, labels)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric["buckets"], counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(float(bound)) + '"'
+                lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{name}_bucket{_labels(names, labels, le)} {count}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_number(float(total))}")
+            lines.append(f"{name}_count{_labels(names, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+#################
+#               #
+# -- Metrics -- #
+#               #
+#################
+
+# LLM streaming - recorded once per LLM call in TokenStreamingAgentChat.invoke
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "Time from starting an LLM call to its first streamed text", ["model"])
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second", "Streamed chunks per second after the first token, per LLM call", ["model"], buckets=RATE_BUCKETS)
+LLM_TOKENS = Counter("llm_streamed_tokens_total", "Streamed text chunks", ["model"])
+LLM_CALLS = Counter("llm_calls_total", "LLM calls by outcome (text, tool_calls, empty, aborted, error)", ["model", "outcome"])
+
+# Tools - TokenStreamingAgentChat._process_tool_calls
+TOOL_DURATION = Histogram("tool_duration_seconds", "Server-side tool execution time", ["tool"])
+TOOL_ERRORS = Counter("tool_errors_total", "Tool calls that raised", ["tool"])
+
+# JSON-RPC - JSONRPCPeer; the add_message duration is the end-to-end turn latency
+JSONRPC_REQUEST_DURATION = Histogram(
+    "jsonrpc_request_duration_seconds", "Time to handle a client request, including the full turn it streams", ["method"])
+JSONRPC_REQUESTS = Counter("jsonrpc_requests_total", "Client requests and notifications handled", ["method", "status"])
+JSONRPC_CALL_DURATION = Histogram(
+    "jsonrpc_call_duration_seconds", "Round trip of awaited server-to-client calls", ["method"])
+
+# Connect pipeline - connect_to_context; stages overlap, see the handler
+CONNECT_STAGE_DURATION = Histogram(
+    "connect_stage_seconds", "Time spent in each stage of connect_to_context (auth, context, agent, tools, model)", ["stage"])
+
+# WebSocket writes - OutboundQueue writer
+WS_SEND_DURATION = Histogram("websocket_send_seconds", "Time to write one frame to the socket", buckets=FAST_BUCKETS)
+WS_FRAMES_SENT = Counter("websocket_frames_sent_total", "Frames written to sockets")
+WS_BYTES_SENT = Counter("websocket_bytes_sent_total", "Bytes written to sockets")
+
+# DynamoDB - AWS/DynamoDB.py
+DYNAMODB_DURATION = Histogram(
+    "dynamodb_request_duration_seconds", "DynamoDB call latency (blocking, on the calling thread)", ["table", "operation"])
+DYNAMODB_ERRORS = Counter("dynamodb_errors_total", "DynamoDB calls that raised", ["table", "operation"])
+DYNAMODB_CONSUMED_CAPACITY = Counter(
+    "dynamodb_consumed_capacity_units_total", "Capacity units DynamoDB reported for calls that request it", ["table", "operation"])
+
+# Event loop - LoopWatchdog heartbeat
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a timer; high values mean blocking code", buckets=FAST_BUCKETS)
+EVENT_LOOP_BLOCKED = Histogram(
+    "event_loop_blocked_seconds", "Stalls over the watchdog threshold, by the call site that blocked", ["site"])
+
+# Context persistence - ContextPersister
+CONTEXT_WRITES = Counter("context_writes_total", "Write-behind context saves by outcome (saved, failed)", ["outcome"])
+CONTEXT_WRITES_COALESCED = Counter("context_writes_coalesced_total", "Changes folded into a save that was already pending")
+CONTEXT_WRITE_DELAY = Histogram(
+    "context_write_delay_seconds", "Time from a context's first unsaved change to the save that covers it")
+
+# Stored messages - lib/MessageCompression.py
+MESSAGE_COMPRESSION_BYTES = Counter(
+    "message_compression_bytes_total", "Size of the messages stored compressed, as JSON (raw) and as written (stored)", ["form"])
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, List, Optional, Union
+from lib import Metrics
+from lib import Log
+
+# Overflow policies
+COALESCE = "coalesce"      # Merge queued tokens into one frame, block only for non-token frames
+BLOCK = "block"            # Producers wait for space
+DISCONNECT = "disconnect"  # Producers wait, but the socket is dropped after max_lag_seconds of backlog
+
+DEFAULT_MAX_FRAMES = int(os.environ.get("SEND_QUEUE_MAX_FRAMES", "256"))
+DEFAULT_POLICY = os.environ.get("SEND_QUEUE_OVERFLOW_POLICY", COALESCE)
+DEFAULT_MAX_LAG_SECONDS = float(os.environ.get("SEND_QUEUE_MAX_LAG_SECONDS", "10"))
+# A coalesced token frame stops growing at this size, or once it has waited max_lag_seconds.
+# Further tokens take a new slot, so a stalled socket still fills the queue and producers wait.
+DEFAULT_MAX_COALESCED_BYTES = int(os.environ.get("SEND_QUEUE_MAX_COALESCED_BYTES", "16384"))
+
+_FRAME = 0
+_TOKENS = 1
+
+
+class SlowConsumerError(ConnectionError):
+    pass
+
+
+class OutboundQueue:
+    """
+    Bounded per-connection send queue drained by a single writer task, so a
+    slow socket never stalls the LLM stream that produces frames for it.
+
+    Token frames are queued unencoded and rendered at write time, which lets
+    the coalesce policy fold tokens that are still waiting into one frame.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[Union[str, bytes]], Awaitable[None]],
+        encode_tokens: Callable[[Any, List[str], int], Union[str, bytes]],
+        on_slow_consumer: Optional[Callable[[], Awaitable[None]]] = None,
+        max_frames: int = DEFAULT_MAX_FRAMES,
+        policy: str = DEFAULT_POLICY,
+        max_lag_seconds: float = DEFAULT_MAX_LAG_SECONDS,
+        max_coalesced_bytes: int = DEFAULT_MAX_COALESCED_BYTES,
+    ):
+        self.write = write
+        self.encode_tokens = encode_tokens
+        self.on_slow_consumer = on_slow_consumer
+        self.max_frames = max_frames
+        self.policy = policy
+        self.max_lag_seconds = max_lag_seconds
+        self.max_coalesced_bytes = max_coalesced_bytes
+        # Entries are [kind, payload, enqueued_at, size of the tokens folded in so far]
+        self.entries = deque()
+        self.condition = asyncio.Condition()
+        self.writer_task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.writing = False
+        self.slow_consumer_task: Optional[asyncio.Task] = None
+
+        # Counters
+        self.max_depth = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.tokens_coalesced = 0
+        self.producer_waits = 0
+        self.last_send_seconds = 0.0
+
+    def start(self):
+        self.writer_task = asyncio.create_task(self._writer())
+
+    async def put(self, frame: Union[str, bytes]):
+        await self._enqueue([_FRAME, frame, time.monotonic(), 0])
+
+    async def put_token(self, stream_key: Any, token: str, seq: int):
+        if self.closed:
+            raise ConnectionError("Connection closed")
+        size = len(token.encode("utf-8"))
+        # Fold into the newest queued token frame for this stream while it is still waiting, up to the caps
+        if self.policy == COALESCE and self.entries:
+            tail = self.entries[-1]
+            if (tail[0] == _TOKENS and tail[1][0] == stream_key and tail[3] + size <= self.max_coalesced_bytes
+                    and time.monotonic() - tail[2] < self.max_lag_seconds):
+                tail[1][1].append(token)
+                tail[1][2] = seq
+                tail[3] += size
+                self.tokens_coalesced += 1
+                return
+        # Payload is [stream_key, tokens, seq of the last token]
+        await self._enqueue([_TOKENS, [stream_key, [token], seq], time.monotonic(), size])
+
+    async def _enqueue(self, entry: list):
+        async with self.condition:
+            if self.closed:
+                raise ConnectionError("Connection closed")
+            if len(self.entries) >= self.max_frames:
+                self.producer_waits += 1
+                await self._wait_for_space()
+            self.entries.append(entry)
+            self.max_depth = max(self.max_depth, len(self.entries))
+            self.condition.notify_all()
+
+    async def _wait_for_space(self):
+        predicate = lambda: self.closed or len(self.entries) < self.max_frames
+        if self.policy != DISCONNECT:
+            await self.condition.wait_for(predicate)
+        else:
+            timeout = max(self.max_lag_seconds - self.lag_seconds, 0)
+            try:
+                await asyncio.wait_for(self.condition.wait_for(predicate), timeout=timeout)
+            except asyncio.TimeoutError:
+                await self._drop_slow_consumer()
+        if self.closed:
+            raise ConnectionError("Connection closed")
+
+    async def _drop_slow_consumer(self):
+        self.closed = True
+        self.entries.clear()
+        self.condition.notify_all()
+        if self.on_slow_consumer:
+            self.slow_consumer_task = asyncio.create_task(self.on_slow_consumer())
+        raise SlowConsumerError(f"Send backlog exceeded {self.max_lag_seconds}s")
+
+    async def _writer(self):
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.entries or self.closed)
+                if not self.entries:
+                    return
+                kind, payload = self.entries.popleft()[:2]
+                self.writing = True
+                self.condition.notify_all()
+
+            frame = payload if kind == _FRAME else self.encode_tokens(*payload)
+            start = time.perf_counter()
+            try:
+                await self.write(frame)
+            except Exception as e:
+                Log.info("connection", "Error writing to websocket", error=e)
+                await self.close()
+                return
+            self.last_send_seconds = time.perf_counter() - start
+            self.frames_sent += 1
+            self.bytes_sent += len(frame)
+            Metrics.WS_SEND_DURATION.observe(self.last_send_seconds)
+            Metrics.WS_FRAMES_SENT.inc()
+            Metrics.WS_BYTES_SENT.inc(amount=len(frame))
+            self.writing = False
+            if not self.entries:
+                async with self.condition:
+                    self.condition.notify_all()  # For wait_empty
+
+    async def wait_empty(self, timeout: float) -> bool:
+        """Wait for the writer to send everything queued. False on timeout."""
+        try:
+            async with self.condition:
+                idle = lambda: (not self.entries and not self.writing) or self.closed
+                await asyncio.wait_for(self.condition.wait_for(idle), timeout=timeout)
+            return not self.entries and not self.writing
+        except asyncio.TimeoutError:
+            return False
+
+    @property
+    def depth(self) -> int:
+        return len(self.entries)
+
+    @property
+    def lag_seconds(self) -> float:
+        """Age of the oldest frame still waiting to be written."""
+        if not self.entries:
+            return 0.0
+        return time.monotonic() - self.entries[0][2]
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "lag_seconds": round(self.lag_seconds, 4),
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "tokens_coalesced": self.tokens_coalesced,
+            "producer_waits": self.producer_waits,
+            "last_send_ms": round(self.last_send_seconds * 1000, 3),
+        }
+
+    async def close(self):
+        task = self.slow_consumer_task
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+        async with self.condition:
+            self.closed = True
+            self.entries.clear()
+            self.condition.notify_all()
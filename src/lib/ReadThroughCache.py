@@ -0,0 +1,203 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+from lib import Metrics
+
+# Entries kept per cache; the least recently used are evicted beyond this
+MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "2000"))
+# How long "not found" is remembered, so lookups of a missing id don't all go to DynamoDB
+NEGATIVE_TTL_SECONDS = float(os.environ.get("CACHE_NEGATIVE_TTL_SECONDS", "10"))
+
+HIT = "hit"
+NEGATIVE_HIT = "negative_hit"
+MISS = "miss"
+# A miss that waited for another caller's load of the same key
+COALESCED = "coalesced"
+
+CACHE_REQUESTS = Metrics.Counter("cache_requests_total", "Read-through cache lookups by result", ["cache", "result"])
+CACHE_EVICTIONS = Metrics.Counter("cache_evictions_total", "Entries evicted to stay under the size bound", ["cache"])
+CACHE_INVALIDATIONS = Metrics.Counter("cache_invalidations_total", "Entries dropped because the row changed", ["cache"])
+
+CACHES: Dict[str, "ReadThroughCache"] = {}
+
+# The bus invalidate_everywhere tells the other workers on, and its loop (see broadcast_invalidations)
+_bus = None
+_bus_loop: Optional[asyncio.AbstractEventLoop] = None
+# Broadcasts in flight - referenced until done
+_broadcasts = set()
+
+
+class Entry:
+    __slots__ = ("value", "expires_at", "updated_at")
+
+    def __init__(self, value: Any, expires_at: float, updated_at: Optional[int]):
+        self.value = value
+        self.expires_at = expires_at
+        self.updated_at = updated_at
+
+
+class ReadThroughCache:
+    """
+    In-process cache in front of a read-mostly table (agents, tools, ...).
+
+    Values are the model objects a loader returns, or None for "not found",
+    which is cached for the shorter negative TTL. Concurrent async misses on
+    one key share a single load. Callers get their own copy of the model, so
+    mutating it never changes what other callers see.
+
+    Saves call invalidate_everywhere: this worker drops its entry directly,
+    and the others get invalidate(key, updated_at) over the bus. A worker
+    that misses the broadcast picks the change up within the TTL.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float, negative_ttl_seconds: float = NEGATIVE_TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Entry]" = OrderedDict()
+        # Sync lookups can come from worker threads; the async single-flight state is loop-only
+        self.lock = threading.Lock()
+        self.loading: Dict[str, asyncio.Future] = {}
+        for result in (HIT, NEGATIVE_HIT, MISS, COALESCED):
+            CACHE_REQUESTS.inc((name, result), 0)
+        CACHE_EVICTIONS.inc((name,), 0)
+        CACHE_INVALIDATIONS.inc((name,), 0)
+        CACHES[name] = self
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def _lookup(self, key: str) -> tuple[bool, Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            if entry.expires_at <= time.monotonic():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            # Sync lookups run on the DynamoDB pool; its threads hand metrics to the loop
+            Metrics.inc_threadsafe(CACHE_REQUESTS, (self.name, HIT if entry.value is not None else NEGATIVE_HIT))
+            return True, entry.value
+
+    def _store(self, key: str, value: Any):
+        ttl = self.ttl_seconds if value is not None else self.negative_ttl_seconds
+        with self.lock:
+            self.entries[key] = Entry(value, time.monotonic() + ttl, getattr(value, "updated_at", None))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                Metrics.inc_threadsafe(CACHE_EVICTIONS, (self.name,))
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return value.model_copy(deep=True) if value is not None else None
+
+    def get(self, key: str, load: Callable[[], Any]) -> Any:
+        """Cached value for key, calling load() on a miss. Returns None for "not found"."""
+        if not self.enabled:
+            return load()
+        found, value = self._lookup(key)
+        if not found:
+            Metrics.inc_threadsafe(CACHE_REQUESTS, (self.name, MISS))
+            value = load()
+            self._store(key, value)
+        return self._copy(value)
+
+    async def aget(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        """Async get; one load per key at a time, other callers wait for its result."""
+        if not self.enabled:
+            return await load()
+        found, value = self._lookup(key)
+        if found:
+            return self._copy(value)
+
+        future = self.loading.get(key)
+        if future is not None:
+            CACHE_REQUESTS.inc((self.name, COALESCED))
+            # Shielded: a cancelled waiter must not cancel the load the others wait on
+            return self._copy(await asyncio.shield(future))
+
+        CACHE_REQUESTS.inc((self.name, MISS))
+        future = self.loading[key] = asyncio.ensure_future(load())
+        try:
+            value = await asyncio.shield(future)
+            self._store(key, value)
+        finally:
+            if future.done():
+                self.loading.pop(key, None)
+            else:
+                # The caller was cancelled but the load carries on; clean up when it ends
+                future.add_done_callback(lambda done: self._loaded(key, done))
+        return self._copy(value)
+
+    def _loaded(self, key: str, future: asyncio.Future):
+        if self.loading.get(key) is future:
+            del self.loading[key]
+        if not future.cancelled() and future.exception() is None:
+            self._store(key, future.result())
+
+    def invalidate(self, key: str, updated_at: Optional[int] = None) -> bool:
+        """
+        Drop the cached entry for key. With updated_at, only drop it if the cached
+        row is older - the worker that made the change already has it. True if dropped.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False
+            if updated_at is not None and entry.updated_at is not None and entry.updated_at >= updated_at:
+                return False
+            del self.entries[key]
+            Metrics.inc_threadsafe(CACHE_INVALIDATIONS, (self.name,))
+            return True
+
+    def invalidate_everywhere(self, key: str, updated_at: Optional[int] = None):
+        """invalidate here, and on the other workers those with a copy older than updated_at."""
+        self.invalidate(key)
+        _broadcast(self.name, key, updated_at)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "negative_ttl_seconds": self.negative_ttl_seconds,
+            "max_entries": self.max_entries,
+            "entries": len(self.entries),
+            "loading": len(self.loading),
+        }
+
+
+def broadcast_invalidations(bus) -> None:
+    """Send invalidate_everywhere's invalidations to the other workers on bus. Call from the event loop."""
+    global _bus, _bus_loop
+    _bus, _bus_loop = bus, asyncio.get_running_loop()
+
+
+def _broadcast(cache_name: str, key: str, updated_at: Optional[int]):
+    if _bus is None:
+        return
+    payload = {"cache": cache_name, "id": key, "updated_at": updated_at}
+
+    def send():
+        task = asyncio.ensure_future(_bus.broadcast("cache_invalidate", payload))
+        _broadcasts.add(task)
+        task.add_done_callback(_broadcasts.discard)
+
+    # Saves are sync and may run on any thread
+    _bus_loop.call_soon_threadsafe(send)
+
+
+def invalidate(cache_name: str, key: str, updated_at: Optional[int] = None) -> bool:
+    cache = CACHES.get(cache_name)
+    if cache is None:
+        raise Exception(f"No cache named {cache_name}", 404)
+    return cache.invalidate(key, updated_at)
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, List, Optional, Tuple
+
+STREAM_REPLAY_MAX_FRAMES = int(os.environ.get("STREAM_REPLAY_MAX_FRAMES", "4096"))
+STREAM_REPLAY_TTL_SECONDS = float(os.environ.get("STREAM_REPLAY_TTL_SECONDS", "120"))
+
+# Frame kinds
+TOKEN = "token"
+STOP = "stop"
+EVENT = "event"
+
+
+class ResponseStream:
+    """
+    Sequence-numbered record of the frames streamed for one response_id.
+
+    The most recent frames are kept in a bounded ring buffer so a client that
+    lost its socket can resume_stream from the last seq it saw. `connection`
+    is where live frames are delivered (anything with a _deliver coroutine,
+    including a connection on another worker); resume_stream re-points it at
+    the new socket while the generation keeps running on the original task.
+    """
+
+    def __init__(self, response_id: str, context_id: Optional[str], connection, agent_chat=None):
+        self.response_id = response_id
+        self.context_id = context_id
+        self.connection = connection
+        self.agent_chat = agent_chat
+        # The handler task producing this stream - it persists the turn when done
+        self.task: Optional[asyncio.Task] = asyncio.current_task()
+        self.frames: deque = deque(maxlen=STREAM_REPLAY_MAX_FRAMES)
+        self.seq = 0
+        self.finished = False
+        self.last_activity = time.monotonic()
+
+    def record(self, kind: str, payload: Any) -> int:
+        self.seq += 1
+        self.frames.append((self.seq, kind, payload))
+        self.last_activity = time.monotonic()
+        if kind == STOP:
+            self.finished = True
+            # Only stop() needs it, and it holds the whole conversation for as long as the stream is kept
+            self.agent_chat = None
+        return self.seq
+
+    def can_replay_from(self, last_seq: int) -> bool:
+        """False if frames after last_seq have already fallen out of the ring buffer."""
+        if not self.frames:
+            return last_seq >= self.seq
+        return last_seq >= self.frames[0][0] - 1
+
+    def frames_after(self, last_seq: int) -> List[Tuple[int, str, Any]]:
+        if not self.frames or self.frames[-1][0] <= last_seq:
+            return []
+        return [frame for frame in self.frames if frame[0] > last_seq]
+
+    def check_resume(self, context_id: str, last_seq: int):
+        if self.context_id != context_id:
+            raise Exception("Stream not found or expired", 404)
+        if not self.can_replay_from(last_seq):
+            raise Exception("Missed frames are no longer buffered, reload the context", 410)
+
+    async def attach(self, connection, last_seq: int) -> int:
+        """
+        Replay the frames after last_seq to connection, then make it the live
+        destination. Returns the number of frames replayed.
+        """
+        replayed = 0
+        while True:
+            pending = self.frames_after(last_seq)
+            if not pending:
+                # No await between the check and the switch, so no frame can slip past
+                self.connection = connection
+                return replayed
+            for seq, kind, payload in pending:
+                await connection._deliver(self.response_id, seq, kind, payload)
+                last_seq = seq
+                replayed += 1
+
+    async def wait_finished(self):
+        """Wait for the producing handler - it persists the turn before returning."""
+        if self.task and not self.task.done() and self.task is not asyncio.current_task():
+            await asyncio.wait([self.task])
+
+    def stop(self):
+        if not self.finished and self.agent_chat:
+            self.agent_chat.stop_invocation()
+
+    def is_expired(self, now: float) -> bool:
+        producing = self.task is not None and not self.task.done()
+        return not producing and now - self.last_activity > STREAM_REPLAY_TTL_SECONDS
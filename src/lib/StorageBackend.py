@@ -0,0 +1,147 @@
+from typing import Dict, Optional, Tuple
+
+# Optimistic locking: versioned writes bump this attribute and require the value they read
+VERSION_ATTRIBUTE = "version"
+
+
+class ConditionFailed(Exception):
+    """
+    A conditional write found the item changed since it was read (code 409),
+    or gone (code 404). Raised like the models' errors: ConditionFailed(message, code).
+    """
+
+    @property
+    def code(self) -> int:
+        return self.args[1] if len(self.args) > 1 else 409
+
+
+class StorageBackend:
+    """
+    The table operations the Models use, by name. AWS/DynamoDB.py exposes them as
+    module functions (with async variants) and sends them to the backend picked by
+    STORAGE_BACKEND: DynamoDBStorage, or MemoryStorage to run without AWS.
+
+    Items are dicts. Tables have a partition key and optionally a sort key; keys
+    passed as a plain value are partition key values. Calls are blocking - async
+    callers run them on the DynamoDB module's thread pool - and may come from any
+    of its threads at once.
+    """
+
+    name = "abstract"
+
+    # The operations a backend implements - and that use_backend routes to it
+    OPERATIONS = (
+        "get_item",
+        "get_item_attributes",
+        "get_items_by_scan",
+        "batch_get_items",
+        "get_all_items",
+        "put_item",
+        "put_items",
+        "put_items_unless_newer",
+        "update_item",
+        "update_item_expression",
+        "save_changes",
+        "delete_item",
+        "delete_items",
+        "delete_items_unless_newer",
+        "get_all_items_by_key",
+        "get_all_items_by_index",
+        "get_items_by_index_range",
+        "get_latest_items_by_index",
+        "describe_table",
+    )
+
+    def describe_table(self, table_name: str, partition_key: str, sort_key: Optional[str] = None, indexes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None) -> None:
+        """
+        Declare a table's key schema and its global secondary indexes ({index name:
+        (partition key, sort key)}), for backends that don't keep one of their own.
+        """
+
+    def get_item(self, table_name: str, primary_key_name: str, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def get_item_attributes(self, table_name: str, primary_key_name: str, key: str, attributes: list[str]) -> Optional[dict]:
+        """get_item returning only the given attributes."""
+        raise NotImplementedError
+
+    def get_items_by_scan(self, table_name: str, primary_key_name: str, keys: list[str]) -> list[dict]:
+        raise NotImplementedError
+
+    def batch_get_items(self, table_name: str, primary_key_name: str, keys: list[str]) -> list[dict]:
+        """Items for keys, in key order, each once; missing keys are skipped."""
+        raise NotImplementedError
+
+    def get_all_items(self, table_name: str) -> list[dict]:
+        raise NotImplementedError
+
+    def put_item(self, table_name: str, item: dict) -> None:
+        raise NotImplementedError
+
+    def put_items(self, table_name: str, items: list[dict]) -> None:
+        raise NotImplementedError
+
+    def put_items_unless_newer(self, table_name: str, items: list[dict], version_attribute: str, version: int) -> None:
+        """
+        put_items, but not over an item whose version_attribute is above version (items
+        without one count as 0). Raises ConditionFailed if there is one; items before it
+        may have been written.
+        """
+        raise NotImplementedError
+
+    def update_item(self, table_name: str, primary_key_name: str, key: str, update_attributes: dict) -> dict:
+        """SET update_attributes on an existing item. Returns the whole item after the update."""
+        raise NotImplementedError
+
+    def update_item_expression(
+            self,
+            table_name: str,
+            primary_key_name: str,
+            key: str,
+            set_attributes: Optional[dict] = None,
+            append_attributes: Optional[dict] = None,
+            remove_attributes: Optional[list[str]] = None,
+            expected_version: Optional[int] = None,
+            must_exist: bool = True,
+            return_values: str = "NONE",
+        ) -> Optional[dict]:
+        """
+        Partial update: SET, list append and REMOVE in one atomic write. With
+        expected_version, only if the item is still at that version (0: has none),
+        storing expected_version + 1. Raises ConditionFailed.
+        """
+        raise NotImplementedError
+
+    def save_changes(self, table_name: str, primary_key_name: str, item: dict, stored: Optional[dict], append_attributes: Optional[dict] = None, actions: Optional[list[dict]] = None) -> dict:
+        """
+        Write item over stored (the item as read, None if never stored) if it is
+        still at stored's version, with the Put/Delete actions in the same atomic
+        write. Returns the item as now stored, with its version. Raises ConditionFailed.
+        """
+        raise NotImplementedError
+
+    def delete_item(self, table_name: str, primary_key_name: str, key: str) -> None:
+        raise NotImplementedError
+
+    def delete_items(self, table_name: str, keys: list[dict]) -> None:
+        """Delete by full key dicts (partition and sort key)."""
+        raise NotImplementedError
+
+    def delete_items_unless_newer(self, table_name: str, keys: list[dict], version_attribute: str, version: int) -> None:
+        """delete_items, except items whose version_attribute is above version, which are kept."""
+        raise NotImplementedError
+
+    def get_all_items_by_key(self, table_name: str, key_name: str, key_value: str) -> list[dict]:
+        """Every item with this partition key value, in sort key order."""
+        raise NotImplementedError
+
+    def get_all_items_by_index(self, table_name: str, index_key: str, key_value: str) -> list[dict]:
+        """Every item in the index named after index_key with this value."""
+        raise NotImplementedError
+
+    def get_items_by_index_range(self, table_name: str, index_name: str, partition_key: str, partition_value: str, sort_key: str, sort_min, sort_max) -> list[dict]:
+        raise NotImplementedError
+
+    def get_latest_items_by_index(self, table_name: str, index_name: str, index_key: str, index_value: str, limit: int) -> list[dict]:
+        """The first limit items for index_value, highest index sort key first."""
+        raise NotImplementedError
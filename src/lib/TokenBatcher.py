@@ -0,0 +1,100 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+from lib import Log
+
+DEFAULT_WINDOW_MS = 20
+DEFAULT_MAX_BYTES = 1024
+
+
+class TokenBatcher:
+    """
+    Coalesces streamed tokens per response_id into ordered batches.
+
+    A batch is flushed when the time window since its first token elapses,
+    when its buffered size reaches max_bytes, or explicitly at end-of-stream.
+    Flushes are serialized so batches for a response always go out in order.
+    """
+
+    def __init__(
+        self,
+        flush_callback: Callable[[str, List[str], int], Awaitable[None]],
+        window_ms: int = DEFAULT_WINDOW_MS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.flush_callback = flush_callback
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self.buffers: Dict[str, List[str]] = {}
+        self.sizes: Dict[str, int] = {}
+        # seq of the newest buffered token per response
+        self.seqs: Dict[str, int] = {}
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        self.flush_tasks = set()
+        self.lock = asyncio.Lock()
+
+    @staticmethod
+    def from_options(
+        flush_callback: Callable[[str, List[str], int], Awaitable[None]],
+        options,
+    ) -> Optional["TokenBatcher"]:
+        """Build a batcher from the client's connect_to_context options (True or a dict)."""
+        if not options:
+            return None
+        options = options if isinstance(options, dict) else {}
+        window_ms = min(max(int(options.get("window_ms", DEFAULT_WINDOW_MS)), 1), 100)
+        max_bytes = min(max(int(options.get("max_bytes", DEFAULT_MAX_BYTES)), 64), 65536)
+        return TokenBatcher(flush_callback, window_ms=window_ms, max_bytes=max_bytes)
+
+    def options(self) -> dict:
+        return {"window_ms": int(self.window * 1000), "max_bytes": self.max_bytes}
+
+    async def add(self, response_id: str, token: str, seq: int):
+        buffer = self.buffers.get(response_id)
+        if buffer is None:
+            buffer = self.buffers[response_id] = []
+            self.sizes[response_id] = 0
+        buffer.append(token)
+        # UTF-8 bytes, as sent - non-ASCII tokens are several bytes per character
+        self.sizes[response_id] += len(token.encode("utf-8"))
+        self.seqs[response_id] = seq
+
+        if self.sizes[response_id] >= self.max_bytes:
+            await self.flush(response_id)
+        elif response_id not in self.timers:
+            self.timers[response_id] = asyncio.get_running_loop().call_later(
+                self.window, self._flush_on_timer, response_id
+            )
+
+    def _flush_on_timer(self, response_id: str):
+        self.timers.pop(response_id, None)
+        task = asyncio.create_task(self.flush(response_id))
+        self.flush_tasks.add(task)
+        task.add_done_callback(self._on_flush_done)
+
+    def _on_flush_done(self, task: asyncio.Task):
+        self.flush_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            Log.error("connection", "Error flushing token batch", error=task.exception())
+
+    async def flush(self, response_id: str):
+        async with self.lock:
+            timer = self.timers.pop(response_id, None)
+            if timer:
+                timer.cancel()
+            tokens = self.buffers.pop(response_id, None)
+            self.sizes.pop(response_id, None)
+            seq = self.seqs.pop(response_id, None)
+            if tokens:
+                await self.flush_callback(response_id, tokens, seq)
+
+    async def flush_all(self):
+        for response_id in list(self.buffers.keys()):
+            await self.flush(response_id)
+
+    def close(self):
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        self.buffers.clear()
+        self.sizes.clear()
+        self.seqs.clear()
@@ -0,0 +1,5 @@
+from lib.MessageBus import MessageBus, create_bus
+
+
+# This worker's end of the bus - backend picked by MESSAGE_BUS
+BUS: MessageBus = create_bus()
@@ -0,0 +1,4 @@
+from lib.Drainer import Drainer
+
+
+DRAINER = Drainer()
@@ -0,0 +1,4 @@
+from lib.ContextPersister import ContextPersister
+
+
+PERSISTER = ContextPersister()
@@ -0,0 +1,4 @@
+from lib.ConnectionReaper import ConnectionReaper
+
+
+REAPER = ConnectionReaper()
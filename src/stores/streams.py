@@ -0,0 +1,13 @@
+import time
+from lib.ResponseStream import ResponseStream
+
+
+STREAMS: dict[str, ResponseStream] = {}
+
+
+def evict_expired_streams() -> int:
+    now = time.monotonic()
+    expired = [response_id for response_id, stream in STREAMS.items() if stream.is_expired(now)]
+    for response_id in expired:
+        STREAMS.pop(response_id, None)
+    return len(expired)
@@ -0,0 +1,4 @@
+from lib.LoopWatchdog import LoopWatchdog
+
+
+WATCHDOG = LoopWatchdog()
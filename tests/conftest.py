@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# Enough configuration to import the Models, with tables kept in process (lib/MemoryStorage.py)
+TABLES = {
+    "AGENTS": "agent_id",
+    "API_KEYS": "api_key_id",
+    "CHAT_PAGES": "chat_page_id",
+    "CONTEXTS": "context_id",
+    "DATA_WINDOWS": "data_window_id",
+    "INTEGRATIONS": "integration_id",
+    "JOBS": "job_id",
+    "JSON_DOCUMENTS": "document_id",
+    "ORGANIZATIONS": "organization_id",
+    "PARAMETER_DEFINITIONS": "pd_id",
+    "SRE": "sre_id",
+    "TOOLS": "tool_id",
+    "USERS": "user_id",
+}
+ENVIRONMENT = {
+    "STORAGE_BACKEND": "memory",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "LOG_LEVEL": "WARNING",
+    "MODELS_TABLE_NAME": "test-models",
+    "TOKEN_TRACKING_TABLE_NAME": "test-token-tracking",
+    "EXECUTION_LAMBDA_NAME": "test",
+    "JWT_SECRET": "test",
+    "RESET_KEY": "test",
+    "OPENAI_API_KEY": "test",
+    "USER_POOL_ID": "test",
+    "GOOGLE_CLIENT_ID": "test",
+    "GOOGLE_CLIENT_SECRET": "test",
+    "JIRA_CLIENT_ID": "test",
+    "JIRA_CLIENT_SECRET": "test",
+    "OUTLOOK_CLIENT_ID": "test",
+    "OUTLOOK_CLIENT_SECRET": "test",
+}
+for table, primary_key in TABLES.items():
+    ENVIRONMENT[f"{table}_TABLE_NAME"] = f"test-{table.lower().replace('_', '-')}"
+    ENVIRONMENT[f"{table}_PRIMARY_KEY"] = primary_key
+for name, value in ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,21 @@
+import asyncio
+import pytest
+from handlers import connect_to_context as handler
+from stores.connections import CONNECTIONS
+
+
+def test_auth_failure_wins_over_an_unknown_context(monkeypatch):
+    async def authenticate(access_token):
+        await asyncio.sleep(0.05)
+        raise Exception("Invalid access token", 401)
+
+    async def load_context(context_id):
+        raise Exception(f"Context with id: {context_id} does not exist", 404)
+
+    monkeypatch.setattr(handler, "authenticate", authenticate)
+    monkeypatch.setattr(handler, "load_context", load_context)
+    monkeypatch.setitem(CONNECTIONS, "probe", object())
+
+    with pytest.raises(Exception) as error:
+        asyncio.run(handler.connect_to_context("probe", "missing-context", access_token="bad"))
+    assert error.value.args == ("Invalid access token", 401)
@@ -0,0 +1,47 @@
+import asyncio
+from langchain_core.messages import AIMessage, HumanMessage
+from LLM.BaseMessagesConverter import base_messages_to_dict_messages
+from lib.Connection import Connection
+from Models import Context
+
+
+class FakeWebSocket:
+    async def send_text(self, text):
+        pass
+
+
+class FakeAgentChat:
+    def __init__(self, messages):
+        self.messages = messages
+        self.is_generating = False
+
+
+def test_dehydrate_drops_the_stored_history():
+    async def scenario():
+        agent_messages = [HumanMessage(content="hi"), AIMessage(content="lorem ipsum " * 1000)]
+        messages = base_messages_to_dict_messages(agent_messages)
+        item = {
+            "context_id": "dehydrate-test", "agent_id": "agent", "user_id": "public",
+            "messages": messages, "created_at": 1, "updated_at": 1, "version": 3,
+        }
+        connection = Connection(FakeWebSocket())
+        connection.context = Context.context_from_item(item, messages)
+        connection.agent_chat = FakeAgentChat(agent_messages)
+        connection.mark_messages_synced()
+        connection.memory()
+
+        async def rehydrate():
+            pass
+        connection.rehydrate = rehydrate
+
+        assert await connection.dehydrate() > 0
+        return connection
+
+    connection = asyncio.run(scenario())
+    assert connection.dehydrated
+    assert connection.context.context_id == "dehydrate-test"
+    assert connection.context.messages == []
+    assert connection.context._stored_item is None
+    assert connection.context._stored_messages is None
+    assert connection.synced_messages is None
+    assert connection.tools_size == (None, 0)
@@ -0,0 +1,31 @@
+import asyncio
+import time
+from lib import ResponseStream
+from lib.ConnectionReaper import ConnectionReaper
+from stores.streams import STREAMS
+
+
+class FakeAgentChat:
+    def stop_invocation(self):
+        pass
+
+
+def test_sweep_drops_finished_streams_past_their_ttl():
+    async def scenario():
+        finished = ResponseStream.ResponseStream("finished", "context", connection=None, agent_chat=FakeAgentChat())
+        recent = ResponseStream.ResponseStream("recent", "context", connection=None)
+        finished.task = recent.task = None
+        finished.record(ResponseStream.STOP, None)
+        finished.last_activity = time.monotonic() - ResponseStream.STREAM_REPLAY_TTL_SECONDS - 1
+        STREAMS.update(finished=finished, recent=recent)
+        try:
+            report = await ConnectionReaper(memory_cap_bytes=0).sweep()
+            return finished, report, set(STREAMS)
+        finally:
+            STREAMS.pop("finished", None)
+            STREAMS.pop("recent", None)
+
+    finished, report, remaining = asyncio.run(scenario())
+    assert finished.agent_chat is None
+    assert report["streams_evicted"] == 1
+    assert remaining == {"recent"}
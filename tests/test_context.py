@@ -0,0 +1,73 @@
+import pytest
+from AWS.DynamoDB import ConditionFailed, get_all_items_by_key, put_items
+from Models import Agent, Context
+
+MESSAGES_TABLE_NAME = "test-context-messages"
+
+
+@pytest.fixture(autouse=True)
+def messages_table(monkeypatch):
+    monkeypatch.setattr(Context, "CONTEXT_MESSAGES_TABLE_NAME", MESSAGES_TABLE_NAME)
+    Context.describe_table(MESSAGES_TABLE_NAME, Context.MESSAGES_PARTITION_KEY, Context.MESSAGES_SORT_KEY)
+
+
+def human(content):
+    return {"type": "human", "content": content}
+
+
+def stored_context(context_id, count):
+    context = Context.Context(
+        context_id=context_id, agent_id="agent", user_id="user-" + context_id,
+        messages=[human(f"m{seq}") for seq in range(count)], created_at=1, updated_at=1,
+    )
+    Context.save_context(context)
+    return context
+
+
+def test_long_write_that_loses_keeps_the_winners_messages():
+    stale = stored_context("lost-race", 3)
+    winner = Context.get_context("lost-race")
+    winner.messages.append(human("winner"))
+    Context.save_context_once(winner)
+
+    stale.messages.extend(human(f"stale{seq}") for seq in range(Context.TRANSACT_MAX_ITEMS + 10))
+    with pytest.raises(ConditionFailed):
+        Context.save_context_once(stale)
+
+    assert Context.get_context("lost-race").messages == [human("m0"), human("m1"), human("m2"), human("winner")]
+
+
+def test_long_write_overwrites_leftovers_of_an_interrupted_one():
+    context = stored_context("leftovers", 2)
+    # Written by a save at this same version that never got to its header
+    put_items(MESSAGES_TABLE_NAME, [
+        {"context_id": "leftovers", "seq": seq, "message": human("lost"), Context.WRITTEN_VERSION_ATTRIBUTE: context.version + 1}
+        for seq in range(2, 5)
+    ])
+
+    added = [human(f"new{seq}") for seq in range(Context.TRANSACT_MAX_ITEMS + 10)]
+    context.messages.extend(added)
+    Context.save_context(context)
+
+    assert Context.get_context("leftovers").messages == [human("m0"), human("m1")] + added
+
+
+def test_long_shrink_keeps_messages_a_newer_save_added():
+    context = stored_context("shrink", Context.TRANSACT_MAX_ITEMS + 10)
+    context.messages = context.messages[:2]
+    Context.save_context(context)
+
+    assert Context.get_context("shrink").messages == [human("m0"), human("m1")]
+    assert [item["seq"] for item in get_all_items_by_key(MESSAGES_TABLE_NAME, "context_id", "shrink")] == [0, 1]
+
+
+def test_history_lists_the_last_message_of_header_contexts():
+    stored_context("history", 3)
+    [listed] = Context.get_contexts_by_user_id("user-history")
+
+    agent = Agent.Agent(
+        agent_id="agent", agent_name="Agent", agent_description="", prompt="", org_id="org",
+        is_public=True, is_default_agent=False, created_at=1, updated_at=1,
+    )
+    assert listed.messages == []
+    assert Context.transform_to_history_context(listed, agent).last_message == "m2"
@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+from lib import ContextPersister
+from Models import Context
+
+
+def stored_context(context_id):
+    context = Context.Context(context_id=context_id, agent_id="agent", user_id="user", messages=[], created_at=1, updated_at=1)
+    Context.save_context(context)
+    return context
+
+
+def human(content):
+    return {"type": "human", "content": content}
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    """Records every save; a save fails while the context_id is in saves.failing, and waits while saves.gate is set."""
+    asave_context = Context.asave_context
+
+    class Saves(list):
+        failing = set()
+        gate = None
+
+        async def save(self, context):
+            self.append((context.context_id, len(context.messages)))
+            if self.gate is not None:
+                await self.gate.wait()
+            if context.context_id in self.failing:
+                raise Exception("Throttled")
+            await asave_context(context)
+
+    recorded = Saves()
+    monkeypatch.setattr(Context, "asave_context", recorded.save)
+    monkeypatch.setattr(ContextPersister, "RETRY_SECONDS", 0.01)
+    return recorded
+
+
+def test_changes_before_the_save_coalesce_into_one(saves):
+    context = stored_context("coalesce")
+
+    async def scenario():
+        persister = ContextPersister.ContextPersister(delay_seconds=0.01)
+        context.messages.append(human("one"))
+        persister.mark_dirty(context)
+        context.messages.append(human("two"))
+        persister.mark_dirty(context)
+        await asyncio.sleep(0.05)
+        return persister
+
+    persister = asyncio.run(scenario())
+    assert saves == [("coalesce", 2)]
+    assert Context.get_context("coalesce").messages == [human("one"), human("two")]
+    assert not persister.pending
+
+
+def test_a_failed_save_stays_dirty_and_is_retried(saves):
+    context = stored_context("retry")
+    saves.failing.add("retry")
+
+    async def scenario():
+        persister = ContextPersister.ContextPersister(delay_seconds=0.01)
+        context.messages.append(human("one"))
+        persister.mark_dirty(context)
+        await asyncio.sleep(0.02)
+        assert persister.dirty_count == 1
+        saves.failing.clear()
+        await asyncio.sleep(0.1)
+        return persister
+
+    persister = asyncio.run(scenario())
+    assert len(saves) >= 2
+    assert Context.get_context("retry").messages == [human("one")]
+    assert not persister.pending
+
+
+def test_flush_waits_for_the_save_in_flight(saves):
+    context = stored_context("in-flight")
+
+    async def scenario():
+        persister = ContextPersister.ContextPersister(delay_seconds=0)
+        saves.gate = asyncio.Event()
+        context.messages.append(human("one"))
+        persister.mark_dirty(context)
+        await asyncio.sleep(0.01)  # The timer's save is now waiting on the gate
+        context.messages.append(human("two"))
+        persister.mark_dirty(context)
+        flush = asyncio.create_task(persister.flush("in-flight"))
+        await asyncio.sleep(0.01)
+        assert not flush.done()
+        saves.gate.set()
+        assert await flush
+        return persister
+
+    asyncio.run(scenario())
+    # The second save starts after the first and writes the later state
+    assert saves == [("in-flight", 1), ("in-flight", 2)]
+    assert Context.get_context("in-flight").messages == [human("one"), human("two")]
+
+
+def test_close_saves_every_dirty_context(saves):
+    contexts = [stored_context(f"shutdown-{i}") for i in range(3)]
+
+    async def scenario():
+        persister = ContextPersister.ContextPersister(delay_seconds=60)
+        for context in contexts:
+            context.messages.append(human(context.context_id))
+            persister.mark_dirty(context)
+        report = await persister.close()
+        return persister, report
+
+    persister, report = asyncio.run(scenario())
+    assert sorted(report["saved"]) == [context.context_id for context in contexts]
+    assert not persister.pending
+    for context in contexts:
+        assert Context.get_context(context.context_id).messages == [human(context.context_id)]
+
+
+def test_close_reports_and_keeps_what_it_could_not_save(saves):
+    context = stored_context("unsaved")
+    saves.failing.add("unsaved")
+
+    async def scenario():
+        persister = ContextPersister.ContextPersister(delay_seconds=60)
+        context.messages.append(human("one"))
+        persister.mark_dirty(context)
+        report = await persister.close()
+        return persister, report
+
+    persister, report = asyncio.run(scenario())
+    assert report["errors"] == [{"context_id": "unsaved", "error": "Throttled"}]
+    assert persister.pending["unsaved"].dirty
+    assert persister.pending["unsaved"].timer is None
@@ -0,0 +1,56 @@
+import asyncio
+from lib.Dispatcher import Dispatcher, SERIAL, SUPERSEDE
+
+
+def test_supersede_aborts_only_the_running_generation():
+    async def scenario():
+        generating = asyncio.Event()
+        stop = asyncio.Event()
+        ran = []
+
+        async def generation():
+            generating.set()
+            await stop.wait()
+            ran.append("generation")
+
+        async def queued_message():
+            ran.append("queued add_message")
+
+        async def set_last_messages():
+            ran.append("set_last_messages")
+
+        dispatcher = Dispatcher(on_supersede=stop.set, is_generating=generating.is_set)
+        running = asyncio.create_task(dispatcher.run(SERIAL, generation))
+        await generating.wait()
+        queued = asyncio.create_task(dispatcher.run(SERIAL, queued_message))
+        await asyncio.sleep(0)
+        await dispatcher.run(SUPERSEDE, set_last_messages)
+        await asyncio.gather(running, queued)
+        return ran
+
+    assert asyncio.run(scenario()) == ["generation", "queued add_message", "set_last_messages"]
+
+
+def test_supersede_waits_behind_work_that_is_not_generating():
+    async def scenario():
+        started = asyncio.Event()
+        finish = asyncio.Event()
+        aborted = []
+
+        async def connect_to_context():
+            started.set()
+            await finish.wait()
+            return "connected"
+
+        async def set_last_messages():
+            return "set"
+
+        dispatcher = Dispatcher(on_supersede=lambda: aborted.append(True), is_generating=lambda: False)
+        connecting = asyncio.create_task(dispatcher.run(SERIAL, connect_to_context))
+        await started.wait()
+        superseding = asyncio.create_task(dispatcher.run(SUPERSEDE, set_last_messages))
+        await asyncio.sleep(0.6)
+        finish.set()
+        return await connecting, await superseding, aborted
+
+    assert asyncio.run(scenario()) == ("connected", "set", [])
@@ -0,0 +1,65 @@
+import threading
+import pytest
+from AWS import DynamoDB
+
+# The boto3 implementation - the module's own names route to the memory backend in tests
+batch_get_items = DynamoDB.DynamoDBStorage.batch_get_items
+
+
+class FakeResource:
+    """BatchGetItem that reads at most per_call keys per call, in reverse, and returns the rest as UnprocessedKeys."""
+
+    def __init__(self, table_name, existing, per_call):
+        self.table_name = table_name
+        self.existing = existing
+        self.per_call = per_call
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def batch_get_item(self, RequestItems, ReturnConsumedCapacity):
+        keys = RequestItems[self.table_name]["Keys"]
+        with self.lock:
+            self.requests.append([key["id"] for key in keys])
+        processed, unprocessed = keys[:self.per_call], keys[self.per_call:]
+        response = {"Responses": {self.table_name: [{"id": key["id"]} for key in reversed(processed) if key["id"] in self.existing]}}
+        if unprocessed:
+            response["UnprocessedKeys"] = {self.table_name: {"Keys": unprocessed}}
+        return response
+
+
+@pytest.fixture
+def resource(monkeypatch):
+    def install(existing, per_call):
+        fake = FakeResource("items", existing, per_call)
+        monkeypatch.setattr(DynamoDB, "_get_resource", lambda: fake)
+        return fake
+    monkeypatch.setattr(DynamoDB, "BATCH_GET_BACKOFF_SECONDS", 0)
+    return install
+
+
+def test_unprocessed_keys_are_retried_and_items_come_back_in_key_order(resource):
+    keys = [f"k{i}" for i in range(250)]
+    fake = resource(existing=set(keys) - {"k7"}, per_call=40)
+
+    items = batch_get_items("items", "id", list(reversed(keys)) + ["k3", "k3"])
+
+    assert [item["id"] for item in items] == [key for key in reversed(keys) if key != "k7"]
+    # Chunks of at most 100 distinct keys, each retried until read
+    assert all(len(request) <= DynamoDB.BATCH_GET_MAX_KEYS for request in fake.requests)
+    assert sorted(key for request in fake.requests for key in request[:40]) == sorted(keys)
+
+
+def test_keys_still_unprocessed_after_the_last_attempt_raise_503(resource, monkeypatch):
+    monkeypatch.setattr(DynamoDB, "BATCH_GET_MAX_ATTEMPTS", 3)
+    fake = resource(existing={"a", "b", "c", "d", "e"}, per_call=1)
+
+    with pytest.raises(Exception) as error:
+        batch_get_items("items", "id", ["a", "b", "c", "d", "e"])
+
+    assert error.value.args[1] == 503
+    assert len(fake.requests) == 3
+
+
+def test_duplicates_are_read_once():
+    assert DynamoDB._batch_get_chunks(["a", "b", "a"]) == [["a", "b"]]
+    assert [len(chunk) for chunk in DynamoDB._batch_get_chunks([str(i) for i in range(201)])] == [100, 100, 1]
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from lib.JSONRPCPeer import JSONRPCPeer
+
+
+def peer_with_handlers():
+    sent = []
+    generation_done = asyncio.Event()
+    calls = []
+
+    async def sender(message):
+        sent.append(json.loads(message))
+
+    async def stop_invocation(connection_id):
+        calls.append("stop_invocation")
+        return {"stopped": True}
+
+    async def set_last_messages(connection_id, messages):
+        calls.append("set_last_messages")
+        await generation_done.wait()
+        return {"messages": len(messages)}
+
+    async def ping(connection_id):
+        calls.append("ping")
+
+    peer = JSONRPCPeer(sender)
+    peer.on("stop_invocation", stop_invocation)
+    peer.on("set_last_messages", set_last_messages, streaming=True)
+    peer.on("ping", ping)
+    return peer, sent, calls, generation_done
+
+
+def test_a_mixed_batch_answers_without_waiting_for_the_generation():
+    async def scenario():
+        peer, sent, calls, generation_done = peer_with_handlers()
+        batch = json.dumps([
+            {"method": "stop_invocation", "params": {"connection_id": "c"}, "id": "1"},
+            {"method": "set_last_messages", "params": {"connection_id": "c", "messages": [{}, {}]}, "id": "2"},
+            {"method": "ping", "params": {"connection_id": "c"}},
+        ])
+        handling = asyncio.create_task(peer.handle_message(batch))
+        await asyncio.sleep(0.01)
+        before_generation = list(sent)
+        generation_done.set()
+        await handling
+        return calls, before_generation, sent
+
+    calls, before_generation, sent = asyncio.run(scenario())
+    assert calls == ["stop_invocation", "set_last_messages", "ping"]
+    assert before_generation == [[{"id": "1", "result": {"stopped": True}}]]
+    assert sent == before_generation + [{"id": "2", "result": {"messages": 2}}]
+
+
+def test_an_empty_batch_gets_no_reply():
+    async def scenario():
+        peer, sent, calls, _ = peer_with_handlers()
+        await peer.handle_message("[]")
+        return sent, calls
+
+    assert asyncio.run(scenario()) == ([], [])
+
+
+def test_a_batch_of_notifications_gets_no_reply():
+    async def scenario():
+        peer, sent, calls, _ = peer_with_handlers()
+        await peer.handle_message(json.dumps([
+            {"method": "ping", "params": {"connection_id": "c"}},
+            {"method": "stop_invocation", "params": {"connection_id": "c"}, "id": None},
+        ]))
+        return sent, calls
+
+    assert asyncio.run(scenario()) == ([], ["ping", "stop_invocation"])
@@ -0,0 +1,47 @@
+import json
+from lib import MessageCompression
+from lib.MessageCompression import decode_message, decode_messages, encode_message
+
+
+def large_message():
+    return {"type": "tool", "content": "the meeting invoice schedule " * 500, "tool_call_id": "call_1"}
+
+
+def test_messages_under_the_threshold_stay_plain():
+    message = {"type": "human", "content": "hi"}
+    assert encode_message(message, "zlib", threshold=1024) is message
+
+
+def test_large_messages_round_trip_through_zlib():
+    message = large_message()
+    stored = encode_message(message, "zlib", threshold=1024)
+
+    assert isinstance(stored, bytes)
+    assert stored[0] == MessageCompression.FORMAT_ZLIB
+    assert len(stored) < len(json.dumps(message))
+    assert decode_message(stored) == message
+
+
+def test_compression_is_only_kept_if_it_is_smaller():
+    # Over the threshold, but zlib's header and checksum outweigh anything it saves
+    message = {"type": "ai", "content": "ok"}
+    assert encode_message(message, "zlib", threshold=1) is message
+
+
+def test_none_writes_plain_maps():
+    message = large_message()
+    assert encode_message(message, "none", threshold=0) is message
+
+
+def test_plain_maps_read_back_unchanged():
+    # Items written before compression, or with it off
+    messages = [{"type": "human", "content": "hi", "additional_kwargs": {}}, large_message()]
+    assert decode_messages(messages) == messages
+    assert decode_message(messages[0]) is messages[0]
+
+
+def test_mixed_stored_lists_decode():
+    messages = [{"type": "human", "content": "hi"}, large_message()]
+    stored = [encode_message(message, "zlib", threshold=1024) for message in messages]
+    assert isinstance(stored[0], dict) and isinstance(stored[1], bytes)
+    assert decode_messages(stored) == messages
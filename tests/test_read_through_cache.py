@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from AWS.DynamoDB import run_in_pool
+from lib import ReadThroughCache
+
+
+def test_lookups_on_the_pool_count_on_the_loop_thread(monkeypatch):
+    cache = ReadThroughCache.ReadThroughCache("pool-test", ttl_seconds=60)
+    threads = []
+    monkeypatch.setattr(ReadThroughCache.CACHE_REQUESTS, "inc", lambda labels, amount=1: threads.append(threading.get_ident()))
+
+    async def scenario():
+        await run_in_pool(cache.get, "key", lambda: None)
+        await run_in_pool(cache.get, "key", lambda: None)
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert threads == [threading.get_ident()] * 2
+
+
+class Row:
+    def __init__(self, value, updated_at=1):
+        self.value = value
+        self.updated_at = updated_at
+
+    def model_copy(self, deep=False):
+        return Row(self.value, self.updated_at)
+
+
+def counting_loader(values):
+    loads = []
+
+    def load(key):
+        loads.append(key)
+        return values.get(key)
+    return loads, load
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ReadThroughCache.time, "monotonic", lambda: now[0])
+    cache = ReadThroughCache.ReadThroughCache("ttl-test", ttl_seconds=60)
+    loads, load = counting_loader({"a": Row("v1")})
+
+    assert cache.get("a", lambda: load("a")).value == "v1"
+    now[0] += 59
+    cache.get("a", lambda: load("a"))
+    assert loads == ["a"]
+    now[0] += 2
+    cache.get("a", lambda: load("a"))
+    assert loads == ["a", "a"]
+
+
+def test_not_found_is_cached_for_the_negative_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ReadThroughCache.time, "monotonic", lambda: now[0])
+    cache = ReadThroughCache.ReadThroughCache("negative-test", ttl_seconds=60, negative_ttl_seconds=5)
+    loads, load = counting_loader({})
+
+    assert cache.get("missing", lambda: load("missing")) is None
+    assert cache.get("missing", lambda: load("missing")) is None
+    assert loads == ["missing"]
+    now[0] += 6
+    cache.get("missing", lambda: load("missing"))
+    assert loads == ["missing", "missing"]
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ReadThroughCache.ReadThroughCache("lru-test", ttl_seconds=60, max_entries=2)
+    loads, load = counting_loader({key: Row(key) for key in "abc"})
+
+    cache.get("a", lambda: load("a"))
+    cache.get("b", lambda: load("b"))
+    cache.get("a", lambda: load("a"))  # a is now more recent than b
+    cache.get("c", lambda: load("c"))
+    assert list(cache.entries) == ["a", "c"]
+    cache.get("b", lambda: load("b"))
+    assert loads == ["a", "b", "c", "b"]
+
+
+def test_concurrent_misses_share_one_load_and_get_their_own_copy():
+    cache = ReadThroughCache.ReadThroughCache("single-flight-test", ttl_seconds=60)
+    loads = []
+
+    async def load():
+        loads.append("a")
+        await asyncio.sleep(0.01)
+        return Row("v1")
+
+    async def scenario():
+        return await asyncio.gather(*[cache.aget("a", load) for _ in range(5)])
+
+    values = asyncio.run(scenario())
+    assert loads == ["a"]
+    assert [value.value for value in values] == ["v1"] * 5
+    assert len({id(value) for value in values}) == 5
+    assert not cache.loading
+
+
+def test_invalidate_everywhere_tells_the_other_workers(monkeypatch):
+    cache = ReadThroughCache.ReadThroughCache("broadcast-test", ttl_seconds=60)
+    sent = []
+
+    class Bus:
+        async def broadcast(self, topic, payload):
+            sent.append((topic, payload))
+            return []
+
+    async def scenario():
+        ReadThroughCache.broadcast_invalidations(Bus())
+        cache.get("a", lambda: Row("v1"))
+        # Saves are sync, and may run off the loop
+        await asyncio.to_thread(cache.invalidate_everywhere, "a", 5)
+        await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(ReadThroughCache, "_bus", None)
+    monkeypatch.setattr(ReadThroughCache, "_bus_loop", None)
+    asyncio.run(scenario())
+    assert "a" not in cache.entries
+    assert sent == [("cache_invalidate", {"cache": "broadcast-test", "id": "a", "updated_at": 5})]
@@ -0,0 +1,28 @@
+import asyncio
+from types import SimpleNamespace
+from Models import TokenTracking
+
+
+def test_background_writes_are_flushed_and_failures_logged(monkeypatch):
+    written, errors = [], []
+
+    def create_token_tracking(org_id, model, input_tokens, output_tokens):
+        if org_id == "failing-org":
+            raise Exception("Throttled")
+        written.append(org_id)
+
+    monkeypatch.setattr(TokenTracking, "create_token_tracking", create_token_tracking)
+    monkeypatch.setattr(TokenTracking.logger, "error", errors.append)
+    response = SimpleNamespace(usage_metadata={"input_tokens": 10, "output_tokens": 5}, response_metadata={})
+
+    async def scenario():
+        TokenTracking.build_tracking_callback("org", "model")(response)
+        TokenTracking.build_tracking_callback("failing-org", "model")(response)
+        flushed = await TokenTracking.flush_pending_writes()
+        await asyncio.sleep(0)  # Done callbacks run on the next loop iteration
+        return flushed
+
+    assert asyncio.run(scenario()) == 2
+    assert written == ["org"]
+    assert len(errors) == 1 and "failing-org" in errors[0] and "Throttled" in errors[0]
+    assert not TokenTracking._pending_writes